@@ -0,0 +1,84 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+"""
+bench_envelope.py
+
+Times zooms into series of growing length through their :mod:`envelope`
+pyramids, memory mapped from a :mod:`seriescache`, against downsampling
+the same range of the series with :func:`decimate.downsample`.  Zoom
+times should stay flat as the series grow.
+
+Run with::
+
+    python -m tardis.apps.hrmc_views.benchmarks.bench_envelope \
+        --width 1200
+
+"""
+import argparse
+import shutil
+import tempfile
+
+import numpy
+
+from tardis.apps.hrmc_views.benchmarks.bench_seriescache import best
+from tardis.apps.hrmc_views.decimate import downsample
+from tardis.apps.hrmc_views.envelope import KIND, build_envelope, zoom
+from tardis.apps.hrmc_views.seriescache import SeriesCache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--width", type=int, default=1200,
+                        help="pixel width of each zoom")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs per case, the best is reported")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        cache = SeriesCache(tmpdir)
+        rng = numpy.random.RandomState(0)
+        print("%10s %10s %12s %12s %12s" % (
+            "points", "build ms", "zoom all ms", "zoom 10% ms", "minmax ms"))
+        for n in (10 ** 5, 10 ** 6, 10 ** 7):
+            checksum = "%0128x" % n
+            r = numpy.linspace(0, 50, n)
+            g = numpy.cumsum(rng.normal(size=n))
+            cache.put(checksum, numpy.array([r, g]))
+            build = best(lambda: build_envelope(g), 1)
+            cache.put(checksum, build_envelope(g), KIND)
+            r, g = cache.get(checksum)
+            env = cache.get(checksum, KIND)
+            full = best(lambda: zoom(r, g, env, 0, 50, args.width),
+                        args.repeat)
+            part = best(lambda: zoom(r, g, env, 20, 25, args.width),
+                        args.repeat)
+            lo, hi = numpy.searchsorted(r, [20, 25])
+            plain = best(lambda: downsample(r[lo:hi], g[lo:hi],
+                                            2 * args.width, "minmax"),
+                         args.repeat)
+            print("%10d %10.1f %12.3f %12.3f %12.3f" % (
+                n, build * 1000, full * 1000, part * 1000, plain * 1000))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+bench_grdata.py
+
+Compares the time and peak memory of :func:`grdata.load_series` against
+the character-by-character loop views.py used to parse HRMC data files.
+
+Run with::
+
+    python -m tardis.apps.hrmc_views.benchmarks.bench_grdata --rows 1000000
+
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy
+
+from tardis.apps.hrmc_views.grdata import load_series
+
+
+def legacy_parse(path):
+    """The parse loop get_image_to_show used before grdata existed"""
+    buff = []
+    with open(path) as f:
+        for d in f.read():
+            buff.append(d)
+    xs = []
+    ys = []
+    for l in ''.join(buff).split("\n"):
+        if l:
+            x, y = l.split()
+            xs.append(float(x))
+            ys.append(float(y))
+    return xs, ys
+
+
+def write_series(path, rows):
+    """Writes a synthetic g(r) curve with the given number of rows"""
+    r = numpy.linspace(0.0, 20.0, rows)
+    g = 1.0 + numpy.exp(-r / 5.0) * numpy.sin(3.0 * r)
+    numpy.savetxt(path, numpy.column_stack((r, g)), fmt="%.6f")
+
+
+def _run(func, path, conn):
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    func(path)
+    elapsed = time.time() - start
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    conn.send((elapsed, after - before))
+    conn.close()
+
+
+def measure(func, path):
+    """Runs func(path) in a fresh process and returns (seconds, peak KiB)
+
+    A separate process keeps one parser's peak from hiding the other's.
+    """
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.Process(target=_run, args=(func, path, child))
+    proc.start()
+    result = parent.recv()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--rows", type=int, default=200000,
+                        help="rows in the synthetic data file")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per parser, the best is reported")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, "grfinal01.dat")
+        write_series(path, args.rows)
+        size = os.path.getsize(path)
+        print("%d rows, %.1f MiB" % (args.rows, size / 1048576.0))
+        for name, func in (("legacy", legacy_parse),
+                           ("load_series", load_series)):
+            runs = [measure(func, path) for _ in range(args.repeat)]
+            elapsed = min(r[0] for r in runs)
+            peak = min(r[1] for r in runs)
+            print("%-12s %8.3f s %10.1f MiB/s %10d KiB peak" % (
+                name, elapsed, size / 1048576.0 / max(elapsed, 1e-9), peak))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
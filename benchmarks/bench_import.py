@@ -0,0 +1,83 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+bench_import.py
+
+Measures what importing the HRMC views adds to the startup of a Django
+worker, on top of the portal models it needs anyway, with matplotlib
+loaded lazily and, for comparison, loaded up front as views.py used to.
+
+Run with the portal's settings, e.g.::
+
+    DJANGO_SETTINGS_MODULE=tardis.test_settings \
+        python -m tardis.apps.hrmc_views.benchmarks.bench_import
+
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+_SCRIPT = """
+import sys, time
+import tardis.tardis_portal.models
+start = time.time()
+import tardis.apps.hrmc_views.views
+%s
+print("%%f %%d %%d" %% (time.time() - start,
+                      'matplotlib' in sys.modules, 'numpy' in sys.modules))
+"""
+
+CASES = (
+    ("lazy", ""),
+    ("eager", "from tardis.apps.hrmc_views.render import _load; _load()"),
+)
+
+
+def measure(code):
+    """Returns (seconds, matplotlib loaded, numpy loaded) of one run in a
+    fresh interpreter
+    """
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'tardis.test_settings')
+    out = subprocess.check_output([sys.executable, "-c", _SCRIPT % code],
+                                  env=env)
+    seconds, matplotlib, numpy = out.split()
+    return float(seconds), matplotlib == b"1", numpy == b"1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="interpreters started per case, the median "
+                             "is reported")
+    args = parser.parse_args()
+
+    for name, code in CASES:
+        runs = sorted(measure(code) for _ in range(args.repeat))
+        seconds, matplotlib, numpy = runs[len(runs) // 2]
+        print("%-6s %8.1f ms  matplotlib %-3s numpy %s" % (
+            name, seconds * 1000, matplotlib and "yes" or "no",
+            numpy and "yes" or "no"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+"""
+bench_rasterize.py
+
+Compares how many plots a second the numpy rasterizer and matplotlib draw
+for the standard layout: every grfinal calculation against the experiment.
+The data files are loaded once up front so only drawing and png encoding
+are timed.
+
+Run with the portal's settings, e.g.::
+
+    DJANGO_SETTINGS_MODULE=tardis.test_settings \
+        python -m tardis.apps.hrmc_views.benchmarks.bench_rasterize
+
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from tardis.apps.hrmc_views.benchmarks.bench_grdata import write_series
+from tardis.apps.hrmc_views.grdata import load_series
+from tardis.apps.hrmc_views.render import PlotRenderer, plot_label, shade
+
+
+def make_curves(tmpdir, rows, calculations):
+    """Returns the curves of a synthetic dataset styled as
+    :meth:`PlotRenderer.render_files` styles them
+    """
+    curves = []
+    for i in range(calculations):
+        filename = "grfinal%02d.dat" % (i + 1)
+        path = os.path.join(tmpdir, filename)
+        write_series(path, rows)
+        xs, ys = load_series(path)
+        if i == calculations - 1:
+            color, marker = "blue", "D"
+        else:
+            color, marker = shade(float(i) / calculations), None
+        curves.append((xs, ys * (0.9 + 0.1 * i / calculations),
+                       plot_label(filename), color, marker))
+    path = os.path.join(tmpdir, "grexp.dat")
+    write_series(path, rows // 10 or 1)
+    xs, ys = load_series(path)
+    curves.append((xs, ys, "Experiment", "red", "o"))
+    return curves
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--rows", type=int, default=10000,
+                        help="rows in each synthetic data file")
+    parser.add_argument("--calculations", type=int, default=1,
+                        help="grfinal calculations per plot")
+    parser.add_argument("--plots", type=int, default=20,
+                        help="plots drawn per backend")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        curves = make_curves(tmpdir, args.rows, args.calculations)
+    finally:
+        shutil.rmtree(tmpdir)
+    print("%d rows, %d calculations" % (args.rows, args.calculations))
+    for backend in ("matplotlib", "raster"):
+        renderer = PlotRenderer(backend=backend)
+        # the first render pays for imports
+        size = len(renderer.render(curves))
+        start = time.time()
+        for _ in range(args.plots):
+            renderer.render(curves)
+        elapsed = time.time() - start
+        print("%-10s %8.1f plots/s %8.1f ms/plot %8d bytes" % (
+            backend, args.plots / elapsed, elapsed * 1000 / args.plots,
+            size))
+
+
+if __name__ == "__main__":
+    main()
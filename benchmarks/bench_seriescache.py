@@ -0,0 +1,89 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+"""
+bench_seriescache.py
+
+Compares loading a HRMC data file by parsing its text with
+:func:`grdata.load_series` against loading the binary copy kept by
+:mod:`seriescache`, both memory mapped and read through in full.
+
+Run with::
+
+    python -m tardis.apps.hrmc_views.benchmarks.bench_seriescache \
+        --rows 1000000
+
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import numpy
+
+from tardis.apps.hrmc_views.benchmarks.bench_grdata import write_series
+from tardis.apps.hrmc_views.grdata import load_series
+from tardis.apps.hrmc_views.seriescache import SeriesCache
+
+
+def best(func, repeat):
+    """Returns the fastest of repeat calls to func in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--rows", type=int, default=200000,
+                        help="rows in the synthetic data file")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs per case, the best is reported")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, "grfinal01.dat")
+        write_series(path, args.rows)
+        with open(path, "rb") as f:
+            checksum = hashlib.sha512(f.read()).hexdigest()
+        cache = SeriesCache(os.path.join(tmpdir, "cache"))
+        print("%d rows, %.1f MiB of text" % (
+            args.rows, os.path.getsize(path) / 1048576.0))
+
+        cases = (
+            ("parse text", lambda: load_series(path)),
+            ("first load", lambda: cache.put(checksum, load_series(path))),
+            ("mmap", lambda: cache.get(checksum)),
+            ("mmap + read", lambda: numpy.array(cache.get(checksum))),
+        )
+        for name, func in cases:
+            elapsed = best(func, args.repeat)
+            print("%-12s %10.3f ms" % (name, elapsed * 1000))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
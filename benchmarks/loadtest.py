@@ -0,0 +1,155 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+"""
+loadtest.py
+
+Drives pages of the app with concurrent clients and measures their
+latency, for the ``hrmc_loadtest`` command.
+
+Each client is a thread calling Django's WSGI handler directly, as a
+threaded gunicorn worker would, so requests go through the middleware
+and open their own database connections but no sockets.
+
+"""
+import io
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+
+RESULTS_VERSION = 1
+
+
+def percentile(values, fraction):
+    """Returns the value fraction of the way through sorted values"""
+    if not values:
+        return None
+    return values[int(round(fraction * (len(values) - 1)))]
+
+
+def _environ(path):
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+        'SCRIPT_NAME': '', 'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1', 'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+
+def fetch(handler, path):
+    """Requests path from the WSGI handler and returns (status, bytes)"""
+    status = []
+
+    def start_response(line, headers, exc_info=None):
+        status.append(int(line.split()[0]))
+    body = handler(_environ(path), start_response)
+    try:
+        size = sum(len(chunk) for chunk in body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return status[0], size
+
+
+class _Client(threading.Thread):
+
+    def __init__(self, handler, paths, start):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.handler = handler
+        self.paths = paths
+        self.start_event = start
+        self.latencies = []
+        self.bytes = 0
+        self.errors = 0
+
+    def run(self):
+        self.start_event.wait()
+        try:
+            for path in self.paths:
+                start = time.time()
+                try:
+                    status, size = fetch(self.handler, path)
+                except Exception:
+                    status, size = 500, 0
+                self.latencies.append(time.time() - start)
+                self.bytes += size
+                if status != 200:
+                    self.errors += 1
+        finally:
+            connection.close()
+
+
+def run_scenario(paths, clients=8, requests=10):
+    """Opens paths with clients concurrent clients making requests
+    requests each, client i starting at path i, and returns the latency
+    percentiles, throughput and bytes served as a dict
+    """
+    handler = WSGIHandler()
+    start = threading.Event()
+    threads = []
+    for i in range(clients):
+        threads.append(_Client(handler, [paths[(i + j) % len(paths)]
+                                         for j in range(requests)], start))
+        threads[-1].start()
+    began = time.time()
+    start.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - began
+    latencies = sorted(t for thread in threads for t in thread.latencies)
+    total = len(latencies)
+    return OrderedDict([
+        ("requests", total),
+        ("errors", sum(thread.errors for thread in threads)),
+        ("seconds", elapsed),
+        ("requests_per_second", total / max(elapsed, 1e-9)),
+        ("bytes", sum(thread.bytes for thread in threads)),
+        ("latency_ms", OrderedDict(
+            [(name, 1000 * percentile(latencies, fraction))
+             for name, fraction in (("p50", 0.5), ("p90", 0.9),
+                                    ("p99", 0.99), ("max", 1.0))]
+            + [("mean", 1000 * sum(latencies) / max(total, 1))])),
+    ])
+
+
+def format_results(results):
+    """Returns results as a text table"""
+    config = results["config"]
+    lines = ["%(clients)d clients x %(requests)d requests over %(datasets)d "
+             "datasets of %(rows)d rows, %(processes)d render processes"
+             % config,
+             "%-5s %6s %6s %8s %8s %8s %8s %8s %10s %7s" % (
+                 "run", "reqs", "errors", "req/s", "p50 ms", "p90 ms",
+                 "p99 ms", "max ms", "KiB", "renders")]
+    for name, run in results["scenarios"].items():
+        latency = run["latency_ms"]
+        lines.append("%-5s %6d %6d %8.1f %8.1f %8.1f %8.1f %8.1f %10.1f %7d"
+                     % (name, run["requests"], run["errors"],
+                        run["requests_per_second"], latency["p50"],
+                        latency["p90"], latency["p99"], latency["max"],
+                        run["bytes"] / 1024.0, run["renders"]))
+    return "\n".join(lines) + "\n"
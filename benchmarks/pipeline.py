@@ -0,0 +1,233 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+"""
+pipeline.py
+
+Measures each stage of taking HRMC datasets from upload to page, over
+synthetic datasets from :mod:`synthetic`.  Used by the ``hrmc_benchmark``
+command, which runs it against a scratch database and file store.
+
+The stages, in the order they are run for each dataset:
+
+``ingest``
+    saving each Dataset_File and passing it to the HRMCOutput filter.
+``parse``
+    parsing the data files that are plotted.
+``render``
+    drawing the plot.
+``encode``
+    encoding every stored size of the plot.
+``plot``
+    :func:`views.get_image_to_show`, which does all of the above through
+    the series cache and plot store and records the plot.
+``view``
+    fetching the dataset page and its thumbnail, once every dataset has
+    been plotted.
+
+Each stage records its wall time, database queries and the process' peak
+RSS.  The peak is a high water mark and only rises, so ``rss_growth_kb``
+is how far a stage pushed it up.
+
+"""
+import platform
+import resource
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.client import Client
+
+# installed into the portal's filters, see the README
+from tardis.tardis_portal.filters.hrmc import HRMCOutput
+
+from tardis.apps.hrmc_views.plots import HRMC_DATASET_SCHEMA
+from tardis.apps.hrmc_views.plots import find_plot_files
+from tardis.apps.hrmc_views.plotstore import render_backend
+from tardis.apps.hrmc_views.render import PlotRenderer, is_webp_enabled
+from tardis.apps.hrmc_views.renderqueue import get_queue
+from tardis.apps.hrmc_views.synthetic import add_datafiles
+from tardis.apps.hrmc_views.synthetic import create_dataset
+from tardis.apps.hrmc_views.synthetic import create_experiment
+from tardis.apps.hrmc_views.views import get_image_to_show
+
+RESULTS_VERSION = 1
+
+
+class PipelineError(Exception):
+    """A stage didn't produce what the next one needs"""
+
+
+def peak_rss():
+    """Returns the peak resident set size of this process in KiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # bytes there, KiB everywhere else
+        peak //= 1024
+    return peak
+
+
+class Recorder(object):
+    """Totals the wall time, queries and peak RSS of each stage over every
+    time it is run
+    """
+    def __init__(self):
+        self.stages = OrderedDict()
+
+    @contextmanager
+    def stage(self, name):
+        use_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        queries = len(connection.queries)
+        rss = peak_rss()
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            count = len(connection.queries) - queries
+            connection.use_debug_cursor = use_debug_cursor
+            peak = peak_rss()
+            totals = self.stages.setdefault(name, OrderedDict(
+                [("runs", 0), ("seconds", 0.0), ("max_seconds", 0.0),
+                 ("queries", 0), ("peak_rss_kb", 0), ("rss_growth_kb", 0)]))
+            totals["runs"] += 1
+            totals["seconds"] += elapsed
+            totals["max_seconds"] = max(totals["max_seconds"], elapsed)
+            totals["queries"] += count
+            totals["peak_rss_kb"] = max(totals["peak_rss_kb"], peak)
+            totals["rss_growth_kb"] += peak - rss
+
+
+def run_pipeline(datasets=3, files=None, rows=10000, iterations=3, seed=0):
+    """Runs every stage over datasets synthetic datasets, see
+    :func:`synthetic.write_dataset` for the rest, and returns the results
+    as a dict ready for JSON.
+
+    Works in the current database and FILE_STORE_PATH, which should be
+    scratch ones, and renders inline whatever HRMC_RENDER_PROCESSES says.
+    """
+    recorder = Recorder()
+    experiment = create_experiment("hrmc_benchmark")
+    output = HRMCOutput("HRMC", HRMC_DATASET_SCHEMA, quiet_period=0)
+    renderer = PlotRenderer()
+    created = []
+    for i in range(datasets):
+        dataset, dest, filenames = create_dataset(
+            experiment, rows, iterations, files, seed + i)
+        with recorder.stage("ingest"):
+            # holding the dataset's claim leaves the render the filter
+            # asks for to the stages below
+            get_queue().once(dataset.id, lambda: add_datafiles(
+                dataset, dest, filenames, output))
+
+        grexp_file, grfinal_files = find_plot_files(dataset)
+        if not (grexp_file and grfinal_files):
+            raise PipelineError("dataset %d has nothing to plot" % i)
+        grfinals = [(df.get_absolute_filepath(), df.filename)
+                    for df in grfinal_files]
+        with recorder.stage("parse"):
+            curves = renderer.file_curves(grexp_file.get_absolute_filepath(),
+                                          grfinals)
+        with recorder.stage("render"):
+            pixels = renderer.draw(curves)
+        with recorder.stage("encode"):
+            renderer.encode_images(pixels, webp=is_webp_enabled())
+        with recorder.stage("plot"):
+            plot = get_image_to_show(dataset)
+        if plot is None:
+            raise PipelineError("dataset %d wasn't plotted" % i)
+        created.append((dataset, plot.string_value))
+
+    # every upload is done before the first page is served, which starts
+    # MyTardis' own filters
+    client = Client()
+    for dataset, key in created:
+        url = reverse('tardis.apps.hrmc_views.views.view_plot',
+                      kwargs={'dataset_id': dataset.id, 'key': key,
+                              'size': "thumb", 'format': "png"})
+        with recorder.stage("view"):
+            responses = [client.get("/dataset/%d" % dataset.id),
+                         client.get(url)]
+        for response in responses:
+            if response.status_code != 200:
+                raise PipelineError("dataset %d view returned %d"
+                                    % (dataset.id, response.status_code))
+
+    return OrderedDict([
+        ("version", RESULTS_VERSION),
+        ("config", OrderedDict([
+            ("datasets", datasets), ("files", files or iterations + 1),
+            ("rows", rows), ("iterations", iterations), ("seed", seed),
+            ("all_calculations",
+             getattr(settings, 'HRMC_PLOT_ALL_CALCULATIONS', False))])),
+        ("environment", OrderedDict([
+            ("python", platform.python_version()),
+            ("numpy", numpy.__version__),
+            ("backend", render_backend()),
+            ("webp", bool(is_webp_enabled())),
+            ("database", connection.vendor)])),
+        ("stages", recorder.stages),
+    ])
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Returns a description of each stage of results slower than in
+    baseline by more than the tolerance fraction, or making more queries.
+    Raises ValueError if they were run with different configs.
+    """
+    if results["config"] != baseline["config"]:
+        raise ValueError("baseline was run with %s" % (baseline["config"],))
+    regressions = []
+    for name, stage in results["stages"].items():
+        base = baseline["stages"].get(name)
+        if not base:
+            continue
+        seconds = stage["seconds"] / stage["runs"]
+        base_seconds = base["seconds"] / base["runs"]
+        if seconds > base_seconds * (1 + tolerance):
+            regressions.append("%s: %.1f ms a run, baseline %.1f ms" % (
+                name, seconds * 1000, base_seconds * 1000))
+        queries = float(stage["queries"]) / stage["runs"]
+        base_queries = float(base["queries"]) / base["runs"]
+        if queries > base_queries:
+            regressions.append("%s: %g queries a run, baseline %g" % (
+                name, queries, base_queries))
+    return regressions
+
+
+def format_results(results):
+    """Returns results as a text table"""
+    lines = ["%(datasets)d datasets of %(files)d files, %(rows)d rows, "
+             "%(iterations)d calculations" % results["config"],
+             "%-8s %5s %10s %10s %10s %10s %10s" % (
+                 "stage", "runs", "mean ms", "max ms", "queries",
+                 "peak MiB", "grew MiB")]
+    for name, stage in results["stages"].items():
+        lines.append("%-8s %5d %10.1f %10.1f %10.1f %10.1f %10.1f" % (
+            name, stage["runs"], stage["seconds"] / stage["runs"] * 1000,
+            stage["max_seconds"] * 1000,
+            float(stage["queries"]) / stage["runs"],
+            stage["peak_rss_kb"] / 1024.0, stage["rss_growth_kb"] / 1024.0))
+    return "\n".join(lines) + "\n"
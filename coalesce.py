@@ -0,0 +1,102 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+coalesce.py
+
+Collapses bursts of events for the same key into one call made after the
+key has gone quiet.
+
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Debouncer(object):
+    """Calls func(key) once key has gone quiet seconds without a touch().
+
+    The calls are made one at a time on a daemon thread started on first
+    use, so func never runs concurrently with itself.
+
+    :param func: callable taking a key.
+    :param quiet: seconds without a touch before func is called.
+    :type quiet: float
+    """
+    def __init__(self, func, quiet):
+        self.func = func
+        self.quiet = quiet
+        self._deadlines = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def touch(self, key):
+        """Records an event for key, postponing its call"""
+        with self._cond:
+            idle = not self._deadlines
+            self._deadlines[key] = time.time() + self.quiet
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run,
+                                                name="hrmc-debouncer")
+                self._thread.daemon = True
+                self._thread.start()
+            elif idle:
+                # every other deadline is earlier than this one, so the
+                # thread only needs waking if it was waiting on nothing
+                self._cond.notify()
+
+    def pending(self):
+        """Returns the keys waiting to be called"""
+        with self._cond:
+            return list(self._deadlines)
+
+    def flush(self):
+        """Calls func for every waiting key now, in this thread"""
+        with self._cond:
+            due = list(self._deadlines)
+            self._deadlines.clear()
+        self._call(due)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.time()
+                    due = [key for key, deadline in self._deadlines.items()
+                           if deadline <= now]
+                    if due:
+                        break
+                    if self._deadlines:
+                        self._cond.wait(
+                            min(self._deadlines.values()) - now)
+                    else:
+                        self._cond.wait()
+                for key in due:
+                    del self._deadlines[key]
+            self._call(due)
+
+    def _call(self, keys):
+        for key in keys:
+            try:
+                self.func(key)
+            except Exception:
+                logger.exception("debounced call for %s failed" % key)
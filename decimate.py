@@ -0,0 +1,88 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+decimate.py
+
+Shape preserving downsampling of g(r) series, so drawing cost is bounded
+by the width of the plot rather than the length of the data.
+
+"""
+import numpy
+
+
+def lttb(x, y, n):
+    """Largest-Triangle-Three-Buckets: returns n points of x, y keeping the
+    first and last point and, from each of n - 2 buckets in between, the
+    point making the largest triangle with the point kept before it and the
+    mean of the next bucket.
+    """
+    size = len(x)
+    if n >= size or n < 3:
+        return x, y
+    edges = numpy.linspace(1, size - 1, n - 1).astype(int)
+    # means of every bucket, plus the last point standing in for the
+    # bucket after the final one
+    counts = numpy.diff(edges)
+    mean_x = numpy.append(numpy.add.reduceat(x[1:size - 1], edges[:-1] - 1)
+                          / counts, x[-1])
+    mean_y = numpy.append(numpy.add.reduceat(y[1:size - 1], edges[:-1] - 1)
+                          / counts, y[-1])
+    keep = numpy.empty(n, dtype=int)
+    keep[0] = 0
+    keep[-1] = size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = numpy.abs((x[a] - mean_x[i + 1]) * (y[lo:hi] - y[a])
+                         - (x[a] - x[lo:hi]) * (mean_y[i + 1] - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return x[keep], y[keep]
+
+
+def minmax(x, y, n):
+    """Returns about n points of x, y: the end points plus the lowest and
+    highest point of each of n / 2 equal buckets, in order.  Fully
+    vectorised, and keeps every peak and trough.
+    """
+    size = len(x)
+    buckets = n // 2
+    if n >= size or buckets < 1:
+        return x, y
+    width = size // buckets
+    main = buckets * width
+    rows = y[:main].reshape(buckets, width)
+    offsets = numpy.arange(buckets) * width
+    parts = [[0, size - 1],
+             rows.argmin(axis=1) + offsets, rows.argmax(axis=1) + offsets]
+    if main < size:
+        tail = y[main:]
+        parts.append(numpy.array([main + tail.argmin(), main + tail.argmax()]))
+    keep = numpy.unique(numpy.concatenate(parts))
+    return x[keep], y[keep]
+
+
+METHODS = {"lttb": lttb, "minmax": minmax}
+
+
+def downsample(x, y, n, method="lttb"):
+    """Returns x, y reduced to about n points with the named method"""
+    return METHODS[method](numpy.asarray(x), numpy.asarray(y), n)
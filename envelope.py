@@ -0,0 +1,214 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+"""
+envelope.py
+
+Min/max envelope pyramids of g(r) series, so any r range of a series of
+millions of points can be drawn at a given pixel width in time
+proportional to the width rather than the length of the series.
+
+Level 0 of a pyramid holds the lowest and highest g(r) of each run of
+BASE points, and each level above merges pairs of bins of the one below,
+so level k has bins of BASE * 2 ** k points.  A zoom reads the whole bins
+of the coarsest level with at least one bin per pixel column of the range,
+between width and 2 * width bins, with finer bins and single points at
+the edges of the range, and folds them into columns.
+
+Pyramids are kept in :mod:`seriescache` beside the series they were
+built from, as a 2 x M array of the lows and highs of every level, finest
+first.  The render queue's workers build them for every new dataset.
+
+"""
+import logging
+
+import numpy
+
+from tardis.apps.hrmc_views.seriescache import get_series_cache, load_cached
+
+logger = logging.getLogger(__name__)
+
+# points in each bin of the finest level
+BASE = 16
+# suffix of pyramids in the series cache
+KIND = ".env"
+
+
+def level_sizes(n, base=BASE):
+    """Returns the number of bins in each level of the pyramid of n
+    points, finest first
+    """
+    sizes = []
+    size = base
+    while True:
+        count = -(-n // size)
+        sizes.append(count)
+        if count <= 1:
+            return sizes
+        size *= 2
+
+
+def build_envelope(g, base=BASE):
+    """Returns the pyramid of g(r) values g"""
+    g = numpy.asarray(g, dtype=float)
+    if not len(g):
+        return numpy.empty((2, 0))
+    starts = numpy.arange(0, len(g), base)
+    lo = numpy.minimum.reduceat(g, starts)
+    hi = numpy.maximum.reduceat(g, starts)
+    los, his = [lo], [hi]
+    while len(lo) > 1:
+        if len(lo) % 2:
+            lo = numpy.append(lo, lo[-1])
+            hi = numpy.append(hi, hi[-1])
+        lo = numpy.minimum(lo[::2], lo[1::2])
+        hi = numpy.maximum(hi[::2], hi[1::2])
+        los.append(lo)
+        his.append(hi)
+    return numpy.array([numpy.concatenate(los), numpy.concatenate(his)])
+
+
+def _pieces(g, envelope, n, j0, j1, level, base=BASE):
+    """Returns (first, last, lo, hi) arrays of the first and last point
+    and the lowest and highest g(r) of pieces exactly covering points j0
+    to j1 - 1 of a series of n points, in order.  The pieces are the whole
+    bins of level that fit, finer bins either side of them, one of each
+    level at most, and single points either side of those.
+    """
+    firsts, lasts, los, his = [], [], [], []
+    offsets = numpy.cumsum([0] + level_sizes(n, base))
+
+    def points(a, b):
+        index = numpy.arange(a, b)
+        firsts.append(index)
+        lasts.append(index)
+        los.append(numpy.asarray(g[a:b], dtype=float))
+        his.append(numpy.asarray(g[a:b], dtype=float))
+
+    def bins(k, b0, b1):
+        size = base << k
+        first = numpy.arange(b0, b1) * size
+        firsts.append(first)
+        lasts.append(numpy.minimum(first + size, n) - 1)
+        los.append(envelope[0, offsets[k] + b0:offsets[k] + b1])
+        his.append(envelope[1, offsets[k] + b0:offsets[k] + b1])
+
+    p = min(-(-j0 // base) * base, j1)
+    points(j0, p)
+    k, size = 0, base
+    # up to the level, taking a bin wherever p is not yet aligned to the
+    # next level's bins
+    while k < level:
+        if (p // size) % 2 and p + size <= j1:
+            bins(k, p // size, p // size + 1)
+            p += size
+        k += 1
+        size *= 2
+    count = (j1 - p) // size
+    if count > 0:
+        bins(level, p // size, p // size + count)
+        p += count * size
+    # and down again over what is left
+    while k > 0:
+        k -= 1
+        size //= 2
+        if p + size <= j1:
+            bins(k, p // size, p // size + 1)
+            p += size
+    points(p, j1)
+    return (numpy.concatenate(firsts), numpy.concatenate(lasts),
+            numpy.concatenate(los), numpy.concatenate(his))
+
+
+def zoom(r, g, envelope, r0, r1, width, base=BASE):
+    """Returns (r, g) of the part of series r, g between r0 and r1 drawn
+    width pixels wide.  If there are no more than two points per pixel
+    they are returned as they are, with the point either side of the
+    range so lines run on to the edges.  Otherwise each pixel column
+    becomes two points at its centre, the lowest then the highest g(r) of
+    the points in it, and nothing outside the range is counted.
+
+    r must be ascending.  Only O(width + log(len(r))) values of r, g and
+    envelope, which may be memory mapped, are read.
+    """
+    if not r1 > r0 or width < 1:
+        raise ValueError("empty zoom range")
+    n = len(r)
+    j0 = int(numpy.searchsorted(r, r0, "left"))
+    j1 = int(numpy.searchsorted(r, r1, "right"))
+    i0 = max(j0 - 1, 0)
+    i1 = min(j1 + 1, n)
+    span = i1 - i0
+    if span <= 2 * width:
+        return (numpy.array(r[i0:i1], dtype=float),
+                numpy.array(g[i0:i1], dtype=float))
+    if span < base * width:
+        # finer than the pyramid, at most base points per column
+        starts = ends = r[j0:j1]
+        lo = hi = g[j0:j1]
+    else:
+        level, size = 0, base
+        while 2 * size * width <= span:
+            level += 1
+            size *= 2
+        first, last, lo, hi = _pieces(g, envelope, n, j0, j1, level, base)
+        starts = r[first]
+        ends = r[last]
+    # a piece is no wider than a column, so it lies in the columns of its
+    # first and last points; counting it in both never loses a peak
+    step = (r1 - r0) / float(width)
+    lows = numpy.empty(width)
+    lows.fill(numpy.inf)
+    highs = numpy.empty(width)
+    highs.fill(-numpy.inf)
+    for edges in (starts, ends):
+        # r1 itself falls in the last column
+        columns = numpy.clip(((numpy.asarray(edges, dtype=float) - r0)
+                              / step).astype(int), 0, width - 1)
+        # columns ascend with r, so each is a run
+        runs = numpy.concatenate(
+            [[0], numpy.flatnonzero(numpy.diff(columns)) + 1])
+        columns = columns[runs]
+        lows[columns] = numpy.minimum(lows[columns],
+                                      numpy.minimum.reduceat(lo, runs))
+        highs[columns] = numpy.maximum(highs[columns],
+                                       numpy.maximum.reduceat(hi, runs))
+    filled = numpy.flatnonzero(lows <= highs)
+    centres = r0 + (filled + 0.5) * step
+    return (numpy.repeat(centres, 2),
+            numpy.column_stack([lows[filled], highs[filled]]).ravel())
+
+
+def load_envelope(path, checksum=None):
+    """Returns (r, g, envelope) of the data file at path, loaded through
+    :mod:`seriescache`.  If checksum, the file's sha512sum, is given the
+    pyramid is built once and cached beside the series.
+    """
+    r, g = load_cached(path, checksum)
+    if not checksum:
+        return r, g, build_envelope(g)
+    cache = get_series_cache()
+    envelope = cache.get(checksum, KIND)
+    if envelope is None or envelope.shape[1] != sum(level_sizes(len(g))):
+        envelope = build_envelope(g)
+        try:
+            cache.put(checksum, envelope, KIND)
+        except (IOError, OSError):
+            logger.exception("caching envelope of %s failed" % path)
+    return r, g, envelope
@@ -0,0 +1,126 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+grdata.py
+
+Loads the two column r, g(r) files written by HRMC (grexp.dat and
+grfinalNN.dat) into numpy arrays.
+
+"""
+import logging
+
+import numpy
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the file at a time.  Each chunk is cut back to the last
+# newline so no line is split between two chunks.
+CHUNK_SIZE = 1 << 20
+
+# Lines starting with one of these are skipped by the tolerant parser.
+COMMENT_CHARS = b"#!"
+
+# Any byte outside this set sends a chunk to the tolerant parser.
+_NUMERIC_BYTES = b"0123456789eE+-. \t\r\n"
+
+
+def load_series(path, chunk_size=CHUNK_SIZE):
+    """Returns the data file at path as a 2 x N float array whose rows are
+    r and g(r), so it unpacks as ``r, g = load_series(path)``.
+
+    The file is read chunk_size bytes at a time and each clean chunk is
+    converted by numpy in a single call.  Chunks containing blank lines,
+    comments or anything else numpy can't take directly are handed to
+    :func:`parse_lines` instead.
+    """
+    parts = []
+    tail = b""
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            if tail:
+                block = tail + block
+            cut = block.rfind(b"\n") + 1
+            tail = block[cut:]
+            if cut:
+                parts.append(_parse_chunk(block[:cut]))
+    if tail.strip():
+        parts.append(_parse_chunk(tail))
+    if not parts:
+        values = numpy.empty(0)
+    elif len(parts) == 1:
+        values = parts[0]
+    else:
+        values = numpy.concatenate(parts)
+    logger.debug("loaded %d points from %s" % (values.size // 2, path))
+    return values.reshape(-1, 2).T
+
+
+def _parse_chunk(chunk):
+    """Returns chunk as a flat array of alternating r, g(r) values"""
+    if not chunk.translate(None, _NUMERIC_BYTES) and _two_columns(chunk):
+        values = numpy.fromstring(chunk, dtype=float, sep=" ")
+        lines = chunk.count(b"\n") + (not chunk.endswith(b"\n"))
+        if values.size == 2 * lines:
+            return values
+    return parse_lines(chunk.splitlines())
+
+
+def _two_columns(chunk):
+    """True if every line of chunk has exactly two fields, which rules out
+    blank lines, extra columns and lines missing a column
+    """
+    data = numpy.frombuffer(chunk, dtype=numpy.uint8)
+    newline = data == ord(b"\n")
+    blank = newline | (data == ord(b" ")) | (data == ord(b"\t")) | \
+        (data == ord(b"\r"))
+    # a field starts at each non blank byte after a blank one
+    starts = ~blank
+    starts[1:] &= blank[:-1]
+    line = numpy.cumsum(newline)
+    lines = int(line[-1]) + (not chunk.endswith(b"\n"))
+    fields = numpy.bincount(line[starts], minlength=lines)
+    return bool((fields[:lines] == 2).all())
+
+
+def parse_lines(lines):
+    """Tolerant parser for the lines of a HRMC data file.
+
+    Blank lines and lines starting with one of COMMENT_CHARS are skipped,
+    as are any columns after the second.  Returns a flat array of
+    alternating r, g(r) values.
+
+    :raises ValueError: if a line has fewer than two columns or a value is
+        not a number.
+    """
+    values = []
+    for line in lines:
+        line = line.strip()
+        if not line or line[:1] in COMMENT_CHARS:
+            continue
+        fields = line.split()
+        if len(fields) < 2:
+            raise ValueError("expected two columns in line %r" % line)
+        values.append(float(fields[0]))
+        values.append(float(fields[1]))
+    return numpy.array(values, dtype=float)
@@ -25,15 +25,53 @@ hrmc.py
 .. moduleauthor::  Ian Thomas <ianedwardthomas@gmail.com>
 
 """
+import atexit
 import logging
+import os
+import threading
+from collections import OrderedDict
 
+from django.conf import settings
 from django.core.exceptions import MultipleObjectsReturned
+from django.core.signals import request_finished, request_started
 
 from tardis.tardis_portal.models import Schema
-from tardis.tardis_portal.models import Dataset_File, DatasetParameterSet
+from tardis.tardis_portal.models import Dataset_File
+
+from tardis.apps.hrmc_views.coalesce import Debouncer
+from tardis.apps.hrmc_views.instrument import incr, timed
+from tardis.apps.hrmc_views.plots import get_or_create_parameterset
+from tardis.apps.hrmc_views.renderqueue import get_queue
+from tardis.apps.hrmc_views.schemacache import get_schema
 
 logger = logging.getLogger(__name__)
 
+# Bits of the per dataset record kept by HRMCOutput
+GREXP = 1
+GRFINAL = 2
+DONE = 4
+
+
+def _file_kind(datafile):
+    """Returns GREXP or GRFINAL for the data files plotted, else 0"""
+    # filename may not be set yet when only the url is known
+    filename = datafile.filename or os.path.basename(datafile.url or '')
+    if "grexp.dat" in filename:
+        return GREXP
+    if filename.startswith("grfinal"):
+        return GRFINAL
+    return 0
+
+
+def _has_file(dataset_id, kind):
+    """True if the dataset has a data file of kind, in a single query"""
+    files = Dataset_File.objects.filter(dataset__id=dataset_id)
+    if kind == GREXP:
+        files = files.filter(filename__contains="grexp.dat")
+    else:
+        files = files.filter(filename__startswith="grfinal")
+    return files.exists()
+
 
 class HRMCOutput(object):
     """This
@@ -45,16 +83,57 @@ class HRMCOutput(object):
     :type tagsToFind: list of strings
     :param tagsToExclude: unused
     :type tagsToExclude: list of strings
+    :param quiet_period: seconds a dataset must go without a save before
+        it is evaluated, so a burst of uploads is evaluated once.  Defaults
+        to the HRMC_FILTER_QUIET_PERIOD setting, or 0 to evaluate on every
+        save.  The quiet period of a dataset saved to in a request starts
+        again when that request finishes, after its transaction has
+        committed, so saves spread over several upload requests are
+        evaluated once the last of them has committed.  Datasets still
+        waiting are evaluated when the process exits.
+    :type quiet_period: float
     """
+    # datasets whose record is kept; the least recently saved are dropped
+    # first and rebuilt from the database if they are saved to again
+    max_datasets = 10000
+
     def __init__(self, name, schema,
-                 tagsToFind=[], tagsToExclude=[]):
+                 tagsToFind=[], tagsToExclude=[], quiet_period=None):
         self.name = name
         self.schema = schema
+        if quiet_period is None:
+            quiet_period = getattr(settings, 'HRMC_FILTER_QUIET_PERIOD', 0)
+        self.quiet_period = quiet_period
+        self._debouncer = Debouncer(self._evaluate, quiet_period)
+        # datasets saved to by the request each thread is serving
+        self._requests = threading.local()
+        if quiet_period:
+            request_started.connect(self._request_started)
+            request_finished.connect(self._request_finished)
+            atexit.register(self.flush)
+        # dataset id -> bits of the files seen and whether it is DONE
+        self._datasets = OrderedDict()
+        self._lock = threading.Lock()
         logger.debug("hrmc __init__")
 
+    def _update(self, dataset_id, bits):
+        """ORs bits into the record of dataset_id and returns the result"""
+        with self._lock:
+            bits |= self._datasets.pop(dataset_id, 0)
+            self._datasets[dataset_id] = bits
+            if len(self._datasets) > self.max_datasets:
+                self._datasets.popitem(last=False)
+            return bits
+
+    @timed("filter.call")
     def __call__(self, sender, **kwargs):
         """post save callback entry point.
 
+        Only the file just saved is looked at, against a record of what
+        has been seen for its dataset, so the cost of a save doesn't grow
+        with the number of files in the dataset.  The dataset itself is
+        evaluated once its saves go quiet.
+
         :param sender: The model class.
         :param instance: The actual instance being saved.
         :param created: A boolean; True if a new record was created.
@@ -63,10 +142,59 @@ class HRMCOutput(object):
         logger.debug("hrmc __call__")
 
         datafile_instance = kwargs.get('instance')
-        dataset_instance = datafile_instance.dataset
+        kind = _file_kind(datafile_instance)
+        if not kind:
+            incr("filter.ignored")
+            return None
+        dataset_id = datafile_instance.dataset_id
+        seen = self._update(dataset_id, kind)
+        if seen & DONE:
+            incr("filter.done")
+            return None
+        if self.quiet_period:
+            incr("filter.deferred")
+            self._debouncer.touch(dataset_id)
+            saved = getattr(self._requests, 'saved', None)
+            if saved is not None:
+                saved.add(dataset_id)
+        else:
+            self._evaluate(dataset_id)
+        return None
+
+    def flush(self):
+        """Evaluates every dataset waiting for its saves to go quiet now"""
+        if self._debouncer.pending():
+            self._debouncer.flush()
+
+    def _request_started(self, sender, **kwargs):
+        self._requests.saved = set()
+
+    def _request_finished(self, sender, **kwargs):
+        # the request's saves are only committed now, so start the quiet
+        # period of the datasets it saved to again
+        saved = getattr(self._requests, 'saved', None)
+        self._requests.saved = None
+        for dataset_id in saved or ():
+            self._debouncer.touch(dataset_id)
+
+    @timed("filter.evaluate")
+    def _evaluate(self, dataset_id):
+        """Creates the parameter set of dataset_id and queues its plot once
+        both data files are present.
+        """
+        seen = self._update(dataset_id, 0)
+        if seen & DONE:
+            return None
+        for kind in (GREXP, GRFINAL):
+            if not seen & kind:
+                if not _has_file(dataset_id, kind):
+                    logger.debug("one or more files missing")
+                    return None
+                seen = self._update(dataset_id, kind)
+        logger.debug("found all files")
+
         try:
-            sch = Schema.objects.get(
-                namespace=self.schema)
+            sch = get_schema(self.schema)
         except Schema.DoesNotExist:
             logger.debug("no hrmc schema")
             return None
@@ -75,64 +203,16 @@ class HRMCOutput(object):
             return None
         logger.debug("sch=%s" % sch)
 
-        try:
-            ps = DatasetParameterSet.objects.get(schema=sch,
-                dataset=dataset_instance)
-        except DatasetParameterSet.DoesNotExist:
-            pass
-        except MultipleObjectsReturned:
-            logger.warn(
-                "Multiple dataset paramter sets for %s returned"
-                % self.name)
-            # NB: If multiple filters run in dataset could get race condition
-            # which causes multiple DatasetParameterSets to be created.
-            # However, we know that all data will be the same for this schema
-            # so can safely delete any extras we find.
-            pslist = [x.id for x in DatasetParameterSet.objects.filter(schema=sch,
-                dataset=dataset_instance)]
-            logger.debug("pslist=%s" % pslist)
-            DatasetParameterSet.objects.filter(id__in=pslist[1:]).delete()
-            return None
+        ps, created = get_or_create_parameterset(sch, dataset_id)
+        if created:
+            logger.debug("created new dataset")
+            incr("filter.submitted")
+            # pre-render the plot so the first view doesn't wait for it
+            get_queue().submit(dataset_id)
         else:
             logger.debug("parameterset already exists")
-            return None
-
-        logger.debug("dataset_instance=%s" % dataset_instance)
-        filepath = datafile_instance.get_absolute_filepath()
-        logger.debug("filepath=%s" % filepath)
-
-        grexp_file = None
-        grfinal_file = None
-        for df in Dataset_File.objects.filter(dataset=dataset_instance):
-            logger.debug("df=%s" % df.filename)
-            if "grexp.dat" in df.filename:
-                grexp_file = df
-            if df.filename.startswith("grfinal"):
-                grfinal_file = df
-
-        if grexp_file and grfinal_file:
-            logger.debug("found all files")
-            try:
-                ps = DatasetParameterSet.objects.get(schema=sch,
-                    dataset=dataset_instance)
-            except DatasetParameterSet.DoesNotExist:
-                ps = DatasetParameterSet(schema=sch,
-                                          dataset=dataset_instance)
-                ps.save()
-                logger.debug("created new dataset")
-                return None
-            except MultipleObjectsReturned:
-                logger.error(
-                    "Multiple dataset paramter sets for %s returned"
-                    % self.name)
-                return None
-            else:
-                logger.debug("parameterset already exists")
-            return None
-        else:
-            logger.debug("one or more files missing")
-
-
+        self._update(dataset_id, DONE)
+        return None
 
 
 def make_filter(name='', schema='', tagsToFind=[], tagsToExclude=[]):
@@ -0,0 +1,255 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+"""
+instrument.py
+
+Timers, counters and histograms around the stages of the ingest filter,
+the dataset view and rendering, sent to a configurable sink.  With no
+sink configured each call costs a settings lookup and nothing more.
+
+Settings:
+
+``HRMC_INSTRUMENT_SINK``
+    ``None`` (default) records nothing.  ``"log"`` logs each value at
+    INFO, ``"memory"`` keeps them in this process for :func:`snapshot`,
+    ``"statsd"`` sends them to a StatsD compatible daemon over UDP.
+``HRMC_STATSD_ADDRESS``
+    ``"host:port"`` of the StatsD daemon, default ``"127.0.0.1:8125"``.
+``HRMC_STATSD_PREFIX``
+    prefix of every StatsD name, default ``"hrmc"``.
+
+Render workers are separate processes, so their values only reach the
+log and StatsD sinks.
+
+"""
+import functools
+import logging
+import socket
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LogSink(object):
+    """Logs every value"""
+
+    def timing(self, name, seconds):
+        logger.info("%s %.3f ms" % (name, seconds * 1000))
+
+    def incr(self, name, count=1):
+        logger.info("%s +%d" % (name, count))
+
+    def observe(self, name, value):
+        logger.info("%s %s" % (name, value))
+
+
+class MemorySink(object):
+    """Keeps counters and histograms in memory.  Histograms keep an exact
+    count, sum, min and max, and their last ``keep`` values for
+    percentiles.
+    """
+    def __init__(self, keep=10000):
+        self.keep = keep
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+    def timing(self, name, seconds):
+        self.observe(name, seconds)
+
+    def incr(self, name, count=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + count
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = [
+                    0, 0.0, value, value, deque(maxlen=self.keep)]
+            histogram[0] += 1
+            histogram[1] += value
+            histogram[2] = min(histogram[2], value)
+            histogram[3] = max(histogram[3], value)
+            histogram[4].append(value)
+
+    def snapshot(self):
+        """Returns {"counters": {name: count}, "histograms": {name:
+        {"count", "sum", "min", "max", "p50", "p99"}}}, timers in seconds
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {}
+            for name, (count, total, low, high, recent) in \
+                    self._histograms.items():
+                values = sorted(recent)
+                histograms[name] = {
+                    "count": count, "sum": total, "min": low, "max": high,
+                    "p50": values[int(0.5 * (len(values) - 1))],
+                    "p99": values[int(0.99 * (len(values) - 1))]}
+        return {"counters": counters, "histograms": histograms}
+
+
+class StatsdSink(object):
+    """Sends every value to a StatsD daemon over UDP, dropping any that
+    can't be sent
+
+    :param address: (host, port) of the daemon.
+    :type address: tuple
+    :param prefix: prefix of every name.
+    :type prefix: string
+    """
+    def __init__(self, address, prefix="hrmc"):
+        self.address = address
+        self.prefix = prefix and prefix + "." or ""
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def _send(self, line):
+        try:
+            self._socket.sendto((self.prefix + line).encode("utf-8"),
+                                self.address)
+        except (socket.error, socket.gaierror):
+            pass
+
+    def timing(self, name, seconds):
+        self._send("%s:%.3f|ms" % (name, seconds * 1000))
+
+    def incr(self, name, count=1):
+        self._send("%s:%d|c" % (name, count))
+
+    def observe(self, name, value):
+        self._send("%s:%s|h" % (name, value))
+
+    def close(self):
+        self._socket.close()
+
+
+_sink = None
+_sink_config = None
+_sink_lock = threading.Lock()
+
+
+def _config():
+    return (getattr(settings, 'HRMC_INSTRUMENT_SINK', None),
+            getattr(settings, 'HRMC_STATSD_ADDRESS', '127.0.0.1:8125'),
+            getattr(settings, 'HRMC_STATSD_PREFIX', 'hrmc'))
+
+
+def get_sink():
+    """Returns the sink configured in settings, or None"""
+    global _sink, _sink_config
+    config = _config()
+    if config == _sink_config:
+        return _sink
+    with _sink_lock:
+        if config != _sink_config:
+            name, address, prefix = config
+            if name is None:
+                sink = None
+            elif name == 'log':
+                sink = LogSink()
+            elif name == 'memory':
+                sink = MemorySink()
+            elif name == 'statsd':
+                host, port = address.rsplit(":", 1)
+                sink = StatsdSink((host, int(port)), prefix)
+            else:
+                raise ValueError("unknown HRMC_INSTRUMENT_SINK %r" % name)
+            if hasattr(_sink, 'close'):
+                _sink.close()
+            _sink, _sink_config = sink, config
+        return _sink
+
+
+class _Timer(object):
+
+    def __init__(self, sink, name):
+        self.sink = sink
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.sink.timing(self.name, time.time() - self.start)
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_null_timer = _NullTimer()
+
+
+def timer(name):
+    """Returns a context manager timing its block as name"""
+    sink = get_sink()
+    if sink is None:
+        return _null_timer
+    return _Timer(sink, name)
+
+
+def timed(name):
+    """Decorator timing every call of a function as name"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def incr(name, count=1):
+    """Adds count to the counter name"""
+    sink = get_sink()
+    if sink is not None:
+        sink.incr(name, count)
+
+
+def observe(name, value):
+    """Records value in the histogram name"""
+    sink = get_sink()
+    if sink is not None:
+        sink.observe(name, value)
+
+
+def snapshot():
+    """Returns :meth:`MemorySink.snapshot` of the memory sink, or None if
+    another sink is configured
+    """
+    sink = get_sink()
+    if isinstance(sink, MemorySink):
+        return sink.snapshot()
+    return None
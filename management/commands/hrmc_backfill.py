@@ -0,0 +1,168 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+hrmc_backfill.py
+
+Renders the plot of every HRMC dataset that doesn't have one yet and
+records its fit metrics.
+
+"""
+import multiprocessing
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from tardis.tardis_portal.models import Schema, ParameterName
+from tardis.tardis_portal.models import DatasetParameterSet
+from tardis.tardis_portal.models import DatasetParameter, Dataset_File
+
+from tardis.apps.hrmc_views.metrics import METRICS
+from tardis.apps.hrmc_views.plots import HRMC_DATASET_SCHEMA
+from tardis.apps.hrmc_views.plots import pick_plot_files
+from tardis.apps.hrmc_views.plotstore import KEY_PATTERN
+from tardis.apps.hrmc_views.renderqueue import make_job, render_job
+from tardis.apps.hrmc_views.schemacache import get_schema
+from tardis.apps.hrmc_views.schemacache import get_parameter_name
+
+
+class Command(BaseCommand):
+    args = '[dataset_id ...]'
+    help = ("Renders plots for HRMC datasets that don't have one, "
+            "optionally only the datasets given.  Safe to interrupt and "
+            "run again; finished plots are kept and not rendered twice.")
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', type='int',
+                    default=multiprocessing.cpu_count(),
+                    help='render processes [default: %default]'),
+        make_option('--batch-size', type='int', default=100,
+                    help='plots saved per transaction [default: %default]'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            sch = get_schema(HRMC_DATASET_SCHEMA)
+            pn = get_parameter_name(sch, "plot")
+        except (Schema.DoesNotExist, ParameterName.DoesNotExist):
+            raise CommandError("hrmc schema or its plot parameter missing")
+        metric_names = {}
+        for name in METRICS:
+            try:
+                metric_names[name] = get_parameter_name(sch, name)
+            except ParameterName.DoesNotExist:
+                pass
+
+        # plots stored base64 encoded in the database by old versions
+        # count as missing
+        plotted = DatasetParameter.objects.filter(
+            name=pn, string_value__regex=KEY_PATTERN)
+        pslist = DatasetParameterSet.objects.filter(schema=sch) \
+            .exclude(id__in=plotted.values('parameterset_id'))
+        if args:
+            pslist = pslist.filter(dataset__id__in=[int(a) for a in args])
+        # dataset id -> parameterset id, oldest dataset first
+        parametersets = dict(pslist.values_list('dataset_id', 'id'))
+        dataset_ids = sorted(parametersets)
+        self.stdout.write("%d datasets without a plot\n" % len(dataset_ids))
+        if not dataset_ids:
+            return
+
+        batch_size = options['batch_size']
+        # forked workers must not share this process' connection
+        connection.close()
+        pool = multiprocessing.Pool(options['processes'])
+        start = time.time()
+        done = failed = 0
+        try:
+            for i in range(0, len(dataset_ids), batch_size):
+                batch = []
+                jobs = self._jobs(dataset_ids[i:i + batch_size])
+                for dataset_id, key, error, metrics in pool.imap_unordered(
+                        render_job, jobs):
+                    if error:
+                        failed += 1
+                        self.stderr.write("dataset %s failed\n%s\n"
+                                          % (dataset_id, error))
+                    else:
+                        batch.append((parametersets[dataset_id], key,
+                                      metrics))
+                done += self._save(batch, pn, metric_names)
+                self._progress(done, failed, len(dataset_ids), start)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _jobs(self, dataset_ids):
+        """Returns the render jobs of dataset_ids, skipping datasets
+        missing a data file or whose files aren't verified yet.
+        """
+        plot_files = Q(filename__contains="grexp.dat") | \
+            Q(filename__startswith="grfinal")
+        files = dict((dataset_id, []) for dataset_id in dataset_ids)
+        for df in Dataset_File.objects.filter(plot_files,
+                                              dataset__id__in=dataset_ids) \
+                                      .order_by('id'):
+            files[df.dataset_id].append(df)
+        jobs = []
+        for dataset_id in dataset_ids:
+            grexp_file, grfinal_files = pick_plot_files(files[dataset_id])
+            if grexp_file and grfinal_files:
+                job = make_job(dataset_id, grexp_file, grfinal_files)
+                if job is not None:
+                    jobs.append(job)
+        return jobs
+
+    @transaction.commit_on_success
+    def _save(self, batch, pn, metric_names):
+        """Saves a batch of (parameterset id, key, metrics) plots and their
+        fit metrics in one transaction, replacing old base64 plots and
+        skipping any saved meanwhile by the render queue.  Returns the
+        number saved.
+        """
+        if not batch:
+            return 0
+        existing = set(DatasetParameter.objects.filter(
+            name=pn, string_value__regex=KEY_PATTERN,
+            parameterset__id__in=[ps_id for ps_id, key, m in batch])
+            .values_list('parameterset_id', flat=True))
+        batch = [item for item in batch if item[0] not in existing]
+        ps_ids = [ps_id for ps_id, key, m in batch]
+        DatasetParameter.objects.filter(
+            name__in=[pn] + list(metric_names.values()),
+            parameterset__id__in=ps_ids).delete()
+        params = []
+        for ps_id, key, metrics in batch:
+            params.append(DatasetParameter(parameterset_id=ps_id, name=pn,
+                                           string_value=key))
+            params.extend(DatasetParameter(parameterset_id=ps_id,
+                                           name=metric_names[name],
+                                           numerical_value=value)
+                          for name, value in sorted(metrics.items())
+                          if name in metric_names)
+        DatasetParameter.objects.bulk_create(params)
+        return len(batch)
+
+    def _progress(self, done, failed, total, start):
+        elapsed = max(time.time() - start, 1e-6)
+        self.stdout.write("%d/%d plots saved, %d failed, %.1f plots/s\n"
+                          % (done, total, failed, (done + failed) / elapsed))
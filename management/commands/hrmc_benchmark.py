@@ -0,0 +1,131 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+"""
+hrmc_benchmark.py
+
+Benchmarks each stage of taking synthetic HRMC datasets from upload to
+page, see :mod:`benchmarks.pipeline`, in a scratch database and file
+store.
+
+"""
+import json
+import os
+import shutil
+import tempfile
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from tardis.apps.hrmc_views import schemacache
+from tardis.apps.hrmc_views.benchmarks.pipeline import PipelineError
+from tardis.apps.hrmc_views.benchmarks.pipeline import compare
+from tardis.apps.hrmc_views.benchmarks.pipeline import format_results
+from tardis.apps.hrmc_views.benchmarks.pipeline import run_pipeline
+
+
+class Command(BaseCommand):
+    help = ("Times the ingest filter, parsing, rendering, encoding and "
+            "views over synthetic HRMC datasets, recording wall time, peak "
+            "RSS and queries of each.  Runs in a new test database and a "
+            "temporary file store, leaving the real ones alone.")
+    option_list = BaseCommand.option_list + (
+        make_option('--datasets', type='int', default=3,
+                    help='datasets to create [default: %default]'),
+        make_option('--files', type='int', default=None,
+                    help='files per dataset [default: --iterations + 1]'),
+        make_option('--rows', type='int', default=10000,
+                    help='rows per data file [default: %default]'),
+        make_option('--iterations', type='int', default=3,
+                    help='grfinalNN.dat calculations per dataset '
+                         '[default: %default]'),
+        make_option('--all-calculations', action='store_true',
+                    default=False,
+                    help='plot every calculation, not only the last'),
+        make_option('--seed', type='int', default=0,
+                    help='seed of the synthetic data [default: %default]'),
+        make_option('--format', type='choice', choices=['text', 'json'],
+                    default='text',
+                    help='text or json results [default: %default]'),
+        make_option('--output',
+                    help='also write the json results to this file'),
+        make_option('--baseline',
+                    help='json results of an earlier run; fails if a stage '
+                         'is now slower or makes more queries'),
+        make_option('--tolerance', type='float', default=0.25,
+                    help='fraction slower than the baseline allowed '
+                         '[default: %default]'),
+    )
+
+    def handle(self, *args, **options):
+        files, iterations = options['files'], options['iterations']
+        if iterations < 1:
+            raise CommandError("--iterations must be at least 1")
+        if files is not None and files < iterations + 1:
+            raise CommandError("--files must be at least --iterations + 1")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        results = self._run(options)
+
+        text = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text + "\n")
+        if options['format'] == 'json':
+            self.stdout.write(text + "\n")
+        else:
+            self.stdout.write(format_results(results))
+        if baseline is not None:
+            try:
+                regressions = compare(results, baseline,
+                                      options['tolerance'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            if regressions:
+                raise CommandError("slower than the baseline:\n%s"
+                                   % "\n".join(regressions))
+
+    def _run(self, options):
+        tmpdir = tempfile.mkdtemp(prefix="hrmc_benchmark")
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(
+                    FILE_STORE_PATH=tmpdir,
+                    HRMC_PLOT_STORE=os.path.join(tmpdir, "hrmc_plots"),
+                    HRMC_SERIES_CACHE=os.path.join(tmpdir, "hrmc_series"),
+                    HRMC_RENDER_QUEUE="local",
+                    HRMC_RENDER_PROCESSES=0,
+                    HRMC_FILTER_QUIET_PERIOD=0,
+                    HRMC_PLOT_ALL_CALCULATIONS=options['all_calculations']):
+                return run_pipeline(options['datasets'], options['files'],
+                                    options['rows'], options['iterations'],
+                                    options['seed'])
+        except PipelineError as e:
+            raise CommandError(str(e))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            # drop schemas looked up in the scratch database
+            schemacache.clear()
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,178 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+"""
+hrmc_loadtest.py
+
+Load tests the HRMC dataset page with concurrent clients, see
+:mod:`benchmarks.loadtest`, against a scratch SQLite database and file
+store seeded with synthetic datasets.
+
+"""
+import json
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+# installed into the portal's filters, see the README
+from tardis.tardis_portal.filters.hrmc import HRMCOutput
+from tardis.tardis_portal.models import DatasetParameter
+
+from tardis.apps.hrmc_views import schemacache
+from tardis.apps.hrmc_views.benchmarks.loadtest import RESULTS_VERSION
+from tardis.apps.hrmc_views.benchmarks.loadtest import format_results
+from tardis.apps.hrmc_views.benchmarks.loadtest import run_scenario
+from tardis.apps.hrmc_views.plots import HRMC_DATASET_SCHEMA
+from tardis.apps.hrmc_views.renderqueue import get_queue
+from tardis.apps.hrmc_views.synthetic import add_datafiles
+from tardis.apps.hrmc_views.synthetic import create_dataset
+from tardis.apps.hrmc_views.synthetic import create_experiment
+
+
+class Command(BaseCommand):
+    help = ("Opens the pages of synthetic HRMC datasets with concurrent "
+            "clients, first before their plots are rendered and again "
+            "after, reporting latency percentiles, throughput, bytes "
+            "served and renders.  Runs against a new SQLite database and "
+            "a temporary file store, so needs SQLite settings such as "
+            "--settings=tardis.test_settings.")
+    option_list = BaseCommand.option_list + (
+        make_option('--datasets', type='int', default=20,
+                    help='datasets to create [default: %default]'),
+        make_option('--clients', type='int', default=8,
+                    help='concurrent clients [default: %default]'),
+        make_option('--requests', type='int', default=20,
+                    help='pages each client opens in each run '
+                         '[default: %default]'),
+        make_option('--processes', type='int', default=2,
+                    help='render processes, 0 to render in the request '
+                         '[default: %default]'),
+        make_option('--rows', type='int', default=10000,
+                    help='rows per data file [default: %default]'),
+        make_option('--iterations', type='int', default=3,
+                    help='grfinalNN.dat calculations per dataset '
+                         '[default: %default]'),
+        make_option('--files', type='int', default=None,
+                    help='files per dataset [default: --iterations + 1]'),
+        make_option('--seed', type='int', default=0,
+                    help='seed of the synthetic data [default: %default]'),
+        make_option('--format', type='choice', choices=['text', 'json'],
+                    default='text',
+                    help='text or json results [default: %default]'),
+        make_option('--output',
+                    help='also write the json results to this file'),
+    )
+
+    def handle(self, *args, **options):
+        for name in ('datasets', 'clients', 'requests', 'iterations'):
+            if options[name] < 1:
+                raise CommandError("--%s must be at least 1" % name)
+        if options['files'] is not None and \
+                options['files'] < options['iterations'] + 1:
+            raise CommandError("--files must be at least --iterations + 1")
+        if connection.vendor != 'sqlite':
+            raise CommandError("the load test runs against SQLite, use "
+                               "SQLite settings such as "
+                               "--settings=tardis.test_settings")
+
+        tmpdir = tempfile.mkdtemp(prefix="hrmc_loadtest")
+        old_name = connection.settings_dict['NAME']
+        old_test_name = connection.settings_dict.get('TEST_NAME')
+        # a file, as every client thread opens its own connection and an
+        # in memory database isn't shared between connections
+        connection.settings_dict['TEST_NAME'] = os.path.join(
+            tmpdir, "hrmc_loadtest.sqlite")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(
+                    FILE_STORE_PATH=tmpdir,
+                    HRMC_PLOT_STORE=os.path.join(tmpdir, "hrmc_plots"),
+                    HRMC_SERIES_CACHE=os.path.join(tmpdir, "hrmc_series"),
+                    HRMC_RENDER_QUEUE="local",
+                    HRMC_RENDER_PROCESSES=options['processes'],
+                    HRMC_FILTER_QUIET_PERIOD=0,
+                    DEBUG=False,
+                    DATASET_VIEWS=[(HRMC_DATASET_SCHEMA,
+                        "tardis.apps.hrmc_views.views.view_full_dataset")]):
+                results = self._run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            connection.settings_dict['TEST_NAME'] = old_test_name
+            # drop schemas looked up in the scratch database
+            schemacache.clear()
+            shutil.rmtree(tmpdir)
+
+        text = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text + "\n")
+        if options['format'] == 'json':
+            self.stdout.write(text + "\n")
+        else:
+            self.stdout.write(format_results(results))
+
+    def _run(self, options):
+        experiment = create_experiment("hrmc_loadtest")
+        output = HRMCOutput("HRMC", HRMC_DATASET_SCHEMA, quiet_period=0)
+        queue = get_queue()
+        paths = []
+        for i in range(options['datasets']):
+            dataset, dest, filenames = create_dataset(
+                experiment, options['rows'], options['iterations'],
+                options['files'], options['seed'] + i)
+            # ingested under the dataset's claim, so rendering its plot is
+            # left to the first page view
+            queue.once(dataset.id, lambda: add_datafiles(
+                dataset, dest, filenames, output))
+            paths.append("/dataset/%d" % dataset.id)
+        self.stdout.write("seeded %d datasets\n" % len(paths))
+
+        scenarios = OrderedDict()
+        try:
+            for name in ("cold", "warm"):
+                before = self._plots()
+                run = run_scenario(paths, options['clients'],
+                                   options['requests'])
+                # the renders the run queued finish before they're counted
+                queue.close()
+                run["renders"] = self._plots() - before
+                scenarios[name] = run
+        finally:
+            queue.close()
+        return OrderedDict([
+            ("version", RESULTS_VERSION),
+            ("config", OrderedDict(
+                [(name, options[name]) for name in (
+                    'datasets', 'clients', 'requests', 'processes', 'rows',
+                    'iterations', 'seed')]
+                + [("files", options['files'] or options['iterations'] + 1)])),
+            ("scenarios", scenarios),
+        ])
+
+    def _plots(self):
+        """Returns the number of datasets with a plot"""
+        return DatasetParameter.objects.filter(
+            name__name="plot",
+            parameterset__schema__namespace=HRMC_DATASET_SCHEMA).count()
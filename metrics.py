@@ -0,0 +1,84 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+metrics.py
+
+How well a HRMC calculation fits the experiment.  The calculated g(r) is
+linearly interpolated onto the experiment's r values, over the range
+both cover, and compared point by point:
+
+``rfactor``
+    sqrt(sum((g_exp - g_calc)^2) / sum(g_exp^2))
+``chisquared``
+    sum((g_exp - g_calc)^2), with unit uncertainty on every point
+``rms``
+    sqrt(mean((g_exp - g_calc)^2))
+
+The names are those of the numeric parameters they are saved as on the
+hrmcdataset schema, see :func:`plots.save_metrics`.
+
+"""
+import math
+
+import numpy
+
+from tardis.apps.hrmc_views.seriescache import load_cached
+
+METRICS = ("rfactor", "chisquared", "rms")
+
+
+def fit_metrics(r_exp, g_exp, r_calc, g_calc):
+    """Returns a dict of METRICS comparing the calculated series to the
+    experimental one.  Empty if their r ranges don't overlap.
+    """
+    r_exp = numpy.asarray(r_exp, dtype=float)
+    g_exp = numpy.asarray(g_exp, dtype=float)
+    r_calc = numpy.asarray(r_calc, dtype=float)
+    g_calc = numpy.asarray(g_calc, dtype=float)
+    if not len(r_exp) or not len(r_calc):
+        return {}
+    if (numpy.diff(r_calc) < 0).any():
+        # interp needs increasing r
+        order = numpy.argsort(r_calc, kind="mergesort")
+        r_calc, g_calc = r_calc[order], g_calc[order]
+    inside = (r_exp >= r_calc[0]) & (r_exp <= r_calc[-1])
+    if not inside.any():
+        return {}
+    g = g_exp[inside]
+    diff = g - numpy.interp(r_exp[inside], r_calc, g_calc)
+    chisquared = float(numpy.dot(diff, diff))
+    norm = float(numpy.dot(g, g))
+    metrics = {"chisquared": chisquared,
+               "rms": math.sqrt(chisquared / len(diff))}
+    if norm:
+        metrics["rfactor"] = math.sqrt(chisquared / norm)
+    return metrics
+
+
+def file_metrics(grexp_path, grfinal_path, checksums=None):
+    """Returns the fit_metrics of the data files at the given paths, loaded
+    through :mod:`seriescache` with checksums as in
+    :meth:`render.PlotRenderer.file_curves`.
+    """
+    checksums = checksums or {}
+    r_exp, g_exp = load_cached(grexp_path, checksums.get(grexp_path))
+    r_calc, g_calc = load_cached(grfinal_path, checksums.get(grfinal_path))
+    return fit_metrics(r_exp, g_exp, r_calc, g_calc)
@@ -0,0 +1,243 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+plots.py
+
+Finding the data files of a HRMC dataset and recording its plot against
+the dataset.  Shared by the dataset view and the render queue.
+
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.core.exceptions import MultipleObjectsReturned
+from django.db import transaction
+
+from tardis.tardis_portal.models import Dataset, Schema, DatasetParameterSet
+from tardis.tardis_portal.models import ParameterName, DatasetParameter
+from tardis.tardis_portal.models import Dataset_File
+
+from tardis.apps.hrmc_views.plotstore import is_plot_key
+from tardis.apps.hrmc_views.schemacache import get_schema
+from tardis.apps.hrmc_views.schemacache import get_parameter_name
+
+logger = logging.getLogger(__name__)
+
+# TODO: contextual view should pass info about DATASET view to its view
+HRMC_DATASET_SCHEMA = "http://rmit.edu.au/schemas/hrmcdataset"
+
+_GRFINAL = re.compile(r"grfinal(\d+)\.dat")
+
+
+def calculation_number(filename):
+    """Returns the NN of a grfinalNN.dat filename, or None"""
+    mat = _GRFINAL.match(filename)
+    if mat:
+        return int(mat.group(1))
+    return None
+
+
+def plot_label(grfinal_filename):
+    """Legend label of a grfinalNN.dat calculation"""
+    number = calculation_number(grfinal_filename)
+    if number is not None:
+        return "Calculation %s" % number
+    return grfinal_filename
+
+
+def get_plot_parameterset(dataset):
+    """Returns (schema, parameterset) of the hrmc schema for dataset, or
+    None if either is missing.
+    """
+    try:
+        sch = get_schema(HRMC_DATASET_SCHEMA)
+    except Schema.DoesNotExist:
+        logger.debug("no hrmc schema")
+        return None
+    except MultipleObjectsReturned:
+        logger.error("multiple hrmc schemas returned")
+        return None
+    #FIXME: possible that more than once dataset can appear, so pick only one.
+    try:
+        ps = DatasetParameterSet.objects.get(schema=sch, dataset=dataset)
+    except DatasetParameterSet.DoesNotExist:
+        logger.debug("datset parameterset not found")
+        return None
+    except MultipleObjectsReturned:
+        logger.error("multiple dataset paramter sets returned")
+        # NB: If admin tool added additional param set,
+        # we know that all data will be the same for this schema
+        # so can safely delete any extras we find.
+        pslist = [x.id for x in DatasetParameterSet.objects.filter(schema=sch,
+            dataset=dataset)]
+        logger.debug("pslist=%s" % pslist)
+        DatasetParameterSet.objects.filter(id__in=pslist[1:]).delete()
+        ps = DatasetParameterSet.objects.get(id=pslist[0])
+    logger.debug("found ps=%s" % ps)
+    return sch, ps
+
+
+def lock_dataset(dataset_id):
+    """Locks the row of dataset_id until the current transaction ends, so
+    callers doing the same get-or-create on its parameters take turns.
+    A no-op on SQLite, which only ever has one writer anyway.
+    """
+    list(Dataset.objects.select_for_update().filter(id=dataset_id)
+         .values_list('id', flat=True))
+
+
+def get_or_create_parameterset(sch, dataset_id):
+    """Returns (parameterset, created) of schema sch for dataset_id.
+
+    The dataset row is locked first, so callers racing on a new dataset
+    create one parameter set between them rather than one each.
+    """
+    if transaction.is_managed():
+        # the caller's transaction holds the lock until it commits
+        return _get_or_create_parameterset(sch, dataset_id)
+    with transaction.commit_on_success():
+        return _get_or_create_parameterset(sch, dataset_id)
+
+
+def _get_or_create_parameterset(sch, dataset_id):
+    lock_dataset(dataset_id)
+    pslist = list(DatasetParameterSet.objects.filter(
+        schema=sch, dataset__id=dataset_id).order_by('id'))
+    if not pslist:
+        ps = DatasetParameterSet(schema=sch, dataset_id=dataset_id)
+        ps.save()
+        return ps, True
+    if len(pslist) > 1:
+        # left by versions that created them without the lock; all data
+        # is the same for this schema so the extras can go
+        logger.warn("removing extra parameter sets of %s" % dataset_id)
+        DatasetParameterSet.objects.filter(
+            id__in=[x.id for x in pslist[1:]]).delete()
+    return pslist[0], False
+
+
+def _first_plot(params):
+    for param in params:
+        if not is_plot_key(param.string_value):
+            # plots used to be stored base64 encoded in the database;
+            # drop those so the dataset is rendered into the store
+            logger.info("discarding inline plot parameter %s" % param.id)
+            param.delete()
+            continue
+        logger.debug("found existing image")
+        return param
+    return None
+
+
+def get_plot_parameter(ps):
+    """Returns the existing plot parameter of ps, or None"""
+    return _first_plot(DatasetParameter.objects.filter(
+        parameterset=ps, name__name__contains="plot").select_related('name'))
+
+
+def find_plot_parameter(dataset):
+    """Returns the existing plot parameter of dataset, or None, in a single
+    query once the schema is cached.
+    """
+    try:
+        sch = get_schema(HRMC_DATASET_SCHEMA)
+    except Schema.DoesNotExist:
+        logger.debug("no hrmc schema")
+        return None
+    except MultipleObjectsReturned:
+        logger.error("multiple hrmc schemas returned")
+        return None
+    return _first_plot(DatasetParameter.objects.filter(
+        parameterset__schema=sch, parameterset__dataset=dataset,
+        name__name__contains="plot").select_related('name'))
+
+
+def pick_plot_files(datafiles):
+    """Returns the grexp Dataset_File among datafiles and a list of the
+    grfinal ones to plot, ordered by calculation number.  Only the last
+    calculation is plotted unless HRMC_PLOT_ALL_CALCULATIONS is set.  The
+    grexp file is None and the list empty if there aren't any.
+    """
+    grfinal_files = []
+    grexp_file = None
+    for df in datafiles:
+        logger.debug("testing %s" % df.filename)
+        if "grexp.dat" in df.filename:
+            grexp_file = df
+        if df.filename.startswith("grfinal"):
+            grfinal_files.append(df)
+    grfinal_files.sort(key=lambda df: (calculation_number(df.filename),
+                                       df.filename))
+    if not getattr(settings, 'HRMC_PLOT_ALL_CALCULATIONS', False):
+        grfinal_files = grfinal_files[-1:]
+    return grexp_file, grfinal_files
+
+
+def find_plot_files(dataset):
+    """Returns the grexp Dataset_File of dataset and a list of grfinal
+    ones to plot, as :func:`pick_plot_files`.
+    """
+    return pick_plot_files(Dataset_File.objects.filter(dataset=dataset))
+
+
+def save_metrics(sch, ps, metrics):
+    """Records metrics, a dict of numbers by parameter name, as numeric
+    parameters of ps, replacing any it had.  Names the schema doesn't have
+    are skipped.
+    """
+    names = []
+    for name, value in sorted(metrics.items()):
+        try:
+            names.append((get_parameter_name(sch, name), value))
+        except ParameterName.DoesNotExist:
+            logger.debug("schema is missing %s parameter" % name)
+    if not names:
+        return []
+    DatasetParameter.objects.filter(
+        parameterset=ps, name__in=[pn for pn, value in names]).delete()
+    params = [DatasetParameter(parameterset=ps, name=pn,
+                               numerical_value=value)
+              for pn, value in names]
+    DatasetParameter.objects.bulk_create(params)
+    return params
+
+
+def save_plot(sch, ps, key):
+    """Records the plot stored under key as the plot parameter of ps and
+    returns the parameter.
+    """
+    try:
+        pn = get_parameter_name(sch, "plot")
+    except ParameterName.DoesNotExist:
+        logger.error("schema is missing plot parameter")
+        return None
+    except MultipleObjectsReturned:
+        logger.error("schema is multiple plot parameters")
+        return None
+
+    logger.debug("ready to save")
+
+    dfp = DatasetParameter(parameterset=ps,
+                                    name=pn)
+    dfp.string_value = key
+    dfp.save()
+    return dfp
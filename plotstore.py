@@ -0,0 +1,335 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+plotstore.py
+
+Rendered plots stored as image files named by a key derived from the
+sha512sums of the data files they were drawn from, so identical data is
+only ever rendered once.
+
+Settings:
+
+``HRMC_PLOT_STORE``
+    directory holding the plots, default ``hrmc_plots`` in
+    ``FILE_STORE_PATH``.
+
+``HRMC_PLOT_STORE_QUOTA``
+    bytes the store may hold, default None for no limit.  Over the quota
+    the least recently used plots are deleted, every size and format of
+    a plot together, until it is back under 90% of it.  Each process
+    counts what it writes and rescans the store at least every minute,
+    so writes from other processes can take it over the quota briefly.
+    Deleted plots are rendered again when next asked for.
+
+``HRMC_PLOT_WEBP``
+    also store webp versions of every size, needs Pillow.  Default False.
+
+``HRMC_RENDER_BACKEND``
+    ``matplotlib`` (the default) or ``raster`` to draw plots with the numpy
+    rasterizer in :mod:`rasterize`, falling back to matplotlib for plots it
+    can't draw.  Part of the key, so switching re-renders every plot.
+
+"""
+import errno
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from tardis.apps.hrmc_views.instrument import incr
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever rendering changes so old plots are not served for new code.
+RENDER_VERSION = "3"
+
+BACKENDS = ("matplotlib", "raster")
+
+# a store key, also usable in __regex lookups
+KEY_PATTERN = r"^[0-9a-f]{40}$"
+_KEY = re.compile(KEY_PATTERN)
+
+# a plot's last use is only written if older than this many seconds
+TOUCH_INTERVAL = 60
+# seconds between scans of the whole store while under the quota
+SCAN_INTERVAL = 60
+# fraction of the quota eviction brings the store down to
+EVICT_TO = 0.9
+# seconds a plot without its full size png is taken to still be being
+# written, and left out of eviction
+WRITE_GRACE = 600
+
+_lock = threading.Lock()
+# store root -> [bytes stored at the last scan plus written since, time
+# of the last scan], in this process
+_usage = {}
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'evicted_bytes': 0,
+          'scans': 0}
+
+
+def _count(name, value=1):
+    with _lock:
+        _stats[name] += value
+    incr("store.%s" % name, value)
+
+
+def stats():
+    """Returns a dict of the hit, miss, eviction and scan counts of this
+    process, with the bytes evicted
+    """
+    with _lock:
+        return dict(_stats)
+
+
+def render_backend():
+    """Returns the configured rendering backend"""
+    backend = getattr(settings, 'HRMC_RENDER_BACKEND', 'matplotlib')
+    if backend not in BACKENDS:
+        raise ValueError("unknown HRMC_RENDER_BACKEND %r" % backend)
+    return backend
+
+
+def plot_key(datafiles, checksums=None):
+    """Returns the store key of the plot drawn from datafiles, whose
+    sha512sums may be given in the same order as checksums, otherwise their
+    stored ones.
+
+    Filenames are part of the key as they end up in the plot legend.
+    """
+    if checksums is None:
+        checksums = [df.sha512sum for df in datafiles]
+    lines = ["%s %s" % (df.filename, checksum)
+             for df, checksum in zip(datafiles, checksums)]
+    lines.append("version %s %s" % (RENDER_VERSION, render_backend()))
+    return hashlib.sha1("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def is_plot_key(value):
+    """True if value is a store key rather than an old base64 plot"""
+    return bool(value) and _KEY.match(value) is not None
+
+
+def atomic_write(path, data):
+    """Writes data to path, creating its directory if needed.  The data
+    goes to a temporary file renamed into place, so readers never see a
+    partial file.
+    """
+    dirname = os.path.dirname(path)
+    if not os.path.exists(dirname):
+        try:
+            os.makedirs(dirname)
+        except OSError:
+            # another worker created it first
+            if not os.path.isdir(dirname):
+                raise
+    fd, tmp = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.rename(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+
+class PlotStore(object):
+    """Directory of plots sharded by the first two characters of their
+    key.  Each plot is stored in several sizes and formats; the full size
+    png is key.png and the others key.size.format.
+
+    :param root: directory to store plots in, created if missing.
+    :type root: string
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key, size="full", format="png"):
+        """Returns the file path of key, which need not exist"""
+        if size == "full" and format == "png":
+            name = "%s.png" % key
+        else:
+            name = "%s.%s.%s" % (key, size, format)
+        return os.path.join(self.root, key[:2], name)
+
+    def exists(self, key, size="full", format="png"):
+        return os.path.exists(self.path(key, size, format))
+
+    def find(self, key, size="full", format="png"):
+        """Returns the path of the stored size and format of key, or None.
+        The full size png stands in for the other png sizes of plots
+        stored before there were any.
+        """
+        path = self.path(key, size, format)
+        if os.path.exists(path):
+            return path
+        if format == "png" and self.exists(key):
+            return self.path(key)
+        return None
+
+    def open(self, key, size="full", format="png"):
+        """Opens the stored size and format of key, as :meth:`find` finds
+        it, for reading and marks the plot used.  Raises IOError if it
+        isn't stored.
+        """
+        path = self.find(key, size, format)
+        try:
+            if path is None:
+                raise IOError(errno.ENOENT, "plot not stored", key)
+            f = open(path, "rb")
+        except IOError:
+            _count('misses')
+            raise
+        _count('hits')
+        self.touch(key)
+        return f
+
+    def touch(self, key):
+        """Marks key used now, setting the access time of its full size png
+        so it is evicted after plots used less recently.  Done explicitly
+        as file systems are often mounted noatime.
+        """
+        path = self.path(key)
+        try:
+            st = os.stat(path)
+            now = time.time()
+            if now - st.st_atime > TOUCH_INTERVAL:
+                # the modification time is the plot's Last-Modified
+                os.utime(path, (now, st.st_mtime))
+        except OSError:
+            pass
+
+    def put(self, key, data, size="full", format="png"):
+        """Stores the data of one size and format of key"""
+        self._put(key, data, size, format)
+        self._wrote(len(data))
+
+    def _put(self, key, data, size="full", format="png"):
+        atomic_write(self.path(key, size, format), data)
+        logger.debug("stored plot %s %s %s" % (key, size, format))
+
+    def put_images(self, key, images):
+        """Stores images, a dict of {(size, format): data}.  The full size
+        png goes last as :meth:`exists` takes it to mean the plot is
+        complete.
+        """
+        for (size, format), data in images.items():
+            if (size, format) != ("full", "png"):
+                self._put(key, data, size, format)
+        self._put(key, images[("full", "png")])
+        self._wrote(sum(len(data) for data in images.values()))
+
+    def delete(self, key):
+        """Deletes every size and format of key, the full size png first
+        so a plot with sizes missing is never taken as complete
+        """
+        path = self.path(key)
+        dirname = os.path.dirname(path)
+        try:
+            names = [name for name in os.listdir(dirname)
+                     if name.startswith(key + ".")]
+        except OSError:
+            return
+        names.sort(key=lambda name: name != os.path.basename(path))
+        for name in names:
+            try:
+                os.remove(os.path.join(dirname, name))
+            except OSError:
+                # deleted by another process
+                pass
+
+    def usage(self):
+        """Returns {key: (bytes, last used)} of every plot in the store,
+        last used being the access time of its full size png.  Plots
+        without one are left out while their files are newer than
+        WRITE_GRACE, as they are still being written, and after that have
+        a last use of 0 so they are evicted first.
+        """
+        plots = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for name in filenames:
+                key = name.split(".", 1)[0]
+                if name.endswith(".tmp") or not is_plot_key(key):
+                    continue
+                try:
+                    st = os.stat(os.path.join(dirpath, name))
+                except OSError:
+                    continue
+                size, used, written = plots.get(key, (0, None, 0))
+                if name == key + ".png":
+                    used = st.st_atime
+                plots[key] = (size + st.st_size, used,
+                              max(written, st.st_mtime))
+        now = time.time()
+        return dict((key, (size, used or 0))
+                    for key, (size, used, written) in plots.items()
+                    if used is not None or now - written > WRITE_GRACE)
+
+    def evict(self, quota):
+        """Deletes the least recently used plots until the store holds no
+        more than EVICT_TO of quota bytes, if it holds more than quota.
+        Returns the bytes left.
+        """
+        plots = self.usage()
+        total = sum(size for size, used in plots.values())
+        _count('scans')
+        if total <= quota:
+            return total
+        evicted = 0
+        for key, (size, used) in sorted(plots.items(),
+                                        key=lambda item: item[1][1]):
+            if total <= quota * EVICT_TO:
+                break
+            self.delete(key)
+            total -= size
+            evicted += size
+            _count('evictions')
+        _count('evicted_bytes', evicted)
+        logger.info("evicted %d bytes of plots from %s" % (evicted,
+                                                           self.root))
+        return total
+
+    def _wrote(self, size):
+        """Evicts plots if writing size bytes may have taken the store over
+        its quota, or it hasn't been scanned for a while
+        """
+        quota = getattr(settings, 'HRMC_PLOT_STORE_QUOTA', None)
+        if not quota:
+            return
+        with _lock:
+            usage = _usage.get(self.root)
+            if usage is not None and usage[0] + size <= quota and \
+                    time.time() - usage[1] < SCAN_INTERVAL:
+                usage[0] += size
+                return
+        total = self.evict(quota)
+        with _lock:
+            _usage[self.root] = [total, time.time()]
+
+
+def get_store():
+    """Returns the PlotStore configured in settings"""
+    return PlotStore(getattr(settings, 'HRMC_PLOT_STORE',
+        os.path.join(settings.FILE_STORE_PATH, 'hrmc_plots')))
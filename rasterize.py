@@ -0,0 +1,378 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+rasterize.py
+
+Draws the fixed layout of a HRMC plot (line and marker series on linear
+axes with a grid, tick labels, axis labels and a legend) straight into a
+numpy pixel buffer and encodes it as a png with zlib.  Much cheaper than
+matplotlib for the plots this app makes; anything else raises
+:class:`Unsupported` so the caller can fall back to matplotlib.
+
+The layout follows matplotlib's defaults: subplot margins, 5% data
+margins, 1.5pt lines, 6pt markers and 10pt text, with text drawn from a
+built in 5x7 bitmap font.
+
+"""
+import math
+import struct
+import zlib
+
+import numpy
+
+
+class Unsupported(Exception):
+    """Raised for plots the rasterizer can't draw"""
+
+
+NAMED_COLORS = {
+    "black": (0, 0, 0),
+    "blue": (0, 0, 255),
+    "red": (255, 0, 0),
+    "white": (255, 255, 255),
+}
+GRID_COLOR = (176, 176, 176)
+LEGEND_EDGE_COLOR = (204, 204, 204)
+
+# 5x7 glyphs, rows top to bottom
+_GLYPHS = {
+    "0": ".###. #...# #..## #.#.# ##..# #...# .###.",
+    "1": "..#.. .##.. ..#.. ..#.. ..#.. ..#.. .###.",
+    "2": ".###. #...# ....# ...#. ..#.. .#... #####",
+    "3": "##### ...#. ..#.. ...#. ....# #...# .###.",
+    "4": "...#. ..##. .#.#. #..#. ##### ...#. ...#.",
+    "5": "##### #.... ####. ....# ....# #...# .###.",
+    "6": "..##. .#... #.... ####. #...# #...# .###.",
+    "7": "##### ....# ...#. ..#.. .#... .#... .#...",
+    "8": ".###. #...# #...# .###. #...# #...# .###.",
+    "9": ".###. #...# #...# .#### ....# ...#. .##..",
+    ".": "..... ..... ..... ..... ..... .##.. .##..",
+    "-": "..... ..... ..... ##### ..... ..... .....",
+    "(": "...#. ..#.. .#... .#... .#... ..#.. ...#.",
+    ")": ".#... ..#.. ...#. ...#. ...#. ..#.. .#...",
+    " ": "..... ..... ..... ..... ..... ..... .....",
+    "A": ".###. #...# #...# ##### #...# #...# #...#",
+    "C": ".###. #...# #.... #.... #.... #...# .###.",
+    "E": "##### #.... #.... ####. #.... #.... #####",
+    "a": "..... ..... .###. ....# .#### #...# .####",
+    "c": "..... ..... .###. #.... #.... #...# .###.",
+    "e": "..... ..... .###. #...# ##### #.... .###.",
+    "g": "..... .#### #...# #...# .#### ....# .###.",
+    "i": "..#.. ..... .##.. ..#.. ..#.. ..#.. .###.",
+    "l": ".##.. ..#.. ..#.. ..#.. ..#.. ..#.. .###.",
+    "m": "..... ..... ##.#. #.#.# #.#.# #...# #...#",
+    "n": "..... ..... #.##. ##..# #...# #...# #...#",
+    "o": "..... ..... .###. #...# #...# #...# .###.",
+    "p": "..... ..... ####. #...# ####. #.... #....",
+    "r": "..... ..... #.##. ##..# #.... #.... #....",
+    "s": "..... ..... .#### #.... .###. ....# ####.",
+    "t": ".#... .#... ###.. .#... .#... .#..# ..##.",
+    "u": "..... ..... #...# #...# #...# #..## .##.#",
+    "x": "..... ..... #...# .#.#. ..#.. .#.#. #...#",
+}
+FONT = dict((char, numpy.array([[c == "#" for c in row]
+                                for row in rows.split()]))
+            for char, rows in _GLYPHS.items())
+
+
+def _rgb(color):
+    """Returns color, a name, #rrggbb or a 0-1 float tuple, as 0-255 ints"""
+    if isinstance(color, tuple):
+        return tuple(int(round(255 * c)) for c in color[:3])
+    if color in NAMED_COLORS:
+        return NAMED_COLORS[color]
+    if color.startswith("#") and len(color) == 7:
+        return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+    raise Unsupported("color %r" % (color,))
+
+
+def _disk(radius):
+    """Returns the (dy, dx) pixel offsets of a filled disk"""
+    r = int(math.ceil(radius))
+    dy, dx = numpy.mgrid[-r:r + 1, -r:r + 1]
+    inside = dx * dx + dy * dy <= radius * radius + 0.25
+    return dy[inside], dx[inside]
+
+
+def _diamond(radius):
+    """Returns the (dy, dx) pixel offsets of a filled diamond"""
+    r = int(math.ceil(radius))
+    dy, dx = numpy.mgrid[-r:r + 1, -r:r + 1]
+    inside = numpy.abs(dx) + numpy.abs(dy) <= radius + 0.25
+    return dy[inside], dx[inside]
+
+
+def nice_ticks(lo, hi, most=9):
+    """Returns the tick step and positions between lo and hi at a 1, 2,
+    2.5 or 5 times a power of ten step giving at most `most` intervals
+    """
+    span = hi - lo
+    magnitude = 10 ** math.floor(math.log10(span / most))
+    for mult in (1, 2, 2.5, 5, 10):
+        step = mult * magnitude
+        if span / step <= most:
+            break
+    first = math.ceil(lo / step - 1e-9)
+    last = math.floor(hi / step + 1e-9)
+    return step, [i * step for i in range(int(first), int(last) + 1)]
+
+
+def _tick_format(step):
+    decimals = max(0, -int(math.floor(math.log10(step) + 1e-9)))
+    if round(step * 10 ** decimals) % 10 == 5 and step < 1:
+        decimals += 1
+    if step % 1 and decimals == 0:
+        decimals = 1
+    return "%%.%df" % decimals
+
+
+class _Canvas(object):
+
+    def __init__(self, width, height):
+        self.pixels = numpy.empty((height, width, 3), dtype=numpy.uint8)
+        self.pixels.fill(255)
+        self.clip = (0, 0, width, height)
+
+    def stamp(self, ys, xs, offsets, color):
+        """Draws the shape given by offsets centred on every point"""
+        dy, dx = offsets
+        yi = (numpy.round(ys).astype(int)[:, None] + dy[None, :]).ravel()
+        xi = (numpy.round(xs).astype(int)[:, None] + dx[None, :]).ravel()
+        x0, y0, x1, y1 = self.clip
+        keep = (xi >= x0) & (xi < x1) & (yi >= y0) & (yi < y1)
+        self.pixels[yi[keep], xi[keep]] = color
+
+    def polyline(self, xs, ys, color, width):
+        """Draws straight segments through the points, sampled at least
+        once per pixel
+        """
+        if len(xs) == 1:
+            self.stamp(ys, xs, _disk(width / 2.0), color)
+            return
+        dx = numpy.diff(xs)
+        dy = numpy.diff(ys)
+        steps = numpy.maximum(numpy.ceil(numpy.maximum(numpy.abs(dx),
+                                                       numpy.abs(dy))),
+                              1).astype(int)
+        seg = numpy.repeat(numpy.arange(len(dx)), steps)
+        within = numpy.arange(steps.sum()) - numpy.repeat(
+            numpy.cumsum(steps) - steps, steps)
+        frac = within / numpy.repeat(steps, steps).astype(float)
+        px = numpy.append(xs[seg] + dx[seg] * frac, xs[-1])
+        py = numpy.append(ys[seg] + dy[seg] * frac, ys[-1])
+        self.stamp(py, px, _disk(width / 2.0), color)
+
+    def fill(self, x0, y0, x1, y1, color):
+        self.pixels[max(y0, 0):y1, max(x0, 0):x1] = color
+
+    def rect(self, x0, y0, x1, y1, color, width=1):
+        self.fill(x0, y0, x1, y0 + width, color)
+        self.fill(x0, y1 - width, x1, y1, color)
+        self.fill(x0, y0, x0 + width, y1, color)
+        self.fill(x1 - width, y0, x1, y1, color)
+
+    def text(self, s, x, y, scale, color, anchor="left", rotate=False):
+        """Draws s with its anchor ("left", "center" or "right") at x and
+        its vertical centre at y.  Rotated text reads bottom to top and is
+        centred on x, y.
+        """
+        mask = text_mask(s, scale)
+        if rotate:
+            mask = numpy.rot90(mask)
+            x -= mask.shape[1] // 2
+            y -= mask.shape[0] // 2
+        else:
+            if anchor == "center":
+                x -= mask.shape[1] // 2
+            elif anchor == "right":
+                x -= mask.shape[1]
+            y -= mask.shape[0] // 2
+        h, w = mask.shape
+        if x < 0 or y < 0:
+            raise Unsupported("text %r doesn't fit" % s)
+        region = self.pixels[y:y + h, x:x + w]
+        region[mask[:region.shape[0], :region.shape[1]]] = color
+
+
+def text_mask(s, scale):
+    """Returns the boolean pixel mask of s in the bitmap font"""
+    if not s:
+        return numpy.zeros((7 * scale, 0), dtype=bool)
+    try:
+        glyphs = [FONT[c] for c in s]
+    except KeyError as e:
+        raise Unsupported("no glyph for %r" % e.args[0])
+    gap = numpy.zeros((7, 1), dtype=bool)
+    mask = numpy.hstack(sum([[g, gap] for g in glyphs], [])[:-1])
+    return numpy.kron(mask, numpy.ones((scale, scale), dtype=bool))
+
+
+def encode_png(pixels):
+    """Returns an RGB pixel array as png data"""
+    height, width = pixels.shape[:2]
+    rows = pixels.reshape(height, width * 3)
+    # every row with png's "up" filter, the difference from the row above,
+    # which leaves mostly zeros for zlib as plots repeat down the page
+    raw = numpy.empty((height, width * 3 + 1), dtype=numpy.uint8)
+    raw[:, 0] = 2
+    raw[0, 1:] = rows[0]
+    numpy.subtract(rows[1:], rows[:-1], out=raw[1:, 1:])
+
+    def chunk(tag, data):
+        return (struct.pack(">I", len(data)) + tag + data +
+                struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff))
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)),
+        chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)),
+        chunk(b"IEND", b""),
+    ])
+
+
+def downscale(pixels, longest):
+    """Returns an RGB pixel array shrunk so its longest side is at most
+    longest pixels, each output pixel the average of those it covers
+    """
+    height, width = pixels.shape[:2]
+    factor = float(max(height, width)) / longest
+    if factor <= 1:
+        return pixels
+    result = pixels.astype(numpy.uint32)
+    counts = []
+    for axis, size in enumerate((height, width)):
+        n = max(1, int(round(size / factor)))
+        starts = numpy.arange(n) * size // n
+        counts.append(numpy.diff(numpy.append(starts, size)))
+        result = numpy.add.reduceat(result, starts, axis=axis)
+    area = counts[0][:, None, None] * counts[1][None, :, None]
+    return ((result + area // 2) // area).astype(numpy.uint8)
+
+
+def render_png(curves, size, dpi, xlabel, ylabel):
+    """Returns a png of curves, as drawn by :func:`draw`"""
+    return encode_png(draw(curves, size, dpi, xlabel, ylabel))
+
+
+def draw(curves, size, dpi, xlabel, ylabel):
+    """Returns an RGB pixel array of curves, a list of (xs, ys, label,
+    color, marker) tuples, laid out as :class:`render.PlotRenderer` does
+    with matplotlib.  The x axis starts at 0.
+
+    :raises Unsupported: for anything outside the fixed layout.
+    """
+    width = int(round(size[0] * dpi))
+    height = int(round(size[1] * dpi))
+    pt = dpi / 72.0
+    scale = max(1, int(round(10 * pt / 7.0)))
+    canvas = _Canvas(width, height)
+
+    styled = []
+    for xs, ys, label, color, marker in curves:
+        xs = numpy.asarray(xs, dtype=float)
+        ys = numpy.asarray(ys, dtype=float)
+        if not len(xs) or not (numpy.isfinite(xs).all() and
+                               numpy.isfinite(ys).all()):
+            raise Unsupported("empty or non-finite series")
+        if marker not in (None, "o", "D"):
+            raise Unsupported("marker %r" % marker)
+        styled.append((xs, ys, label, _rgb(color), marker))
+    if not styled:
+        raise Unsupported("nothing to plot")
+
+    # data limits with matplotlib's 5% margins, x starting at 0
+    xmin = min(s[0].min() for s in styled)
+    xmax = max(s[0].max() for s in styled)
+    ymin = min(s[1].min() for s in styled)
+    ymax = max(s[1].max() for s in styled)
+    x0, x1 = 0.0, xmax + 0.05 * (xmax - xmin)
+    yspan = ymax - ymin or 1.0
+    y0, y1 = ymin - 0.05 * yspan, ymax + 0.05 * yspan
+    if x1 <= x0:
+        raise Unsupported("no positive r values")
+
+    # matplotlib's default subplot position
+    left, right = int(0.125 * width), int(0.9 * width)
+    top, bottom = int(0.12 * height), int(0.89 * height)
+
+    def to_x(x):
+        return left + (x - x0) * (right - left) / (x1 - x0)
+
+    def to_y(y):
+        return bottom - (y - y0) * (bottom - top) / (y1 - y0)
+
+    tick = int(round(3.5 * pt))
+    line = max(1, int(round(0.8 * pt)))
+    xstep, xticks = nice_ticks(x0, x1)
+    ystep, yticks = nice_ticks(y0, y1)
+    for x in xticks:
+        px = int(round(to_x(x)))
+        canvas.fill(px, top, px + line, bottom, GRID_COLOR)
+        canvas.fill(px, bottom, px + line, bottom + tick, (0, 0, 0))
+        canvas.text(_tick_format(xstep) % x, px, bottom + tick + 6 * scale,
+                    scale, (0, 0, 0), "center")
+    label_width = 0
+    for y in yticks:
+        py = int(round(to_y(y)))
+        label = _tick_format(ystep) % y
+        label_width = max(label_width, text_mask(label, scale).shape[1])
+        canvas.fill(left, py, right, py + line, GRID_COLOR)
+        canvas.fill(left - tick, py, left, py + line, (0, 0, 0))
+        canvas.text(label, left - tick - 3 * scale, py, scale, (0, 0, 0),
+                    "right")
+    canvas.text(xlabel, (left + right) // 2, bottom + tick + 18 * scale,
+                scale, (0, 0, 0), "center")
+    canvas.text(ylabel, left - tick - label_width - 8 * scale,
+                (top + bottom) // 2, scale, (0, 0, 0), rotate=True)
+
+    lw = 1.5 * pt
+    ms = 6 * pt / 2.0
+    markers = {"o": _disk(ms), "D": _diamond(ms * 1.2)}
+    canvas.clip = (left, top, right, bottom)
+    for xs, ys, label, color, marker in styled:
+        px, py = to_x(xs), to_y(ys)
+        canvas.polyline(px, py, color, lw)
+        if marker:
+            canvas.stamp(py, px, markers[marker], color)
+    canvas.clip = (0, 0, width, height)
+    canvas.rect(left, top, right + line, bottom + line, (0, 0, 0), line)
+
+    # legend in the upper right corner
+    rows = [(label, color, marker) for xs, ys, label, color, marker
+            in styled]
+    row_height = 12 * scale
+    text_width = max(text_mask(label, scale).shape[1]
+                     for label, color, marker in rows)
+    lx1 = right - 6 * scale
+    lx0 = lx1 - text_width - 26 * scale
+    ly0 = top + 6 * scale
+    ly1 = ly0 + row_height * len(rows) + 4 * scale
+    canvas.fill(lx0, ly0, lx1, ly1, (255, 255, 255))
+    canvas.rect(lx0, ly0, lx1, ly1, LEGEND_EDGE_COLOR, line)
+    for i, (label, color, marker) in enumerate(rows):
+        cy = ly0 + 2 * scale + row_height * i + row_height // 2
+        sx = numpy.array([lx0 + 4 * scale, lx0 + 18 * scale], dtype=float)
+        sy = numpy.array([cy, cy], dtype=float)
+        canvas.polyline(sx, sy, color, lw)
+        if marker:
+            canvas.stamp(sy[:1], sx.mean() + sy[:1] * 0, markers[marker],
+                         color)
+        canvas.text(label, lx0 + 22 * scale, cy, scale, (0, 0, 0))
+    return canvas.pixels
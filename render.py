@@ -0,0 +1,306 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+render.py
+
+Draws HRMC g(r) plots.  Each render builds its own Figure and Agg canvas
+and writes the png to memory, so renders share no pyplot state and can run
+on any number of threads at once.
+
+matplotlib and numpy are only imported by the first render, so processes
+that never draw a plot never pay for them.  With the ``raster`` backend
+(see :mod:`plotstore`) plots are drawn by :mod:`rasterize` instead and
+matplotlib is only imported for plots the rasterizer can't draw.
+
+"""
+import io
+import logging
+import os
+import pkgutil
+import threading
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+
+from tardis.apps.hrmc_views.instrument import timer
+from tardis.apps.hrmc_views.plots import plot_label
+from tardis.apps.hrmc_views.plotstore import render_backend
+
+logger = logging.getLogger(__name__)
+
+# True if matplotlib can be imported, found without importing it
+is_matplotlib_available = pkgutil.find_loader('matplotlib') is not None
+# webp versions of plots are written with Pillow
+is_pil_available = pkgutil.find_loader('PIL') is not None
+
+XLABEL = "r (Angstroms)"
+YLABEL = "g(r)"
+
+# earlier calculations shade between these, close to matplotlib's Blues
+# colormap at 0.2 and 0.8
+SHADE_FROM = (0.78, 0.86, 0.94)
+SHADE_TO = (0.13, 0.44, 0.71)
+
+# (name, longest side in pixels) of the sizes each plot is stored in, the
+# full size as drawn last
+IMAGE_SIZES = (("thumb", 350), ("medium", 800), ("full", None))
+
+_libs = None
+_data_libs = None
+_libs_lock = threading.RLock()
+
+
+def _load_data():
+    """Imports the numpy based modules on first use and returns them as
+    (load_cached, downsample, rasterize)
+    """
+    global _data_libs
+    with _libs_lock:
+        if _data_libs is None:
+            from tardis.apps.hrmc_views.seriescache import load_cached
+            from tardis.apps.hrmc_views.decimate import downsample
+            from tardis.apps.hrmc_views import rasterize
+            _data_libs = (load_cached, downsample, rasterize)
+        return _data_libs
+
+
+def _load():
+    """Imports and configures matplotlib on first use and returns
+    (Figure, FigureCanvasAgg)
+    """
+    global _libs
+    with _libs_lock:
+        if _libs is None:
+            logger.debug("importing matplotlib")
+            # keep matplotlib's config and font cache where it always was
+            # without changing HOME for the whole process
+            if hasattr(settings, 'MATPLOTLIB_HOME'):
+                os.environ.setdefault('MPLCONFIGDIR', os.path.join(
+                    settings.MATPLOTLIB_HOME, '.matplotlib'))
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            _libs = (Figure, FigureCanvasAgg)
+        return _libs
+
+
+def is_webp_enabled():
+    """True if HRMC_PLOT_WEBP asks for webp versions of plots and Pillow
+    is there to write them
+    """
+    return getattr(settings, 'HRMC_PLOT_WEBP', False) and is_pil_available
+
+
+def _encode_webp(pixels):
+    from PIL import Image
+    buff = io.BytesIO()
+    Image.fromarray(pixels).save(buff, "WEBP", lossless=True)
+    return buff.getvalue()
+
+
+def shade(fraction):
+    """Returns the color of a calculation fraction of the way through the
+    earlier ones
+    """
+    return tuple(a + (b - a) * fraction for a, b in zip(SHADE_FROM, SHADE_TO))
+
+
+class PlotRenderer(object):
+    """Renders g(r) curves as pngs.
+
+    :param size: figure size in inches.
+    :type size: tuple of floats
+    :param dpi: resolution of the png.
+    :type dpi: int
+    :param method: downsampling method, see :mod:`decimate`.
+    :type method: string
+    :param backend: "matplotlib" or "raster", default from settings.
+    :type backend: string
+    """
+    def __init__(self, size=(15.5, 13.5), dpi=100, method="lttb",
+                 backend=None):
+        self.size = size
+        self.dpi = dpi
+        self.method = method
+        self.backend = backend or render_backend()
+
+    def draw(self, curves):
+        """Returns an RGB pixel array of curves, a list of (xs, ys, label,
+        color, marker) tuples drawn in order.  Curves longer than the plot
+        is wide in pixels are downsampled first, so render time doesn't
+        grow with the data.
+        """
+        load_cached, downsample, rasterize = _load_data()
+        width = int(self.size[0] * self.dpi)
+        reduced = []
+        for xs, ys, label, color, marker in curves:
+            xs, ys = downsample(xs, ys, width, self.method)
+            reduced.append((xs, ys, label, color, marker))
+        curves = reduced
+        if self.backend == "raster":
+            try:
+                return rasterize.draw(curves, self.size, self.dpi,
+                                      XLABEL, YLABEL)
+            except rasterize.Unsupported as e:
+                logger.debug("drawing with matplotlib instead: %s" % e)
+        return self._draw_matplotlib(curves)
+
+    def _draw_matplotlib(self, curves):
+        import numpy
+        Figure, FigureCanvasAgg = _load()
+        fig = Figure(figsize=self.size, dpi=self.dpi)
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        for xs, ys, label, color, marker in curves:
+            ax.plot(xs, ys, color=color, markeredgecolor=color,
+                    marker=marker, label=label)
+        ax.set_xlabel(XLABEL)
+        ax.set_ylabel(YLABEL)
+        ax.grid(True)
+        ax.legend()
+        ax.set_xlim(0, None)
+        canvas.draw()
+        width, height = canvas.get_width_height()
+        rgba = numpy.frombuffer(canvas.buffer_rgba(), dtype=numpy.uint8)
+        return rgba.reshape(height, width, 4)[:, :, :3]
+
+    def render(self, curves):
+        """Returns a png of curves, see :meth:`draw`"""
+        rasterize = _load_data()[2]
+        return rasterize.encode_png(self.draw(curves))
+
+    def render_images(self, curves, webp=False):
+        """Draws curves once and returns every size in IMAGE_SIZES as a
+        dict of {(size, format): data}.  Each size is a png, and a webp too
+        if webp is True.
+        """
+        return self.encode_images(self.draw(curves), webp)
+
+    def encode_images(self, pixels, webp=False):
+        """Returns the sizes of :meth:`render_images` of pixels, an RGB
+        array from :meth:`draw`
+        """
+        rasterize = _load_data()[2]
+        images = {}
+        for size, longest in IMAGE_SIZES:
+            if longest:
+                scaled = rasterize.downscale(pixels, longest)
+            else:
+                scaled = pixels
+            images[(size, "png")] = rasterize.encode_png(scaled)
+            if webp:
+                images[(size, "webp")] = _encode_webp(scaled)
+        return images
+
+    def file_curves(self, grexp_path, grfinals, checksums=None):
+        """Returns the curves of grfinals, a list of (path, filename) of
+        grfinalNN.dat calculations in order, and the grexp experiment.
+        Files whose sha512sums are in checksums, a dict by path, are
+        loaded through :mod:`seriescache`.
+
+        Earlier calculations are drawn as lines shading towards the last
+        one, which is drawn with markers.
+        """
+        load_cached = _load_data()[0]
+        checksums = checksums or {}
+
+        def load_series(path):
+            return load_cached(path, checksums.get(path))
+        curves = []
+        for i, (path, filename) in enumerate(grfinals):
+            xs, ys = load_series(path)
+            if i == len(grfinals) - 1:
+                color, marker = "blue", "D"
+            else:
+                color, marker = shade(float(i) / len(grfinals)), None
+            curves.append((xs, ys, plot_label(filename), color, marker))
+        grexp_xs, grexp_ys = load_series(grexp_path)
+        curves.append((grexp_xs, grexp_ys, "Experiment", "red", "o"))
+        return curves
+
+    def render_files(self, grexp_path, grfinals):
+        """Returns a png of grfinals against the grexp experiment, see
+        :meth:`file_curves`
+        """
+        return self.render(self.file_curves(grexp_path, grfinals))
+
+    def render_many(self, jobs, threads=4):
+        """Renders a list of (grexp_path, grfinals) jobs on a pool of
+        threads, returning their pngs in order.
+        """
+        pool = ThreadPool(threads)
+        try:
+            return pool.map(lambda job: self.render_files(*job), jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+
+def render_panels(panels, panel_size=(4, 3), dpi=80, method="lttb"):
+    """Returns a png of panels, a list of (title, curves) with curves as
+    for :meth:`PlotRenderer.render`, drawn as a grid of small plots.
+    """
+    import math
+    Figure, FigureCanvasAgg = _load()
+    downsample = _load_data()[1]
+    columns = int(math.ceil(math.sqrt(len(panels))))
+    rows = int(math.ceil(len(panels) / float(columns)))
+    fig = Figure(figsize=(panel_size[0] * columns, panel_size[1] * rows),
+                 dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    width = int(panel_size[0] * dpi)
+    for i, (title, curves) in enumerate(panels):
+        ax = fig.add_subplot(rows, columns, i + 1)
+        for xs, ys, label, color, marker in curves:
+            xs, ys = downsample(xs, ys, width, method)
+            ax.plot(xs, ys, color=color, marker=marker, label=label,
+                    linewidth=1)
+        ax.set_title(title, fontsize="small")
+        ax.set_xlim(0, None)
+        ax.grid(True)
+        ax.tick_params(labelsize="x-small")
+        if i == 0:
+            ax.legend(prop={"size": "x-small"})
+    fig.text(0.5, 0.01, XLABEL, ha="center")
+    fig.text(0.01, 0.5, YLABEL, rotation=90, va="center")
+    fig.subplots_adjust(left=0.06, right=0.98, bottom=0.06, top=0.95,
+                        hspace=0.45, wspace=0.25)
+    buff = io.BytesIO()
+    canvas.print_png(buff)
+    return buff.getvalue()
+
+
+def render_plot(grexp_path, grfinals, checksums=None):
+    """Plots grfinals, a list of (path, filename) of grfinalNN.dat
+    calculations, against the grexp experiment with the default renderer
+    and returns every size of the plot as from
+    :meth:`PlotRenderer.render_images`, with webp versions if
+    HRMC_PLOT_WEBP is set.  See :meth:`PlotRenderer.file_curves` for
+    checksums.
+
+    Touches no models, so is safe to run in a worker process.
+    """
+    renderer = PlotRenderer()
+    with timer("render.load"):
+        curves = renderer.file_curves(grexp_path, grfinals, checksums)
+    with timer("render.draw"):
+        pixels = renderer.draw(curves)
+    with timer("render.encode"):
+        return renderer.encode_images(pixels, webp=is_webp_enabled())
@@ -0,0 +1,357 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+renderqueue.py
+
+Renders HRMC plots in a pool of worker processes, away from the request
+that first asks for them.
+
+Every render of a dataset, queued or inline, first claims the dataset,
+so however many requests or ingest callbacks ask for a plot at once only
+one of them renders it.  The rest either show a placeholder or, through
+:meth:`LocalQueue.render_now`, wait for the render to finish.
+
+Settings:
+
+``HRMC_RENDER_QUEUE``
+    ``"sqlite"`` (default) tracks outstanding jobs in a SQLite database
+    shared by every process on the host, so a dataset is rendered once
+    however many web workers see it.  ``"local"`` tracks them in this
+    process only, for single process deployments and the tests.
+``HRMC_RENDER_QUEUE_DB``
+    path of the SQLite database, default ``hrmc_render_queue.sqlite`` in
+    ``FILE_STORE_PATH``.
+``HRMC_RENDER_PROCESSES``
+    size of the worker pool, default 2.  0 renders in the calling thread,
+    which is what the tests use.
+``HRMC_RENDER_TIMEOUT``
+    seconds after which a job claimed by a process that has gone away may
+    be claimed again, default 600.
+
+"""
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+
+from tardis.tardis_portal.models import Dataset
+
+from tardis.apps.hrmc_views.instrument import incr, observe, timer
+from tardis.apps.hrmc_views.plots import get_plot_parameterset
+from tardis.apps.hrmc_views.plots import get_plot_parameter
+from tardis.apps.hrmc_views.plots import find_plot_files
+from tardis.apps.hrmc_views.plots import lock_dataset
+from tardis.apps.hrmc_views.plots import save_metrics, save_plot
+from tardis.apps.hrmc_views.render import render_plot
+from tardis.apps.hrmc_views.render import is_matplotlib_available
+from tardis.apps.hrmc_views.plotstore import get_store
+from tardis.apps.hrmc_views.plotstore import plot_key
+
+logger = logging.getLogger(__name__)
+
+
+def make_job(dataset_id, grexp_file, grfinal_files):
+    """Returns the job rendering the plot of the given data files, or None
+    if any hasn't been verified yet.  Only stored sha512sums are used, so
+    building a job never reads the files, which may not even be written
+    yet when the ingest filter sees them.
+    """
+    datafiles = [grexp_file] + grfinal_files
+    checksums = [df.sha512sum for df in datafiles]
+    if not all(checksums):
+        logger.debug("data files of %s not verified yet" % dataset_id)
+        return None
+    return (dataset_id, plot_key(datafiles, checksums),
+            grexp_file.get_absolute_filepath(),
+            [(df.get_absolute_filepath(), df.filename)
+             for df in grfinal_files],
+            dict((df.get_absolute_filepath(), checksum)
+                 for df, checksum in zip(datafiles, checksums)))
+
+
+def render_job(job):
+    """Worker process entry point, renders the plot into the store unless
+    it is already there and measures the fit of the last calculation.
+    Returns (dataset_id, key, error, metrics), see :mod:`metrics`.
+
+    The data files are parsed through :mod:`seriescache`, so the first
+    render of a dataset leaves binary copies of its series, and their
+    :mod:`envelope` pyramids, behind.
+    """
+    from tardis.apps.hrmc_views.envelope import load_envelope
+    from tardis.apps.hrmc_views.metrics import file_metrics
+    dataset_id, key, grexp_path, grfinals, checksums = job
+    try:
+        store = get_store()
+        if store.exists(key):
+            incr("render.reused")
+            store.touch(key)
+        else:
+            images = render_plot(grexp_path, grfinals, checksums)
+            observe("render.bytes", sum(len(data) for data in images.values()))
+            with timer("render.store"):
+                store.put_images(key, images)
+        with timer("render.fit"):
+            metrics = file_metrics(grexp_path, grfinals[-1][0], checksums)
+        with timer("render.envelope"):
+            for path, checksum in sorted(checksums.items()):
+                if checksum:
+                    load_envelope(path, checksum)
+    except Exception:
+        return dataset_id, None, traceback.format_exc(), {}
+    return dataset_id, key, None, metrics
+
+
+class LocalQueue(object):
+    """Renders plots on a process pool, tracking outstanding jobs in this
+    process.
+
+    :param processes: number of worker processes, 0 to render inline.
+    :type processes: int
+    """
+    def __init__(self, processes=2):
+        self.processes = processes
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    def submit(self, dataset_id):
+        """Queues a render of dataset_id unless one is already outstanding
+        or the dataset isn't ready to plot.  Returns True if queued.
+        """
+        # claimed first, so views of a dataset still rendering don't look
+        # up its files again each time only to lose the claim
+        if not self._claim(dataset_id):
+            logger.debug("render of %s already queued" % dataset_id)
+            return False
+        try:
+            job = self._make_job(dataset_id)
+        except Exception:
+            self._release(dataset_id)
+            raise
+        if job is None:
+            self._release(dataset_id)
+            return False
+        if not self.processes or get_store().exists(job[1]):
+            # render inline, or just record the plot if identical data
+            # has been rendered before
+            self._finish(render_job(job))
+            return True
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.processes)
+            self._pool.apply_async(render_job, (job,), callback=self._finish)
+        logger.debug("queued render of %s" % dataset_id)
+        return True
+
+    def render_now(self, dataset_id, wait=600):
+        """Renders dataset_id in this thread unless its plot exists or
+        another worker is already rendering it, in which case waits up to
+        wait seconds for that render.  Returns True if rendered here.
+        """
+        def render():
+            # made after the claim so a render that finished just before
+            # it is seen
+            job = self._make_job(dataset_id)
+            if job is not None:
+                self._save(render_job(job))
+        return self.once(dataset_id, render, wait)
+
+    def once(self, dataset_id, func, wait=600, poll=0.1):
+        """Single flight: calls func() if this caller can claim dataset_id,
+        otherwise waits up to wait seconds for whoever holds the claim to
+        release it.  Returns True if func was called here.
+        """
+        if self._claim(dataset_id):
+            try:
+                func()
+            finally:
+                self._release(dataset_id)
+            return True
+        logger.debug("waiting for render of %s" % dataset_id)
+        deadline = time.time() + wait
+        while self.is_pending(dataset_id) and time.time() < deadline:
+            time.sleep(poll)
+        return False
+
+    def is_pending(self, dataset_id):
+        """True while a render of dataset_id is outstanding"""
+        with self._lock:
+            return dataset_id in self._pending
+
+    def close(self):
+        """Waits for outstanding renders and shuts down the pool"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    def _claim(self, dataset_id):
+        with self._lock:
+            if dataset_id in self._pending:
+                return False
+            self._pending.add(dataset_id)
+            return True
+
+    def _release(self, dataset_id):
+        with self._lock:
+            self._pending.discard(dataset_id)
+
+    def _make_job(self, dataset_id):
+        if not is_matplotlib_available:
+            return None
+        dataset = Dataset.objects.get(id=dataset_id)
+        found = get_plot_parameterset(dataset)
+        if not found or get_plot_parameter(found[1]):
+            return None
+        grexp_file, grfinal_files = find_plot_files(dataset)
+        if not (grexp_file and grfinal_files):
+            logger.debug("one or more files unavailable")
+            return None
+        return make_job(dataset_id, grexp_file, grfinal_files)
+
+    def _finish(self, result):
+        # Runs on the pool's result thread, where an exception would stop
+        # every later callback, so log everything.
+        try:
+            self._save(result)
+        finally:
+            self._release(result[0])
+
+    def _save(self, result):
+        dataset_id, key, error, metrics = result
+        try:
+            if error:
+                logger.error("render of %s failed\n%s" % (dataset_id, error))
+                incr("render.failed")
+                return
+            with timer("render.save"):
+                if transaction.is_managed():
+                    # the caller's transaction holds the lock until it
+                    # commits
+                    self._save_plot(dataset_id, key, metrics)
+                else:
+                    with transaction.commit_on_success():
+                        self._save_plot(dataset_id, key, metrics)
+        except Exception:
+            logger.exception("saving plot for %s failed" % dataset_id)
+
+    def _save_plot(self, dataset_id, key, metrics):
+        # the claim may only cover this process, so lock the dataset and
+        # look again before saving in case another process has saved it
+        lock_dataset(dataset_id)
+        found = get_plot_parameterset(Dataset.objects.get(id=dataset_id))
+        if found and not get_plot_parameter(found[1]):
+            save_plot(found[0], found[1], key)
+            save_metrics(found[0], found[1], metrics)
+            logger.debug("saved plot for %s" % dataset_id)
+
+
+class SQLiteQueue(LocalQueue):
+    """A LocalQueue whose outstanding jobs are rows in a SQLite database,
+    so every process on the host sees them.
+
+    :param path: path of the SQLite database, created if missing.
+    :type path: string
+    :param timeout: seconds before a job may be claimed again.
+    :type timeout: int
+    """
+    def __init__(self, path, processes=2, timeout=600):
+        super(SQLiteQueue, self).__init__(processes)
+        self.path = path
+        self.timeout = timeout
+        conn = self._connect()
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                         "dataset_id INTEGER PRIMARY KEY, "
+                         "pid INTEGER, claimed REAL)")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # sqlite3 connections can't be shared between threads, and the
+        # pool callbacks arrive on their own thread
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def is_pending(self, dataset_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT claimed FROM jobs WHERE dataset_id=?",
+                               (dataset_id,)).fetchone()
+        finally:
+            conn.close()
+        return row is not None and row[0] > time.time() - self.timeout
+
+    def _claim(self, dataset_id):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM jobs WHERE dataset_id=? AND claimed<?",
+                         (dataset_id, now - self.timeout))
+            # the primary key makes the insert the atomic claim
+            cur = conn.execute("INSERT OR IGNORE INTO jobs VALUES (?, ?, ?)",
+                               (dataset_id, os.getpid(), now))
+            return cur.rowcount == 1
+        finally:
+            conn.close()
+
+    def _release(self, dataset_id):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM jobs WHERE dataset_id=?", (dataset_id,))
+        finally:
+            conn.close()
+
+
+_queue = None
+_queue_config = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """Returns the render queue configured in settings"""
+    global _queue, _queue_config
+    config = (getattr(settings, 'HRMC_RENDER_QUEUE', 'sqlite'),
+              getattr(settings, 'HRMC_RENDER_PROCESSES', 2),
+              getattr(settings, 'HRMC_RENDER_QUEUE_DB',
+                      os.path.join(settings.FILE_STORE_PATH,
+                                   'hrmc_render_queue.sqlite')),
+              getattr(settings, 'HRMC_RENDER_TIMEOUT', 600))
+    with _queue_lock:
+        if config != _queue_config:
+            backend, processes, path, timeout = config
+            if backend == 'sqlite':
+                queue = SQLiteQueue(path, processes, timeout)
+            elif backend == 'local':
+                queue = LocalQueue(processes)
+            else:
+                raise ValueError("unknown HRMC_RENDER_QUEUE %r" % backend)
+            if _queue is not None:
+                _queue.close()
+            _queue, _queue_config = queue, config
+        return _queue
@@ -0,0 +1,100 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+schemacache.py
+
+Process local cache of the HRMC Schema and its ParameterNames, which are
+looked up on every ingest event and page view but almost never change.
+
+Entries are dropped whenever a Schema or ParameterName is saved or deleted
+in this process, and expire after ``HRMC_SCHEMA_CACHE_TIMEOUT`` seconds
+(default 300) to pick up changes made by other processes.
+
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+
+from tardis.tardis_portal.models import Schema, ParameterName
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_entries = {}
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def _lookup(key, load):
+    timeout = getattr(settings, 'HRMC_SCHEMA_CACHE_TIMEOUT', 300)
+    now = time.time()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[1] > now:
+            _stats['hits'] += 1
+            return entry[0]
+        _stats['misses'] += 1
+    # DoesNotExist and MultipleObjectsReturned propagate and aren't cached
+    value = load()
+    with _lock:
+        _entries[key] = (value, now + timeout)
+    return value
+
+
+def get_schema(namespace):
+    """Cached ``Schema.objects.get(namespace=namespace)``"""
+    return _lookup(('schema', namespace),
+                   lambda: Schema.objects.get(namespace=namespace))
+
+
+def get_parameter_name(schema, name):
+    """Cached ``ParameterName.objects.get(schema=schema, name=name)``"""
+    return _lookup(('parametername', schema.id, name),
+                   lambda: ParameterName.objects.get(schema=schema,
+                                                     name=name))
+
+
+def stats():
+    """Returns a dict of the hit, miss and invalidation counts"""
+    with _lock:
+        return dict(_stats)
+
+
+def clear():
+    """Drops every entry"""
+    with _lock:
+        _entries.clear()
+        _stats['invalidations'] += 1
+
+
+def _invalidate(sender, **kwargs):
+    logger.debug("%s changed, clearing schema cache" % sender.__name__)
+    clear()
+
+
+for _model in (Schema, ParameterName):
+    post_save.connect(_invalidate, sender=_model,
+                      dispatch_uid="hrmc_schemacache_save_%s" % _model.__name__)
+    post_delete.connect(_invalidate, sender=_model,
+                        dispatch_uid="hrmc_schemacache_delete_%s"
+                                     % _model.__name__)
@@ -0,0 +1,111 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+series.py
+
+Packs the g(r) series of a HRMC dataset into a compact binary form for
+plotting in the browser.
+
+The packed form is a little-endian uint32 header length, a JSON header
+padded with spaces to a multiple of 4 bytes, then for each series in the
+header its r values followed by its g(r) values as little-endian float32::
+
+    {"version": 1, "dtype": "<f4",
+     "series": [{"name": "grexp.dat", "label": "Experiment",
+                 "length": 1000}, ...]}
+
+"""
+import json
+import struct
+
+import numpy
+
+from tardis.apps.hrmc_views.decimate import downsample
+from tardis.apps.hrmc_views.envelope import load_envelope, zoom
+from tardis.apps.hrmc_views.plots import plot_label
+from tardis.apps.hrmc_views.seriescache import load_datafile
+
+FORMAT_VERSION = 1
+
+
+def dataset_series(grexp_file, grfinal_files):
+    """Returns the (name, label, r, g) series of the given data files, the
+    calculations first and the experiment last, as they are plotted.
+    """
+    series = []
+    for df in grfinal_files:
+        r, g = load_datafile(df)
+        series.append((df.filename, plot_label(df.filename), r, g))
+    r, g = load_datafile(grexp_file)
+    series.append((grexp_file.filename, "Experiment", r, g))
+    return series
+
+
+def zoom_series(grexp_file, grfinal_files, r0, r1, width):
+    """Returns the series of the given data files as
+    :func:`dataset_series`, cut to r0 to r1 and reduced for drawing width
+    pixels wide with :func:`envelope.zoom`.
+    """
+    series = []
+    for df, label in ([(df, plot_label(df.filename)) for df in grfinal_files]
+                      + [(grexp_file, "Experiment")]):
+        # keyed by the stored sha512sum, as the render queue's workers key
+        # them, so the pyramids they built are found; files not verified
+        # yet are read without the cache rather than hashed every time
+        r, g, envelope = load_envelope(df.get_absolute_filepath(),
+                                       df.sha512sum or None)
+        r, g = zoom(r, g, envelope, r0, r1, width)
+        series.append((df.filename, label, r, g))
+    return series
+
+
+def pack_series(series, points=None, method="lttb"):
+    """Returns series, a list of (name, label, r, g), in the packed form,
+    each downsampled to about points values if given.
+    """
+    header = {"version": FORMAT_VERSION, "dtype": "<f4", "series": []}
+    arrays = []
+    for name, label, r, g in series:
+        if points:
+            r, g = downsample(r, g, points, method)
+        header["series"].append({"name": name, "label": label,
+                                 "length": len(r)})
+        arrays.append(numpy.asarray(r, dtype="<f4").tobytes())
+        arrays.append(numpy.asarray(g, dtype="<f4").tobytes())
+    text = json.dumps(header).encode("utf-8")
+    # pad so the float32 arrays that follow are 4 byte aligned
+    text += b" " * (-len(text) % 4)
+    return b"".join([struct.pack("<I", len(text)), text] + arrays)
+
+
+def unpack_series(data):
+    """Returns the (header, [(name, label, r, g), ...]) of packed data"""
+    length = struct.unpack("<I", data[:4])[0]
+    header = json.loads(data[4:4 + length].decode("utf-8"))
+    offset = 4 + length
+    series = []
+    for entry in header["series"]:
+        n = entry["length"]
+        r = numpy.frombuffer(data, dtype="<f4", count=n, offset=offset)
+        g = numpy.frombuffer(data, dtype="<f4", count=n, offset=offset + 4 * n)
+        offset += 8 * n
+        series.append((entry["name"], entry["label"], r, g))
+    return header, series
@@ -0,0 +1,112 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+seriescache.py
+
+Binary copies of parsed HRMC data files.  Each file is parsed once and
+its r, g(r) arrays saved as a .npy file named by the sha512sum of the
+text, so later loads memory map the copy instead of parsing again.  The
+copies are written by the render queue's workers, which render every
+new dataset as it is ingested.
+
+Settings:
+
+``HRMC_SERIES_CACHE``
+    directory holding the copies, default ``hrmc_series`` in
+    ``FILE_STORE_PATH``.
+
+"""
+import io
+import logging
+import os
+
+import numpy
+from django.conf import settings
+
+from tardis.apps.hrmc_views.grdata import load_series
+from tardis.apps.hrmc_views.plotstore import atomic_write
+
+logger = logging.getLogger(__name__)
+
+
+class SeriesCache(object):
+    """Directory of .npy series sharded by the first two characters of
+    the sha512sum of the file they were parsed from.
+
+    :param root: directory to store series in, created if missing.
+    :type root: string
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, checksum, kind=""):
+        """Returns the file of the series under checksum, or of arrays
+        derived from it if kind, a suffix such as ".env", is given
+        """
+        return os.path.join(self.root, checksum[:2],
+                            "%s%s.npy" % (checksum, kind))
+
+    def get(self, checksum, kind=""):
+        """Returns the 2 x N series stored under checksum, memory mapped
+        read only, or None if there isn't one
+        """
+        try:
+            return numpy.load(self.path(checksum, kind), mmap_mode="r")
+        except IOError:
+            return None
+
+    def put(self, checksum, values, kind=""):
+        """Stores the 2 x N series values under checksum"""
+        buff = io.BytesIO()
+        # r and g(r) each contiguous, so either can be read on its own
+        numpy.save(buff, numpy.ascontiguousarray(values))
+        atomic_write(self.path(checksum, kind), buff.getvalue())
+        logger.debug("cached series %s%s" % (checksum, kind))
+
+
+def get_series_cache():
+    """Returns the SeriesCache configured in settings"""
+    return SeriesCache(getattr(settings, 'HRMC_SERIES_CACHE',
+        os.path.join(settings.FILE_STORE_PATH, 'hrmc_series')))
+
+
+def load_cached(path, checksum=None):
+    """Returns the series in the data file at path as
+    :func:`grdata.load_series` does, from the cache if checksum, the
+    file's sha512sum, is given.  A file not cached yet is parsed and
+    cached.
+    """
+    if not checksum:
+        return load_series(path)
+    cache = get_series_cache()
+    values = cache.get(checksum)
+    if values is None:
+        values = load_series(path)
+        try:
+            cache.put(checksum, values)
+        except (IOError, OSError):
+            logger.exception("caching series of %s failed" % path)
+    return values
+
+
+def load_datafile(datafile):
+    """Returns the series of datafile, cached if it has been verified"""
+    return load_cached(datafile.get_absolute_filepath(), datafile.sha512sum)
@@ -0,0 +1,153 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+summary.py
+
+One plot summarising every HRMC dataset of an experiment: a small panel
+per dataset of its last calculation against the experiment, titled with
+its R-factor when known.
+
+Summaries are kept in the plot store under a key derived from the
+stored sha512sums of every member's plot files, so a summary is drawn once
+and only drawn again when one of those files changes.  Members whose files
+haven't been verified yet are left out until they are.
+
+Settings:
+
+``HRMC_SUMMARY_THREADS``
+    threads loading the members' series, default 8.
+
+"""
+import hashlib
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.db.models import Q
+
+from tardis.tardis_portal.models import Dataset, DatasetParameter
+from tardis.tardis_portal.models import Dataset_File
+
+from tardis.apps.hrmc_views.plots import HRMC_DATASET_SCHEMA
+from tardis.apps.hrmc_views.plots import pick_plot_files
+from tardis.apps.hrmc_views.plotstore import RENDER_VERSION
+
+# Bump whenever the summary layout changes.
+SUMMARY_VERSION = "1"
+
+
+def experiment_members(experiment_id):
+    """Returns (dataset, grexp_file, grfinal_files) of every dataset of the
+    experiment with both kinds of plot file, oldest first, in two queries.
+    """
+    datasets = list(Dataset.objects.filter(experiments__id=experiment_id)
+                    .order_by('id'))
+    plot_files = Q(filename__contains="grexp.dat") | \
+        Q(filename__startswith="grfinal")
+    files = dict((ds.id, []) for ds in datasets)
+    for df in Dataset_File.objects.filter(plot_files,
+                                          dataset__in=datasets) \
+                                  .order_by('id'):
+        files[df.dataset_id].append(df)
+    members = []
+    for ds in datasets:
+        grexp_file, grfinal_files = pick_plot_files(files[ds.id])
+        if grexp_file and grfinal_files:
+            members.append((ds, grexp_file, grfinal_files))
+    return members
+
+
+def drawn_members(members):
+    """Returns the members whose drawn files, the grexp and the last
+    calculation, have been verified.  Only those are summarised, so the
+    key is made from stored sha512sums rather than hashing files per
+    request, and files not written yet are never read.
+    """
+    return [(ds, grexp_file, grfinal_files)
+            for ds, grexp_file, grfinal_files in members
+            if grexp_file.sha512sum and grfinal_files[-1].sha512sum]
+
+
+def summary_key(members):
+    """Returns the plot store key of the summary of members, which must
+    be verified, see :func:`drawn_members`
+    """
+    lines = []
+    for ds, grexp_file, grfinal_files in members:
+        # only the last calculation is drawn
+        for df in (grexp_file, grfinal_files[-1]):
+            lines.append("%d %s %s %s" % (ds.id, ds.description,
+                                          df.filename, df.sha512sum))
+    lines.append("summary %s %s" % (SUMMARY_VERSION, RENDER_VERSION))
+    return hashlib.sha1("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def member_metrics(members):
+    """Returns {dataset id: {metric name: value}} of the fit metrics
+    recorded for members, in one query
+    """
+    metrics = dict((ds.id, {}) for ds, grexp, grfinals in members)
+    for dataset_id, name, value in DatasetParameter.objects.filter(
+            parameterset__dataset__id__in=list(metrics),
+            parameterset__schema__namespace=HRMC_DATASET_SCHEMA,
+            numerical_value__isnull=False) \
+            .values_list('parameterset__dataset_id', 'name__name',
+                         'numerical_value'):
+        metrics[dataset_id][name] = value
+    return metrics
+
+
+def load_members(members, threads=None):
+    """Returns [(grexp series, last grfinal series)] of members, loaded
+    through :mod:`seriescache` on a pool of threads
+    """
+    from tardis.apps.hrmc_views.seriescache import load_datafile
+
+    def load(member):
+        ds, grexp_file, grfinal_files = member
+        return load_datafile(grexp_file), load_datafile(grfinal_files[-1])
+    if threads is None:
+        threads = getattr(settings, 'HRMC_SUMMARY_THREADS', 8)
+    pool = ThreadPool(max(1, min(threads, len(members))))
+    try:
+        return pool.map(load, members)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def render_summary(members, metrics):
+    """Returns the summary of members as png data"""
+    from tardis.apps.hrmc_views.render import render_panels
+    panels = []
+    for (ds, grexp_file, grfinal_files), (grexp, grfinal) in zip(
+            members, load_members(members)):
+        description = ds.description
+        if len(description) > 30:
+            description = description[:29] + "..."
+        title = "%d: %s" % (ds.id, description)
+        rfactor = metrics.get(ds.id, {}).get("rfactor")
+        if rfactor is not None:
+            title += " (R = %.4f)" % rfactor
+        panels.append((title, [(grfinal[0], grfinal[1], "Calculation",
+                                "blue", None),
+                               (grexp[0], grexp[1], "Experiment", "red",
+                                None)]))
+    return render_panels(panels)
@@ -0,0 +1,162 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+"""
+synthetic.py
+
+Synthetic HRMC datasets of any size, for the benchmark and load test
+commands.  A dataset is a grexp.dat experiment, grfinalNN.dat
+calculations converging on it and other .dat files making up the rest,
+written under ``FILE_STORE_PATH`` where MyTardis keeps uploads and added
+to a public experiment.
+
+"""
+import hashlib
+import os
+
+import numpy
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from tardis.tardis_portal.models import Experiment, Dataset, Dataset_File
+from tardis.tardis_portal.models import License, Schema, ParameterName
+
+from tardis.apps.hrmc_views.metrics import METRICS
+from tardis.apps.hrmc_views.plots import HRMC_DATASET_SCHEMA
+
+
+def experiment_curve(rows, seed=0):
+    """Returns the r, g(r) of a synthetic experiment with rows points: a
+    damped oscillation about 1 with a little noise
+    """
+    rng = numpy.random.RandomState(seed)
+    r = numpy.linspace(0.5, 20.0, rows)
+    g = 1.0 + numpy.exp(-r / 5.0) * numpy.sin(3.0 * r)
+    return r, g + rng.normal(scale=0.02, size=rows)
+
+
+def calculation_curve(r, g, number, iterations, seed=0):
+    """Returns g(r) of calculation number of iterations, each closer to
+    the experiment g than the one before
+    """
+    rng = numpy.random.RandomState(seed + number)
+    error = float(iterations - number + 1) / iterations
+    return (g + 0.3 * error * numpy.sin(r + number)
+            + rng.normal(scale=0.05 * error, size=len(r)))
+
+
+def write_series(path, r, g):
+    """Writes r, g(r) as a two column HRMC data file"""
+    numpy.savetxt(path, numpy.column_stack((r, g)), fmt="%.6f")
+
+
+def write_dataset(dest, rows=1000, iterations=1, files=None, seed=0):
+    """Writes the data files of a synthetic dataset into dest: grexp.dat,
+    grfinal01.dat to grfinalNN.dat for iterations calculations and enough
+    other files to make files in all.  Every file has rows rows.
+
+    Returns the filenames in the order a run uploads them, the other
+    files and grexp.dat first and the calculations as they finish.
+    """
+    if files is None:
+        files = iterations + 1
+    if files < iterations + 1:
+        raise ValueError("%d files can't hold %d calculations and grexp.dat"
+                         % (files, iterations))
+    if not os.path.exists(dest):
+        os.makedirs(dest)
+    r, g = experiment_curve(rows, seed)
+    filenames = []
+    for i in range(files - iterations - 1):
+        filename = "output%02d.dat" % (i + 1)
+        write_series(os.path.join(dest, filename), r, g[::-1])
+        filenames.append(filename)
+    write_series(os.path.join(dest, "grexp.dat"), r, g)
+    filenames.append("grexp.dat")
+    for number in range(1, iterations + 1):
+        filename = "grfinal%02d.dat" % number
+        write_series(os.path.join(dest, filename), r,
+                     calculation_curve(r, g, number, iterations, seed))
+        filenames.append(filename)
+    return filenames
+
+
+def create_experiment(title="synthetic HRMC datasets"):
+    """Returns a new public experiment to hold synthetic datasets, and
+    creates the hrmc schema if it is missing
+    """
+    sch, created = Schema.objects.get_or_create(
+        namespace=HRMC_DATASET_SCHEMA,
+        defaults={'name': "hrmc_views", 'type': Schema.DATASET,
+                  'hidden': True})
+    ParameterName.objects.get_or_create(
+        schema=sch, name="plot",
+        defaults={'full_name': "scatterplot", 'units': "image",
+                  'data_type': ParameterName.FILENAME})
+    for name in METRICS:
+        ParameterName.objects.get_or_create(
+            schema=sch, name=name,
+            defaults={'full_name': name, 'is_searchable': True,
+                      'data_type': ParameterName.NUMERIC})
+    user, created = User.objects.get_or_create(username="hrmc_synthetic")
+    license_ = License(name=title, url="http://example.com/",
+                       internal_description=title, allows_distribution=True)
+    license_.save()
+    experiment = Experiment(title=title, description=title,
+                            created_by=user, license=license_,
+                            public_access=Experiment.PUBLIC_ACCESS_FULL)
+    experiment.save()
+    return experiment
+
+
+def create_dataset(experiment, rows=1000, iterations=1, files=None, seed=0):
+    """Returns (dataset, dest, filenames) of a new dataset of experiment
+    whose files have been written to dest by :func:`write_dataset` but not
+    yet added to it
+    """
+    dataset = Dataset(description="synthetic dataset %d" % seed)
+    dataset.save()
+    dataset.experiments.add(experiment)
+    dest = os.path.join(settings.FILE_STORE_PATH, str(experiment.id),
+                        str(dataset.id))
+    return dataset, dest, write_dataset(dest, rows, iterations, files, seed)
+
+
+def add_datafiles(dataset, dest, filenames, output=None):
+    """Saves a Dataset_File of each of filenames in dest, passing each to
+    the output filter as it is saved if one is given
+    """
+    for filename in filenames:
+        datafile = make_datafile(dataset, dest, filename)
+        datafile.save()
+        if output is not None:
+            output(sender=Dataset_File, instance=datafile)
+
+
+def make_datafile(dataset, dest, filename):
+    """Returns an unsaved Dataset_File of filename in dest, which must be
+    under FILE_STORE_PATH, verified as an upload would be
+    """
+    path = os.path.join(dest, filename)
+    with open(path, "rb") as f:
+        contents = f.read()
+    return Dataset_File(dataset=dataset, filename=filename, protocol='',
+                        size=len(contents),
+                        sha512sum=hashlib.sha512(contents).hexdigest(),
+                        url=os.path.relpath(path, settings.FILE_STORE_PATH))
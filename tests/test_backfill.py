@@ -0,0 +1,107 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from tardis.tardis_portal.models import Dataset, DatasetParameter
+from tardis.tardis_portal.models import DatasetParameterSet
+
+from tardis.apps.hrmc_views.plotstore import is_plot_key
+
+from tardis.apps.hrmc_views.tests.test_view import _create_test_user, \
+    _create_license, _create_test_experiment, _create_test_dataset, \
+    _create_hrmc_schema
+
+
+class BackfillTest(TestCase):
+
+    HRMCSCHEMA = "http://rmit.edu.au/schemas/hrmcdataset"
+
+    def test_backfill(self):
+        """
+            Datasets without a plot get one, datasets missing a data file
+            are skipped and a second run has nothing to do
+        """
+        user = _create_test_user()
+        license = _create_license()
+        exp = _create_test_experiment(user, license)
+        sch, param = _create_hrmc_schema(self.HRMCSCHEMA)
+        datasets = []
+        for i in range(5):
+            ds = Dataset(description='happy snaps of plumage')
+            ds.save()
+            files = {"grexp.dat": '1 2\n2 3\n3 %s\n' % i}
+            if i != 4:
+                files["grfinal21.dat"] = '1 2\n 2 4\n4 %s\n' % i
+            ds = _create_test_dataset(ds, exp.id, files)
+            DatasetParameterSet(schema=sch, dataset=ds).save()
+            ds.experiments.add(exp)
+            datasets.append(ds)
+
+        out = StringIO()
+        call_command('hrmc_backfill', processes=2, batch_size=2, stdout=out)
+        self.assertTrue("4/5 plots saved, 0 failed" in out.getvalue())
+        for ds in datasets[:4]:
+            self.assertEquals(DatasetParameter.objects.filter(
+                parameterset__dataset=ds, name=param).count(), 1)
+            self.assertEquals(DatasetParameter.objects.filter(
+                parameterset__dataset=ds,
+                name__name__in=("rfactor", "chisquared", "rms")).count(), 3)
+        self.assertFalse(DatasetParameter.objects.filter(
+            parameterset__dataset=datasets[4], name=param))
+
+        out = StringIO()
+        call_command('hrmc_backfill', stdout=out)
+        self.assertTrue("1 datasets without a plot" in out.getvalue())
+        self.assertEquals(DatasetParameter.objects.filter(name=param).count(),
+                          4)
+
+    def test_backfill_legacy_plot(self):
+        """
+            Datasets holding a base64 plot from an old version are rendered
+            and the old value replaced
+        """
+        user = _create_test_user()
+        license = _create_license()
+        exp = _create_test_experiment(user, license)
+        sch, param = _create_hrmc_schema(self.HRMCSCHEMA)
+        ds = Dataset(description='happy snaps of plumage')
+        ds.save()
+        ds = _create_test_dataset(ds, exp.id, {
+            "grexp.dat": '1 2\n2 3\n3 5\n',
+            "grfinal21.dat": '1 2\n 2 4\n4 5\n'})
+        ps = DatasetParameterSet(schema=sch, dataset=ds)
+        ps.save()
+        ds.experiments.add(exp)
+        DatasetParameter(parameterset=ps, name=param,
+                         string_value='iVBORw0KGgoAAAANSUhEUg==').save()
+
+        out = StringIO()
+        call_command('hrmc_backfill', processes=1, stdout=out)
+        self.assertTrue("1 datasets without a plot" in out.getvalue())
+        plots = DatasetParameter.objects.filter(parameterset=ps, name=param)
+        self.assertEquals(len(plots), 1)
+        self.assertTrue(is_plot_key(plots[0].string_value))
+        self.assertEquals(DatasetParameter.objects.filter(
+            parameterset=ps,
+            name__name__in=("rfactor", "chisquared", "rms")).count(), 3)
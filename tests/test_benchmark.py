@@ -0,0 +1,128 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import copy
+import json
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from tardis.apps.hrmc_views.grdata import load_series
+from tardis.apps.hrmc_views.synthetic import write_dataset
+from tardis.apps.hrmc_views.benchmarks.pipeline import compare, run_pipeline
+from tardis.apps.hrmc_views.benchmarks.loadtest import percentile
+from tardis.apps.hrmc_views.benchmarks.loadtest import run_scenario
+
+
+class SyntheticTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_write_dataset(self):
+        """
+            Calculations converge on the experiment, other files pad the
+            dataset out
+        """
+        filenames = write_dataset(self.tmpdir, rows=500, iterations=3,
+                                  files=5)
+        self.assertEquals(filenames, ["output01.dat", "grexp.dat",
+                                      "grfinal01.dat", "grfinal02.dat",
+                                      "grfinal03.dat"])
+        self.assertEquals(sorted(os.listdir(self.tmpdir)), sorted(filenames))
+        r, g = load_series(os.path.join(self.tmpdir, "grexp.dat"))
+        self.assertEquals(len(r), 500)
+        errors = []
+        for filename in filenames[2:]:
+            calc_r, calc_g = load_series(os.path.join(self.tmpdir, filename))
+            self.assertEquals(list(calc_r), list(r))
+            errors.append(abs(calc_g - g).mean())
+        self.assertEquals(errors, sorted(errors, reverse=True))
+        self.assertRaises(ValueError, write_dataset, self.tmpdir, 10, 3, 3)
+
+
+class PipelineTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_run_pipeline(self):
+        """
+            Every stage is measured once per dataset, and the results are
+            JSON a later run can be compared against
+        """
+        with override_settings(FILE_STORE_PATH=self.tmpdir,
+                               HRMC_RENDER_QUEUE="local",
+                               HRMC_RENDER_PROCESSES=0,
+                               HRMC_FILTER_QUIET_PERIOD=0):
+            results = run_pipeline(datasets=2, rows=200, iterations=2)
+        results = json.loads(json.dumps(results))
+        stages = results["stages"]
+        self.assertEquals(sorted(stages), sorted(
+            ["ingest", "parse", "render", "encode", "plot", "view"]))
+        for stage in stages.values():
+            self.assertEquals(stage["runs"], 2)
+            self.assertTrue(stage["peak_rss_kb"] > 0)
+        self.assertTrue(stages["ingest"]["queries"] > 0)
+        self.assertEquals(stages["parse"]["queries"], 0)
+        self.assertEquals(stages["render"]["queries"], 0)
+        self.assertEquals(results["config"]["files"], 3)
+
+        self.assertEquals(compare(results, results), [])
+        faster = copy.deepcopy(results)
+        faster["stages"]["render"]["seconds"] /= 10
+        faster["stages"]["view"]["queries"] -= 2
+        regressions = compare(results, faster)
+        self.assertEquals([r.split(":")[0] for r in regressions],
+                          ["render", "view"])
+        faster["config"]["rows"] = 100
+        self.assertRaises(ValueError, compare, results, faster)
+
+
+class LoadTestTest(TestCase):
+
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEquals(percentile(values, 0.5), 51)
+        self.assertEquals(percentile(values, 0.99), 99)
+        self.assertEquals(percentile(values, 1.0), 100)
+        self.assertTrue(percentile([], 0.5) is None)
+
+    def test_run_scenario(self):
+        """
+            Every client makes its requests, and failures are counted
+            rather than stopping the run
+        """
+        run = run_scenario(["/apps/hrmc-views/no/such/page"], clients=3,
+                           requests=4)
+        self.assertEquals(run["requests"], 12)
+        self.assertEquals(run["errors"], 12)
+        latency = run["latency_ms"]
+        self.assertTrue(0 <= latency["p50"] <= latency["p99"]
+                        <= latency["max"])
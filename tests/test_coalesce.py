@@ -0,0 +1,80 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import threading
+import time
+
+from django.test import TestCase
+
+from tardis.apps.hrmc_views.coalesce import Debouncer
+
+
+class DebouncerTest(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.called = threading.Event()
+
+        def func(key):
+            self.calls.append(key)
+            self.called.set()
+        self.debouncer = Debouncer(func, 0.2)
+
+    def test_burst_called_once(self):
+        """
+            Touches within the quiet period collapse into one call per key
+        """
+        for i in range(100):
+            self.debouncer.touch(1)
+            self.debouncer.touch(i % 2 + 2)
+        self.assertEquals(self.calls, [])
+        time.sleep(0.6)
+        self.assertEquals(sorted(self.calls), [1, 2, 3])
+        self.assertEquals(self.debouncer.pending(), [])
+
+    def test_touch_postpones(self):
+        """
+            A key touched again before going quiet is not called yet
+        """
+        for i in range(5):
+            self.debouncer.touch(1)
+            time.sleep(0.1)
+        self.assertEquals(self.calls, [])
+        self.assertTrue(self.called.wait(1))
+        self.assertEquals(self.calls, [1])
+
+    def test_wakes_after_idle(self):
+        """
+            A key touched after the thread has gone idle is still called
+        """
+        self.debouncer.touch(1)
+        self.assertTrue(self.called.wait(1))
+        self.called.clear()
+        time.sleep(0.3)
+        self.debouncer.touch(2)
+        self.assertTrue(self.called.wait(1))
+        self.assertEquals(self.calls, [1, 2])
+
+    def test_flush(self):
+        self.debouncer.touch(1)
+        self.debouncer.flush()
+        self.assertEquals(self.calls, [1])
+        time.sleep(0.3)
+        self.assertEquals(self.calls, [1])
@@ -0,0 +1,59 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import numpy
+
+from django.test import TestCase
+
+from tardis.apps.hrmc_views.decimate import downsample, lttb, minmax
+
+
+class DecimateTest(TestCase):
+
+    def setUp(self):
+        self.x = numpy.linspace(0.0, 20.0, 100001)
+        self.y = numpy.sin(3.0 * self.x) * numpy.exp(-self.x / 5.0)
+        self.y[31337] = 5.0
+
+    def test_lttb(self):
+        """
+            Keeps n points in order, the end points and the spike
+        """
+        x, y = lttb(self.x, self.y, 1000)
+        self.assertEquals(len(x), 1000)
+        self.assertTrue((numpy.diff(x) > 0).all())
+        self.assertEquals((x[0], x[-1]), (self.x[0], self.x[-1]))
+        self.assertEquals(y.max(), 5.0)
+
+    def test_minmax(self):
+        """
+            Keeps about n points in order, the end points and both extremes
+        """
+        x, y = minmax(self.x, self.y, 1000)
+        self.assertTrue(len(x) <= 1002)
+        self.assertTrue((numpy.diff(x) > 0).all())
+        self.assertEquals((x[0], x[-1]), (self.x[0], self.x[-1]))
+        self.assertEquals((y.min(), y.max()), (self.y.min(), 5.0))
+
+    def test_short_series_unchanged(self):
+        for method in ("lttb", "minmax"):
+            x, y = downsample([1.0, 2.0, 3.0], [4.0, 5.0, 6.0], 10, method)
+            self.assertEquals(list(x), [1.0, 2.0, 3.0])
+            self.assertEquals(list(y), [4.0, 5.0, 6.0])
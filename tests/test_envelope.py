@@ -0,0 +1,147 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import os
+import shutil
+import tempfile
+
+import numpy
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from tardis.apps.hrmc_views import envelope
+from tardis.apps.hrmc_views.envelope import build_envelope, level_sizes
+from tardis.apps.hrmc_views.envelope import load_envelope, zoom
+from tardis.apps.hrmc_views.seriescache import get_series_cache
+
+
+def _columns(r, g, r0, r1, width):
+    """Lowest and highest g(r) of each pixel column, the slow way"""
+    step = (r1 - r0) / float(width)
+    lows, highs = [], []
+    for i in range(width):
+        inside = g[(r >= r0 + i * step) & (r < r0 + (i + 1) * step)]
+        lows.append(inside.min())
+        highs.append(inside.max())
+    return lows, highs
+
+
+class EnvelopeTest(TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(3)
+        self.r = numpy.arange(100000) * 0.01
+        self.g = numpy.cumsum(rng.normal(size=len(self.r)))
+
+    def test_build(self):
+        g = numpy.arange(40.0)[::-1]
+        env = build_envelope(g, base=4)
+        self.assertEquals(level_sizes(40, 4), [10, 5, 3, 2, 1])
+        self.assertEquals(env.shape, (2, 21))
+        self.assertEquals(list(env[0, :3]), [36, 32, 28])
+        self.assertEquals(list(env[1, :3]), [39, 35, 31])
+        # the odd bin out of level 1 is carried up on its own
+        self.assertEquals(list(env[:, 17]), [0, 7])
+        self.assertEquals(list(env[:, 20]), [0, 39])
+        self.assertEquals(build_envelope([]).shape, (2, 0))
+
+    def test_zoom(self):
+        """
+            Every level and the raw points cover each column's extremes,
+            overlapping their neighbours by at most a bin
+        """
+        env = build_envelope(self.g)
+        for r0, r1, width in [(0, 1000, 100), (0, 1000, 7),
+                              (123.456, 789.01, 50), (500, 520, 100)]:
+            r, g = zoom(self.r, self.g, env, r0, r1, width)
+            self.assertEquals(len(r), 2 * width)
+            step = (r1 - r0) / float(width)
+            self.assertTrue(numpy.allclose(
+                r[::2], r0 + (numpy.arange(width) + 0.5) * step))
+            lows, highs = _columns(self.r, self.g, r0, r1, width)
+            self.assertTrue(numpy.all(g[::2] <= lows))
+            self.assertTrue(numpy.all(g[1::2] >= highs))
+            # inner columns reach no further than their neighbours
+            for i in range(1, width - 1):
+                self.assertTrue(g[2 * i] >= min(lows[i - 1:i + 2]))
+                self.assertTrue(g[2 * i + 1] <= max(highs[i - 1:i + 2]))
+
+    def test_zoom_edges(self):
+        """
+            Extremes just outside the range are not drawn inside it
+        """
+        r = numpy.arange(1000000) * 2e-5
+        g = numpy.zeros(len(r))
+        g[int(numpy.searchsorted(r, 9.999))] = 50
+        g[int(numpy.searchsorted(r, 12.00002))] = -50
+        env = build_envelope(g)
+        for r0, r1, width in [(10, 12, 100), (10, 12, 7), (5, 9.998, 100),
+                              (0.00003, 9.998, 1000), (9.9991, 19, 50)]:
+            zr, zg = zoom(r, g, env, r0, r1, width)
+            inside = (r >= r0) & (r <= r1)
+            self.assertEquals(zg.max(), g[inside].max(), (r0, r1))
+            self.assertEquals(zg.min(), g[inside].min(), (r0, r1))
+        zr, zg = zoom(r, g, env, 9.99, 10.01, 100)
+        self.assertEquals(zg.max(), 50)
+
+    def test_zoom_few_points(self):
+        env = build_envelope(self.g)
+        r, g = zoom(self.r, self.g, env, 1.0, 1.1, 100)
+        self.assertTrue(numpy.allclose(r, self.r[99:112]))
+        self.assertTrue(numpy.allclose(g, self.g[99:112]))
+        r, g = zoom(self.r, self.g, env, 2000, 3000, 100)
+        self.assertEquals(list(r), [self.r[-1]])
+        self.assertRaises(ValueError, zoom, self.r, self.g, env, 1, 1, 100)
+
+    def test_zoom_cost(self):
+        """
+            The values read grow with the width, not the series
+        """
+        read = []
+
+        class Counted(numpy.ndarray):
+            def __getitem__(self, item):
+                value = numpy.ndarray.__getitem__(self, item)
+                read.append(numpy.size(value))
+                return value
+        for n in (10000, 100000):
+            del read[:]
+            zoom(self.r[:n].view(Counted), self.g[:n].view(Counted),
+                 build_envelope(self.g[:n]).view(Counted),
+                 0, self.r[n - 1], 200)
+            self.assertTrue(sum(read) < 8 * 200)
+
+    def test_load_envelope(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "grexp.dat")
+            with open(path, "w") as f:
+                f.write("".join("%d %d\n" % (x, x % 5) for x in range(100)))
+            with override_settings(HRMC_SERIES_CACHE=tmpdir):
+                r, g, env = load_envelope(path, "ab" * 64)
+                self.assertEquals(env.shape, (2, 7 + 4 + 2 + 1))
+                cached = get_series_cache().get("ab" * 64, envelope.KIND)
+                self.assertTrue(numpy.array_equal(cached, env))
+                r, g, again = load_envelope(path, "ab" * 64)
+                self.assertTrue(isinstance(again, numpy.memmap))
+                r, g, env = load_envelope(path)
+                self.assertEquals(env.shape, (2, 14))
+        finally:
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,90 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+
+from tardis.apps.hrmc_views.grdata import load_series
+
+
+class GrDataTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, contents):
+        path = os.path.join(self.tmpdir, "grfinal21.dat")
+        with open(path, "wb") as f:
+            f.write(contents)
+        return path
+
+    def test_load_series(self):
+        """
+            Two column file without a trailing newline loads as r, g rows
+        """
+        r, g = load_series(self._write(b"1 2\n 2 4\n4 9"))
+        self.assertEquals(list(r), [1.0, 2.0, 4.0])
+        self.assertEquals(list(g), [2.0, 4.0, 9.0])
+
+    def test_chunk_boundaries(self):
+        """
+            Lines split across chunks give the same result as one read
+        """
+        contents = b"".join(b"%d.5 %d.25\n" % (i, i * 2) for i in range(500))
+        path = self._write(contents)
+        whole = load_series(path)
+        for chunk_size in (1, 3, 7, 64):
+            self.assertEquals(load_series(path, chunk_size).tolist(),
+                              whole.tolist())
+        self.assertEquals(whole.shape, (2, 500))
+
+    def test_blank_and_comment_lines(self):
+        """
+            Blank lines, comments and extra columns are skipped
+        """
+        r, g = load_series(self._write(
+            b"# r g(r)\n1 2\n\n! fortran style\n2 4 0.1\r\n4 9\n"))
+        self.assertEquals(list(r), [1.0, 2.0, 4.0])
+        self.assertEquals(list(g), [2.0, 4.0, 9.0])
+
+    def test_bad_line(self):
+        """
+            A line with a single column is an error, not silently paired
+        """
+        path = self._write(b"1 2\n3\n4 5\n")
+        self.assertRaises(ValueError, load_series, path)
+
+    def test_misaligned_columns(self):
+        """
+            Lines with three and one columns are not paired up between them
+        """
+        path = self._write(b"1 2 3\n4\n")
+        self.assertRaises(ValueError, load_series, path)
+        path = self._write(b"1 2\n3 4 5\n6\n7 8\n")
+        self.assertRaises(ValueError, load_series, path)
+
+    def test_empty(self):
+        self.assertEquals(load_series(self._write(b"")).shape, (2, 0))
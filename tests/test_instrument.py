@@ -0,0 +1,125 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import logging
+import socket
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from tardis.apps.hrmc_views import instrument
+from tardis.apps.hrmc_views.instrument import MemorySink, StatsdSink
+
+
+class _Records(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class InstrumentTest(TestCase):
+
+    def test_disabled(self):
+        with override_settings(HRMC_INSTRUMENT_SINK=None):
+            self.assertTrue(instrument.get_sink() is None)
+            self.assertTrue(instrument.timer("a") is instrument.timer("b"))
+            instrument.incr("a")
+            instrument.observe("a", 1)
+            self.assertTrue(instrument.snapshot() is None)
+
+    def test_memory(self):
+        with override_settings(HRMC_INSTRUMENT_SINK="memory"):
+            @instrument.timed("twice")
+            def twice(x):
+                return 2 * x
+            self.assertEquals(twice(4), 8)
+            with instrument.timer("block"):
+                pass
+            instrument.incr("calls")
+            instrument.incr("calls", 2)
+            for value in range(1, 101):
+                instrument.observe("sizes", value)
+            stats = instrument.snapshot()
+        self.assertEquals(stats["counters"], {"calls": 3})
+        self.assertEquals(stats["histograms"]["twice"]["count"], 1)
+        self.assertEquals(stats["histograms"]["block"]["count"], 1)
+        self.assertEquals(stats["histograms"]["sizes"], {
+            "count": 100, "sum": 5050, "min": 1, "max": 100,
+            "p50": 50, "p99": 99})
+
+    def test_memory_keep(self):
+        """
+            Percentiles come from the last values, totals from all
+        """
+        sink = MemorySink(keep=10)
+        for value in range(100):
+            sink.observe("x", value)
+        stats = sink.snapshot()["histograms"]["x"]
+        self.assertEquals((stats["count"], stats["min"], stats["p50"]),
+                          (100, 0, 94))
+        sink.reset()
+        self.assertEquals(sink.snapshot()["histograms"], {})
+
+    def test_log(self):
+        handler = _Records()
+        instrument.logger.addHandler(handler)
+        level = instrument.logger.level
+        instrument.logger.setLevel(logging.INFO)
+        try:
+            with override_settings(HRMC_INSTRUMENT_SINK="log"):
+                instrument.incr("calls")
+                instrument.observe("bytes", 12)
+        finally:
+            instrument.logger.removeHandler(handler)
+            instrument.logger.setLevel(level)
+        self.assertEquals(handler.messages, ["calls +1", "bytes 12"])
+
+    def test_statsd(self):
+        """
+            Values arrive at a stand-in daemon in StatsD's line format
+        """
+        daemon = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        daemon.bind(("127.0.0.1", 0))
+        daemon.settimeout(5)
+        try:
+            address = "127.0.0.1:%d" % daemon.getsockname()[1]
+            with override_settings(HRMC_INSTRUMENT_SINK="statsd",
+                                   HRMC_STATSD_ADDRESS=address,
+                                   HRMC_STATSD_PREFIX="test"):
+                self.assertTrue(isinstance(instrument.get_sink(),
+                                           StatsdSink))
+                instrument.incr("calls", 2)
+                instrument.observe("bytes", 12)
+                with instrument.timer("block"):
+                    pass
+            lines = [daemon.recv(512).decode("utf-8") for _ in range(3)]
+        finally:
+            daemon.close()
+        self.assertEquals(lines[:2], ["test.calls:2|c", "test.bytes:12|h"])
+        self.assertTrue(lines[2].startswith("test.block:"))
+        self.assertTrue(lines[2].endswith("|ms"))
+
+    def test_unknown(self):
+        with override_settings(HRMC_INSTRUMENT_SINK="carrier pigeon"):
+            self.assertRaises(ValueError, instrument.get_sink)
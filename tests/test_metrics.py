@@ -0,0 +1,51 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import numpy
+from django.test import TestCase
+
+from tardis.apps.hrmc_views.metrics import fit_metrics
+
+
+class FitMetricsTest(TestCase):
+
+    def test_perfect_fit(self):
+        r = numpy.linspace(0, 10, 101)
+        g = 1 + numpy.sin(r)
+        metrics = fit_metrics(r, g, r[::-1], g[::-1])
+        self.assertEquals(sorted(metrics), ["chisquared", "rfactor", "rms"])
+        for value in metrics.values():
+            self.assertAlmostEqual(value, 0)
+
+    def test_interpolated(self):
+        """
+            The calculation is interpolated onto the experiment's r values
+            within the range both cover
+        """
+        metrics = fit_metrics([0, 1, 2, 3, 5], [9, 2, 3, 7, 9],
+                              [1, 2, 4], [2, 4, 9])
+        # compared at r = 1, 2, 3: differences 0, -1, 0.5
+        self.assertAlmostEqual(metrics["chisquared"], 1.25)
+        self.assertAlmostEqual(metrics["rms"], (1.25 / 3) ** 0.5)
+        self.assertAlmostEqual(metrics["rfactor"], (1.25 / 62) ** 0.5)
+
+    def test_no_overlap(self):
+        self.assertEquals(fit_metrics([1, 2], [1, 1], [3, 4], [1, 1]), {})
+        self.assertEquals(fit_metrics([], [], [3, 4], [1, 1]), {})
@@ -0,0 +1,153 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import os
+import shutil
+import tempfile
+import time
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from tardis.apps.hrmc_views import plotstore
+from tardis.apps.hrmc_views.plotstore import PlotStore
+
+
+def _images(n):
+    """Plot sizes of n bytes between them"""
+    return {("thumb", "png"): b"t" * (n // 4), ("medium", "png"): b"m" * (n // 4),
+            ("full", "png"): b"f" * (n - 2 * (n // 4))}
+
+
+class PlotStoreTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = PlotStore(self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _age(self, key, seconds):
+        """Makes key last used seconds ago"""
+        path = self.store.path(key)
+        then = time.time() - seconds
+        os.utime(path, (then, os.path.getmtime(path)))
+
+    def test_open(self):
+        """
+            Stored sizes are found, the full png stands in for missing png
+            sizes, and hits and misses are counted
+        """
+        key = "a" * 40
+        self.store.put(key, b"full")
+        self.store.put(key, b"thumb", "thumb")
+        before = plotstore.stats()
+        with self.store.open(key, "thumb") as f:
+            self.assertEquals(f.read(), b"thumb")
+        with self.store.open(key, "medium") as f:
+            self.assertEquals(f.read(), b"full")
+        self.assertTrue(self.store.find(key, "medium", "webp") is None)
+        self.assertRaises(IOError, self.store.open, key, "medium", "webp")
+        self.assertRaises(IOError, self.store.open, "b" * 40)
+        after = plotstore.stats()
+        self.assertEquals(after['hits'] - before['hits'], 2)
+        self.assertEquals(after['misses'] - before['misses'], 2)
+
+    def test_touch(self):
+        """
+            Opening a plot marks it used without changing its mtime
+        """
+        key = "a" * 40
+        self.store.put(key, b"full")
+        self._age(key, 3600)
+        mtime = os.path.getmtime(self.store.path(key))
+        self.store.open(key, "thumb").close()
+        st = os.stat(self.store.path(key))
+        self.assertTrue(time.time() - st.st_atime < 60)
+        self.assertEquals(st.st_mtime, mtime)
+
+    def test_delete(self):
+        key = "a" * 40
+        self.store.put_images(key, _images(100))
+        self.store.put("a" * 39 + "b", b"other")
+        self.store.delete(key)
+        self.assertEquals(os.listdir(os.path.dirname(self.store.path(key))),
+                          ["a" * 39 + "b.png"])
+        self.store.delete("c" * 40)
+
+    def test_evict(self):
+        """
+            The least recently used plots go first, every size at once,
+            until the store is back under 90% of its quota
+        """
+        keys = ["%040x" % i for i in range(5)]
+        for age, key in enumerate(reversed(keys)):
+            self.store.put_images(key, _images(1000))
+            self._age(key, 1000 * (age + 1))
+        # the oldest but recently used
+        self._age(keys[0], 0)
+        before = plotstore.stats()
+        self.assertEquals(self.store.evict(5000), 5000)
+        self.assertEquals(self.store.evict(3000), 2000)
+        self.assertEquals(sorted(self.store.usage()), [keys[0], keys[4]])
+        after = plotstore.stats()
+        self.assertEquals(after['evictions'] - before['evictions'], 3)
+        self.assertEquals(after['evicted_bytes'] - before['evicted_bytes'],
+                          3000)
+
+    def test_evict_partial(self):
+        """
+            A plot still being written is not evicted, one abandoned part
+            way is evicted first
+        """
+        keys = ["%040x" % i for i in range(3)]
+        for key in keys:
+            self.store.put_images(key, _images(1000))
+        for key in keys[1:]:
+            os.remove(self.store.path(key))
+        then = time.time() - plotstore.WRITE_GRACE - 60
+        for size in ("thumb", "medium"):
+            os.utime(self.store.path(keys[2], size), (then, then))
+        usage = self.store.usage()
+        self.assertEquals(sorted(usage), [keys[0], keys[2]])
+        self.assertEquals(usage[keys[2]][1], 0)
+        self.store.evict(1400)
+        self.assertEquals(sorted(self.store.usage()), [keys[0]])
+        self.assertTrue(self.store.exists(keys[1], "thumb"))
+
+    def test_quota(self):
+        """
+            Writes keep the store within its quota, the newest plots kept
+        """
+        keys = ["%040x" % i for i in range(10)]
+        with override_settings(HRMC_PLOT_STORE_QUOTA=3500):
+            for i, key in enumerate(keys):
+                self.store.put_images(key, _images(1000))
+                self._age(key, 1000 - i)
+        usage = self.store.usage()
+        self.assertTrue(sum(size for size, used in usage.values()) <= 3500)
+        self.assertTrue(keys[-1] in usage)
+        self.assertTrue(keys[0] not in usage)
+
+    def test_no_quota(self):
+        for i in range(5):
+            self.store.put_images("%040x" % i, _images(1000))
+        self.assertEquals(len(self.store.usage()), 5)
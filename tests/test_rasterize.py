@@ -0,0 +1,109 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import io
+
+import numpy
+from django.test import TestCase
+from matplotlib.image import imread
+
+from tardis.apps.hrmc_views import rasterize
+from tardis.apps.hrmc_views.render import PlotRenderer
+
+
+def _pixels(png):
+    return imread(io.BytesIO(png))[:, :, :3]
+
+
+def _difference(a, b, block=10):
+    """Mean absolute difference of a and b averaged over blocks of pixels,
+    so one pixel offsets and antialiasing barely count
+    """
+    h = a.shape[0] // block * block
+    w = a.shape[1] // block * block
+
+    def blocks(pixels):
+        return pixels[:h, :w].reshape(
+            h // block, block, w // block, block, 3).mean(axis=(1, 3))
+    return numpy.abs(blocks(a) - blocks(b)).mean()
+
+
+class RasterizeTest(TestCase):
+
+    def setUp(self):
+        self.r = numpy.linspace(0.5, 12, 1000)
+        self.raster = PlotRenderer(size=(8, 6), dpi=50, backend="raster")
+        self.matplotlib = PlotRenderer(size=(8, 6), dpi=50,
+                                       backend="matplotlib")
+
+    def _curves(self, phase=0, label="Calculation 21"):
+        r = self.r
+        return [(r, 1 + numpy.sin(3 * r + phase) * numpy.exp(-r / 4),
+                 label, "blue", "D"),
+                (r[::10], 1 + 0.9 * numpy.sin(3 * r[::10]) *
+                 numpy.exp(-r[::10] / 4), "Experiment", "red", "o")]
+
+    def test_encode_png(self):
+        pixels = numpy.zeros((3, 4, 3), dtype=numpy.uint8)
+        pixels[1, 2] = (255, 128, 0)
+        decoded = _pixels(rasterize.encode_png(pixels))
+        self.assertEquals(decoded.shape, (3, 4, 3))
+        self.assertTrue(numpy.allclose(decoded * 255, pixels))
+
+    def test_downscale(self):
+        pixels = numpy.zeros((4, 6, 3), dtype=numpy.uint8)
+        pixels[:2, :2] = 255
+        scaled = rasterize.downscale(pixels, 3)
+        self.assertEquals(scaled.shape, (2, 3, 3))
+        self.assertEquals(scaled[0, 0].tolist(), [255, 255, 255])
+        self.assertEquals(scaled[1, 2].tolist(), [0, 0, 0])
+        self.assertTrue(rasterize.downscale(pixels, 6) is pixels)
+
+    def test_nice_ticks(self):
+        self.assertEquals(rasterize.nice_ticks(0, 12.6), (2, [0, 2, 4, 6,
+                                                             8, 10, 12]))
+        step, ticks = rasterize.nice_ticks(0.25, 1.95)
+        self.assertAlmostEqual(step, 0.2)
+        self.assertEquals(len(ticks), 8)
+
+    def test_matches_matplotlib(self):
+        """
+            The rasterizer draws the same plot as matplotlib, give or take
+            fonts and antialiasing
+        """
+        png = self.raster.render(self._curves())
+        self.assertTrue(png.startswith(b"\x89PNG\r\n\x1a\n"))
+        drawn = _pixels(png)
+        same = _pixels(self.matplotlib.render(self._curves()))
+        other = _pixels(self.matplotlib.render(self._curves(phase=1.5)))
+        self.assertEquals(drawn.shape, same.shape)
+        self.assertTrue(_difference(drawn, same) < 0.03)
+        self.assertTrue(_difference(drawn, same) <
+                        _difference(drawn, other) / 2)
+
+    def test_fallback(self):
+        """
+            Plots the rasterizer can't draw are drawn by matplotlib
+        """
+        curves = self._curves(label="grfinal.txt")
+        self.assertRaises(rasterize.Unsupported, rasterize.render_png,
+                          curves, (8, 6), 50, "r", "g")
+        self.assertEquals(self.raster.render(curves),
+                          self.matplotlib.render(curves))
@@ -0,0 +1,133 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import os
+import shutil
+import tempfile
+from threading import Thread
+
+import io
+
+from django.test import TestCase
+from matplotlib.image import imread
+
+from tardis.apps.hrmc_views.render import PlotRenderer, plot_label
+from tardis.apps.hrmc_views.render import is_pil_available
+
+
+class PlotRendererTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.renderer = PlotRenderer(size=(4, 3), dpi=50)
+        self.jobs = []
+        for i in range(4):
+            grexp = self._write("grexp%d.dat" % i,
+                "".join("%d %d\n" % (x, (x * (i + 2)) % 7)
+                        for x in range(50)))
+            grfinal = self._write("grfinal%d.dat" % i,
+                "".join("%d %d\n" % (x, (x * (i + 3)) % 5)
+                        for x in range(50)))
+            self.jobs.append((grexp, [(grfinal, "grfinal%d.dat" % i)]))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, contents):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "w") as f:
+            f.write(contents)
+        return path
+
+    def test_plot_label(self):
+        self.assertEquals(plot_label("grfinal21.dat"), "Calculation 21")
+        self.assertEquals(plot_label("grfinal.txt"), "grfinal.txt")
+
+    def test_render_png(self):
+        png = self.renderer.render_files(*self.jobs[0])
+        self.assertTrue(png.startswith(b"\x89PNG\r\n\x1a\n"))
+
+    def test_render_images(self):
+        """
+            One draw gives every size, each no bigger than asked for
+        """
+        renderer = PlotRenderer()
+        curves = renderer.file_curves(*self.jobs[0])
+        images = renderer.render_images(curves, webp=is_pil_available)
+        shapes = dict((size, imread(io.BytesIO(images[(size, "png")])).shape)
+                      for size in ("thumb", "medium", "full"))
+        self.assertEquals(shapes["full"][:2], (1350, 1550))
+        self.assertEquals(shapes["medium"][:2], (697, 800))
+        self.assertEquals(shapes["thumb"][:2], (305, 350))
+        if is_pil_available:
+            self.assertTrue(images[("thumb", "webp")].startswith(b"RIFF"))
+        else:
+            self.assertFalse(("thumb", "webp") in images)
+
+    def test_render_calculations(self):
+        """
+            Every calculation is drawn, and long series are downsampled
+        """
+        grfinals = [(path, filename)
+                    for grexp, [(path, filename)] in self.jobs]
+        one = self.renderer.render_files(self.jobs[0][0], grfinals[-1:])
+        all = self.renderer.render_files(self.jobs[0][0], grfinals)
+        self.assertTrue(all.startswith(b"\x89PNG\r\n\x1a\n"))
+        self.assertNotEqual(one, all)
+
+        grfinal = self._write("grfinal99.dat", "".join(
+            "%d %d\n" % (x, x % 11) for x in range(200000)))
+        png = self.renderer.render_files(self.jobs[0][0],
+                                         [(grfinal, "grfinal99.dat")])
+        self.assertTrue(png.startswith(b"\x89PNG\r\n\x1a\n"))
+
+    def test_render_many(self):
+        """
+            Renders on a thread pool match the same renders made one at a
+            time, in order
+        """
+        expected = [self.renderer.render_files(*job) for job in self.jobs]
+        self.assertEquals(len(set(expected)), len(self.jobs))
+        jobs = self.jobs * 5
+        self.assertEquals(self.renderer.render_many(jobs, threads=8),
+                          expected * 5)
+
+    def test_concurrent_threads(self):
+        """
+            Threads rendering at the same time never draw on each
+            other's figures
+        """
+        expected = [self.renderer.render_files(*job) for job in self.jobs]
+        results = {}
+
+        def render(n):
+            job = n % len(self.jobs)
+            for i in range(3):
+                results[(n, i)] = (job, self.renderer.render_files(
+                    *self.jobs[job]))
+
+        threads = [Thread(target=render, args=(n,)) for n in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(len(results), 48)
+        for job, png in results.values():
+            self.assertTrue(png == expected[job])
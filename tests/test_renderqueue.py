@@ -0,0 +1,168 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.test import TestCase
+
+from tardis.apps.hrmc_views.renderqueue import LocalQueue, SQLiteQueue
+from tardis.apps.hrmc_views.renderqueue import make_job
+
+
+class _File(object):
+    """Stands in for a Dataset_File whose file was never written"""
+    def __init__(self, filename, sha512sum):
+        self.filename = filename
+        self.sha512sum = sha512sum
+
+    def get_absolute_filepath(self):
+        return os.path.join("/nonexistent", self.filename)
+
+
+def _render_once(path, log, start, results):
+    """Process body racing every other process to render dataset 1"""
+    queue = SQLiteQueue(path, processes=0)
+
+    def render():
+        time.sleep(0.5)
+        with open(log, "a") as f:
+            f.write("%d %f\n" % (os.getpid(), time.time()))
+    start.wait()
+    rendered = queue.once(1, render, poll=0.01)
+    results.put((rendered, time.time()))
+
+
+class RenderQueueTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "queue.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_local_claim(self):
+        """
+            A dataset can only be claimed once until it is released
+        """
+        queue = LocalQueue(processes=0)
+        self.assertTrue(queue._claim(1))
+        self.assertFalse(queue._claim(1))
+        self.assertTrue(queue.is_pending(1))
+        self.assertFalse(queue.is_pending(2))
+        queue._release(1)
+        self.assertFalse(queue.is_pending(1))
+        self.assertTrue(queue._claim(1))
+
+    def test_sqlite_claim_shared(self):
+        """
+            Claims made through one SQLiteQueue are seen by another
+        """
+        first = SQLiteQueue(self.path, processes=0)
+        second = SQLiteQueue(self.path, processes=0)
+        self.assertTrue(first._claim(1))
+        self.assertFalse(second._claim(1))
+        self.assertTrue(second.is_pending(1))
+        first._release(1)
+        self.assertFalse(second.is_pending(1))
+        self.assertTrue(second._claim(1))
+
+    def test_sqlite_stale_claim(self):
+        """
+            A claim older than the timeout can be taken over
+        """
+        first = SQLiteQueue(self.path, processes=0, timeout=0.1)
+        self.assertTrue(first._claim(1))
+        time.sleep(0.2)
+        second = SQLiteQueue(self.path, processes=0, timeout=0.1)
+        self.assertFalse(second.is_pending(1))
+        self.assertTrue(second._claim(1))
+
+    def test_local_once(self):
+        """
+            Threads asking for the same dataset at once render it once, and
+            the others return after it is done
+        """
+        queue = LocalQueue(processes=0)
+        calls = []
+        results = []
+
+        def render():
+            time.sleep(0.2)
+            calls.append(time.time())
+
+        def ask():
+            results.append((queue.once(1, render, poll=0.01), time.time()))
+        threads = [threading.Thread(target=ask) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(len(calls), 1)
+        self.assertEquals(sorted(r for r, t in results), [False] * 7 + [True])
+        self.assertTrue(all(t >= calls[0] for r, t in results))
+        self.assertFalse(queue.is_pending(1))
+
+    def test_sqlite_once_processes(self):
+        """
+            Of many processes asking for the same dataset at once exactly
+            one renders it and the rest wait for it
+        """
+        SQLiteQueue(self.path, processes=0)
+        log = os.path.join(self.tmpdir, "renders.log")
+        start = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=_render_once,
+                                         args=(self.path, log, start,
+                                               results))
+                 for i in range(8)]
+        for proc in procs:
+            proc.start()
+        start.set()
+        finished = [results.get(timeout=30) for proc in procs]
+        for proc in procs:
+            proc.join()
+
+        with open(log) as f:
+            renders = f.read().splitlines()
+        self.assertEquals(len(renders), 1)
+        rendered_at = float(renders[0].split()[1])
+        self.assertEquals(sorted(r for r, t in finished),
+                          [False] * 7 + [True])
+        self.assertTrue(all(t >= rendered_at for r, t in finished))
+        self.assertFalse(SQLiteQueue(self.path).is_pending(1))
+
+    def test_make_job_unverified(self):
+        """
+            Jobs are built from stored sha512sums without reading the
+            files, and not at all until every file is verified
+        """
+        grexp = _File("grexp.dat", "a" * 128)
+        grfinal = _File("grfinal21.dat", "")
+        self.assertEquals(make_job(1, grexp, [grfinal]), None)
+        grfinal.sha512sum = "b" * 128
+        job = make_job(1, grexp, [grfinal])
+        self.assertEquals(job[2], "/nonexistent/grexp.dat")
+        self.assertEquals(sorted(job[4].values()), ["a" * 128, "b" * 128])
@@ -0,0 +1,78 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+from django.test import TestCase
+
+from tardis.tardis_portal.models import Schema, ParameterName
+
+from tardis.apps.hrmc_views import schemacache
+
+
+class SchemaCacheTest(TestCase):
+
+    HRMCSCHEMA = "http://rmit.edu.au/schemas/hrmcdataset"
+
+    def setUp(self):
+        schemacache.clear()
+        self.sch = Schema(namespace=self.HRMCSCHEMA,
+            name="hrmc_views", type=Schema.DATASET)
+        self.sch.save()
+        self.param = ParameterName(schema=self.sch, name="plot",
+            full_name="scatterplot", units="image",
+            data_type=ParameterName.FILENAME
+            )
+        self.param.save()
+
+    def test_cached(self):
+        """
+            Repeated lookups hit the cache without a query
+        """
+        before = schemacache.stats()
+        self.assertEquals(schemacache.get_schema(self.HRMCSCHEMA), self.sch)
+        self.assertEquals(
+            schemacache.get_parameter_name(self.sch, "plot"), self.param)
+        self.assertNumQueries(0, schemacache.get_schema, self.HRMCSCHEMA)
+        self.assertNumQueries(0, schemacache.get_parameter_name,
+                              self.sch, "plot")
+        after = schemacache.stats()
+        self.assertEquals(after['misses'] - before['misses'], 2)
+        self.assertEquals(after['hits'] - before['hits'], 2)
+
+    def test_missing_not_cached(self):
+        self.assertRaises(Schema.DoesNotExist,
+                          schemacache.get_schema, "http://example.com/none")
+        Schema(namespace="http://example.com/none",
+               type=Schema.DATASET).save()
+        self.assertTrue(schemacache.get_schema("http://example.com/none"))
+
+    def test_invalidated_on_save_and_delete(self):
+        """
+            Saving or deleting a schema or parameter name empties the cache
+        """
+        schemacache.get_schema(self.HRMCSCHEMA)
+        self.sch.name = "renamed"
+        self.sch.save()
+        self.assertEquals(
+            schemacache.get_schema(self.HRMCSCHEMA).name, "renamed")
+
+        schemacache.get_parameter_name(self.sch, "plot")
+        self.param.delete()
+        self.assertRaises(ParameterName.DoesNotExist,
+                          schemacache.get_parameter_name, self.sch, "plot")
@@ -0,0 +1,75 @@
+# Copyright (C) 2013, RMIT University
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import os
+import shutil
+import tempfile
+
+import numpy
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from tardis.apps.hrmc_views import seriescache
+from tardis.apps.hrmc_views.seriescache import SeriesCache, load_cached
+
+
+class SeriesCacheTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "grfinal01.dat")
+        with open(self.path, "w") as f:
+            f.write("".join("%d %d\n" % (x, x * x) for x in range(100)))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_put_get(self):
+        cache = SeriesCache(os.path.join(self.tmpdir, "cache"))
+        self.assertTrue(cache.get("ab" * 64) is None)
+        values = numpy.arange(10.0).reshape(-1, 2).T
+        cache.put("ab" * 64, values)
+        cached = cache.get("ab" * 64)
+        self.assertTrue(isinstance(cached, numpy.memmap))
+        self.assertTrue(numpy.array_equal(cached, values))
+        r, g = cached
+        self.assertEquals(list(r), [0, 2, 4, 6, 8])
+
+    def test_load_cached(self):
+        """
+            A file is parsed once per checksum, and not cached without one
+        """
+        calls = []
+        load_series = seriescache.load_series
+
+        def counting_load_series(path):
+            calls.append(path)
+            return load_series(path)
+        seriescache.load_series = counting_load_series
+        try:
+            with override_settings(HRMC_SERIES_CACHE=self.tmpdir):
+                first = load_cached(self.path, "cd" * 64)
+                again = load_cached(self.path, "cd" * 64)
+                load_cached(self.path)
+        finally:
+            seriescache.load_series = load_series
+        self.assertEquals(calls, [self.path, self.path])
+        self.assertTrue(numpy.array_equal(first, again))
+        self.assertEquals(list(again[1][:3]), [0, 1, 4])
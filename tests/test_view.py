@@ -23,8 +23,13 @@ import os
 from django.test import TestCase
 from django.contrib.auth.models import User
 from django.test.client import Client
+from django.test.utils import override_settings
 from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db import connection
 import logging
+import threading
+import time
 
 
 from tardis.tardis_portal.models import UserProfile, ExperimentACL, \
@@ -33,6 +38,14 @@ from tardis.tardis_portal.models import UserProfile, ExperimentACL, \
 from tardis.tardis_portal.models import License
 
 from tardis.tardis_portal.filters import hrmc
+from tardis.apps.hrmc_views import renderqueue, views
+from tardis.apps.hrmc_views.renderqueue import get_queue
+from tardis.apps.hrmc_views.views import get_image_to_show
+from tardis.apps.hrmc_views.plots import pick_plot_files
+from tardis.apps.hrmc_views.plotstore import get_store
+from tardis.apps.hrmc_views.schemacache import get_schema
+from tardis.apps.hrmc_views.seriescache import get_series_cache
+from tardis.apps.hrmc_views.series import unpack_series
 
 logger = logging.getLogger(__name__)
 
@@ -114,6 +127,40 @@ def _create_test_dataset(ds, exp_id, fnames):
     return ds
 
 
+def _create_hrmc_schema(namespace):
+    sch = Schema(namespace=namespace,
+        name="hrmc_views", type=Schema.DATASET)
+    sch.save()
+    param = ParameterName(schema=sch, name="plot",
+        full_name="scatterplot", units="image",
+        data_type=ParameterName.FILENAME
+        )
+    param.save()
+    for name in ("rfactor", "chisquared", "rms"):
+        ParameterName(schema=sch, name=name, full_name=name,
+            data_type=ParameterName.NUMERIC, is_searchable=True).save()
+    return sch, param
+
+
+def _count_queries(func, *args, **kwargs):
+    """Returns the number of queries func(*args, **kwargs) makes"""
+    use_debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    start = len(connection.queries)
+    try:
+        func(*args, **kwargs)
+        return len(connection.queries) - start
+    finally:
+        connection.use_debug_cursor = use_debug_cursor
+
+
+def _content(response):
+    """Returns the body of a response, whether streamed or not"""
+    if getattr(response, 'streaming', False):
+        return b''.join(response.streaming_content)
+    return response.content
+
+
 def get_param_sets(ds):
 
     return DatasetParameterSet.objects.filter(
@@ -121,10 +168,17 @@ def get_param_sets(ds):
         dataset=ds)
 
 
+@override_settings(HRMC_RENDER_QUEUE='local', HRMC_RENDER_PROCESSES=0,
+                   HRMC_FILTER_QUIET_PERIOD=0)
 class HRMCOutputTest(TestCase):
 
     HRMCSCHEMA = "http://rmit.edu.au/schemas/hrmcdataset"
 
+    # most of these are the portal's access checks and base template
+    MAX_VIEW_QUERIES = 25
+    # creating the parameter set and looking for a plot to render
+    MAX_FILTER_QUERIES = 10
+
     def setUp(self):
         pass
 
@@ -172,6 +226,154 @@ class HRMCOutputTest(TestCase):
         self.assertEquals([x.schema.namespace for x in param_sets],
             [self.HRMCSCHEMA])
 
+    def test_hrmc_filter_queries(self):
+        """
+           Each save costs a fixed number of queries however many files
+           the dataset already holds
+        """
+        user = _create_test_user()
+        license = _create_license()
+        exp = _create_test_experiment(user, license)
+        ds = Dataset(description='happy snaps of plumage')
+        ds.save()
+        ds.experiments.add(exp)
+        _create_hrmc_schema(self.HRMCSCHEMA)
+        get_schema(self.HRMCSCHEMA)
+        h = hrmc.HRMCOutput('HRMC', self.HRMCSCHEMA)
+
+        # neither verified nor on disk, as when the filter first sees them
+        def save(filename, dataset=ds):
+            df = Dataset_File(dataset=dataset, filename=filename,
+                              url='path/%s' % filename)
+            df.save()
+            return df
+
+        small = Dataset(description='happy snaps of plumage')
+        small.save()
+        small.experiments.add(exp)
+        h(sender=Dataset_File, instance=save('grfinal1.dat', small))
+        completing = _count_queries(h, sender=Dataset_File,
+                                    instance=save('grexp.dat', small))
+        self.assertEquals(len(get_param_sets(small)), 1)
+        self.assertTrue(completing <= self.MAX_FILTER_QUERIES, completing)
+
+        for i in range(50):
+            df = save('output%s.dat' % i)
+            self.assertNumQueries(0, h, sender=Dataset_File, instance=df)
+        for i in range(50):
+            df = save('grfinal%s.dat' % i)
+            # only asks whether grexp.dat has arrived yet
+            self.assertNumQueries(1, h, sender=Dataset_File, instance=df)
+        self.assertEquals(list(get_param_sets(ds)), [])
+
+        # the save completing the dataset costs the same with 100 files
+        df = save('grexp.dat')
+        self.assertNumQueries(completing, h, sender=Dataset_File,
+                              instance=df)
+        self.assertEquals(len(get_param_sets(ds)), 1)
+
+        for i in range(50, 100):
+            df = save('grfinal%s.dat' % i)
+            self.assertNumQueries(0, h, sender=Dataset_File, instance=df)
+        self.assertEquals(len(get_param_sets(ds)), 1)
+
+    def test_hrmc_filter_burst(self):
+        """
+           A burst of saves to a dataset is evaluated once
+        """
+        user = _create_test_user()
+        license = _create_license()
+        exp = _create_test_experiment(user, license)
+        ds = Dataset(description='happy snaps of plumage')
+        ds.save()
+        ds.experiments.add(exp)
+        _create_hrmc_schema(self.HRMCSCHEMA)
+        h = hrmc.HRMCOutput('HRMC', self.HRMCSCHEMA, quiet_period=60)
+        evaluated = []
+
+        def evaluate(dataset_id):
+            evaluated.append(dataset_id)
+            h._evaluate(dataset_id)
+        h._debouncer.func = evaluate
+
+        for filename in ['grexp.dat'] + ['grfinal%s.dat' % i
+                                         for i in range(50)]:
+            df = Dataset_File(dataset=ds, filename=filename,
+                              url='path/%s' % filename)
+            df.save()
+            self.assertNumQueries(0, h, sender=Dataset_File, instance=df)
+        self.assertEquals(h._debouncer.pending(), [ds.id])
+        self.assertEquals(list(get_param_sets(ds)), [])
+
+        h._debouncer.flush()
+        self.assertEquals(evaluated, [ds.id])
+        self.assertEquals(len(get_param_sets(ds)), 1)
+        self.assertEquals(h._debouncer.pending(), [])
+
+    def test_hrmc_filter_requests(self):
+        """
+           The quiet period of a dataset starts again when a request
+           saving to it finishes, and other datasets are left waiting
+        """
+        user = _create_test_user()
+        license = _create_license()
+        exp = _create_test_experiment(user, license)
+        _create_hrmc_schema(self.HRMCSCHEMA)
+        h = hrmc.HRMCOutput('HRMC', self.HRMCSCHEMA, quiet_period=60)
+        datasets = []
+        for i in range(2):
+            ds = Dataset(description='happy snaps of plumage')
+            ds.save()
+            ds.experiments.add(exp)
+            datasets.append(ds)
+
+        def save(ds, filename):
+            df = Dataset_File(dataset=ds, filename=filename,
+                              url='path/%s' % filename)
+            df.save()
+            h(sender=Dataset_File, instance=df)
+
+        save(datasets[1], 'grexp.dat')
+        h._request_started(sender=None)
+        save(datasets[0], 'grexp.dat')
+        save(datasets[0], 'grfinal21.dat')
+        deadlines = dict(h._debouncer._deadlines)
+        time.sleep(0.01)
+        h._request_finished(sender=None)
+        self.assertEquals(sorted(h._debouncer.pending()),
+                          sorted(ds.id for ds in datasets))
+        self.assertTrue(h._debouncer._deadlines[datasets[0].id] >
+                        deadlines[datasets[0].id])
+        self.assertEquals(h._debouncer._deadlines[datasets[1].id],
+                          deadlines[datasets[1].id])
+        self.assertEquals(list(get_param_sets(datasets[0])), [])
+        # a later request saving to the same dataset doesn't evaluate it
+        h._request_started(sender=None)
+        save(datasets[0], 'grfinal22.dat')
+        h._request_finished(sender=None)
+        self.assertEquals(list(get_param_sets(datasets[0])), [])
+
+        h.flush()
+        self.assertEquals(len(get_param_sets(datasets[0])), 1)
+        self.assertEquals(h._debouncer.pending(), [])
+
+    def test_pick_plot_files(self):
+        """
+           Calculations are ordered by number, and only the last is
+           plotted unless all are asked for
+        """
+        files = [Dataset_File(filename=name) for name in
+                 ('grfinal10.dat', 'grexp.dat', 'grfinal9.dat', 'output.dat',
+                  'grfinal100.dat')]
+        grexp, grfinals = pick_plot_files(files)
+        self.assertEquals(grexp.filename, 'grexp.dat')
+        self.assertEquals([df.filename for df in grfinals],
+                          ['grfinal100.dat'])
+        with self.settings(HRMC_PLOT_ALL_CALCULATIONS=True):
+            grexp, grfinals = pick_plot_files(files)
+        self.assertEquals([df.filename for df in grfinals],
+                          ['grfinal9.dat', 'grfinal10.dat', 'grfinal100.dat'])
+
     def test_contextual_view(self):
         """
             Given schema on dataset, check that  image file created
@@ -214,3 +416,510 @@ class HRMCOutputTest(TestCase):
 
         self.assertTrue(dp)
         self.assertNotEquals(dp.string_value, "")  # ie, it has a filename
+
+    def test_rendering_placeholder(self):
+        """
+            While a render is queued the view shows a placeholder
+        """
+        user = _create_test_user()
+        license = _create_license()
+        exp = _create_test_experiment(user, license)
+        ds = Dataset(description='happy snaps of plumage')
+        ds.save()
+        ds = _create_test_dataset(ds, exp.id, {
+            "grexp.dat": '1 2\n2 3\n3 7\n',
+            "grfinal21.dat": '1 2\n 2 4\n4 9\n'})
+
+        sch = Schema(namespace=self.HRMCSCHEMA,
+            name="hrmc_views", type=Schema.DATASET)
+        sch.save()
+
+        param = ParameterName(schema=sch, name="plot",
+            full_name="scatterplot", units="image",
+            data_type=ParameterName.FILENAME
+            )
+        param.save()
+
+        DatasetParameterSet(schema=sch, dataset=ds).save()
+
+        ds.experiments.add(exp)
+        ds.save()
+
+        queue = get_queue()
+        self.assertTrue(queue._claim(ds.id))
+        try:
+            # losing the claim costs no lookups
+            self.assertNumQueries(0, queue.submit, ds.id)
+            response = Client().get('/dataset/%s' % ds.id)
+        finally:
+            queue._release(ds.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['rendering'])
+        self.assertEquals(list(response.context['display_images']), [])
+        self.assertFalse(DatasetParameter.objects.filter(name=param))
+
+    def test_render_twice(self):
+        """
+            Queues of two processes rendering the same dataset save one
+            plot between them
+        """
+        user = _create_test_user()
+        license = _create_license()
+        exp = _create_test_experiment(user, license)
+        sch, param = _create_hrmc_schema(self.HRMCSCHEMA)
+        ds = Dataset(description='happy snaps of plumage')
+        ds.save()
+        ds = _create_test_dataset(ds, exp.id, {
+            "grexp.dat": '1 2\n2 3\n3 6\n',
+            "grfinal21.dat": '1 2\n 2 4\n4 6\n'})
+        DatasetParameterSet(schema=sch, dataset=ds).save()
+        ds.experiments.add(exp)
+
+        first = renderqueue.LocalQueue(processes=0)
+        second = renderqueue.LocalQueue(processes=0)
+        job = first._make_job(ds.id)
+        self.assertEqual(second._make_job(ds.id), job)
+        first._save(renderqueue.render_job(job))
+        second._save(renderqueue.render_job(job))
+        self.assertEquals(DatasetParameter.objects.filter(
+            parameterset__dataset=ds, name=param).count(), 1)
+        self.assertEquals(DatasetParameter.objects.filter(
+            parameterset__dataset=ds, name__name="rfactor").count(), 1)
+
+    def test_plot_cache(self):
+        """
+            Plot is served with an etag, and identical data uploaded to a
+            second dataset reuses the stored plot without rendering
+        """
+        user = _create_test_user()
+        license = _create_license()
+        exp = _create_test_experiment(user, license)
+        sch, param = _create_hrmc_schema(self.HRMCSCHEMA)
+        files = {"grexp.dat": '1 2\n2 3\n3 7\n',
+                 "grfinal21.dat": '1 2\n 2 4\n4 9\n'}
+        datasets = []
+        for i in range(2):
+            ds = Dataset(description='happy snaps of plumage')
+            ds.save()
+            ds = _create_test_dataset(ds, exp.id, files)
+            DatasetParameterSet(schema=sch, dataset=ds).save()
+            ds.experiments.add(exp)
+            ds.save()
+            datasets.append(ds)
+
+        client = Client()
+        client.get('/dataset/%s' % datasets[0].id)
+        key = DatasetParameter.objects.get(
+            parameterset__dataset=datasets[0], name=param).string_value
+
+        # the fit of the calculation was measured at the same time
+        metrics = dict(DatasetParameter.objects.filter(
+            parameterset__dataset=datasets[0],
+            name__data_type=ParameterName.NUMERIC)
+            .values_list('name__name', 'numerical_value'))
+        self.assertAlmostEqual(metrics['chisquared'], 1.25)
+        self.assertAlmostEqual(metrics['rms'], (1.25 / 3) ** 0.5)
+        self.assertAlmostEqual(metrics['rfactor'], (1.25 / 62) ** 0.5)
+
+        # the render left binary copies of the series it parsed, and
+        # their envelope pyramids
+        for df in Dataset_File.objects.filter(dataset=datasets[0]):
+            self.assertTrue(get_series_cache().get(df.sha512sum) is not None)
+            self.assertTrue(
+                get_series_cache().get(df.sha512sum, ".env") is not None)
+
+        url = reverse('tardis.apps.hrmc_views.views.view_plot',
+                      kwargs={'dataset_id': datasets[0].id, 'key': key})
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['ETag'], '"%s"' % key)
+        self.assertTrue(response['Last-Modified'])
+
+        response = client.get(url, HTTP_IF_NONE_MATCH='"%s"' % key)
+        self.assertEqual(response.status_code, 304)
+
+        # smaller sizes are stored alongside, rendered at the same time
+        for size in ('thumb', 'medium'):
+            response = client.get(reverse(
+                'tardis.apps.hrmc_views.views.view_plot',
+                kwargs={'dataset_id': datasets[0].id, 'key': key,
+                        'size': size, 'format': 'png'}))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/png')
+            self.assertTrue(get_store().exists(key, size))
+
+        def render_plot(*args):
+            raise AssertionError("identical data rendered again")
+        saved = renderqueue.render_plot
+        renderqueue.render_plot = render_plot
+        try:
+            client.get('/dataset/%s' % datasets[1].id)
+        finally:
+            renderqueue.render_plot = saved
+        self.assertEqual(DatasetParameter.objects.get(
+            parameterset__dataset=datasets[1], name=param).string_value, key)
+
+        # a key belonging to another dataset is not served
+        response = client.get(reverse(
+            'tardis.apps.hrmc_views.views.view_plot',
+            kwargs={'dataset_id': datasets[1].id, 'key': '0' * 40}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_plot_range(self):
+        """
+            Plots are streamed whole or by byte range
+        """
+        user = _create_test_user()
+        license = _create_license()
+        exp = _create_test_experiment(user, license)
+        sch, param = _create_hrmc_schema(self.HRMCSCHEMA)
+        ds = Dataset(description='happy snaps of plumage')
+        ds.save()
+        ds = _create_test_dataset(ds, exp.id, {
+            "grexp.dat": '1 2\n2 3\n3 7\n',
+            "grfinal21.dat": '1 2\n 2 4\n4 9\n'})
+        DatasetParameterSet(schema=sch, dataset=ds).save()
+        ds.experiments.add(exp)
+        client = Client()
+        client.get('/dataset/%s' % ds.id)
+        key = DatasetParameter.objects.get(
+            parameterset__dataset=ds, name=param).string_value
+        url = reverse('tardis.apps.hrmc_views.views.view_plot',
+                      kwargs={'dataset_id': ds.id, 'key': key})
+
+        old_chunk_size = views.CHUNK_SIZE
+        views.CHUNK_SIZE = 100
+        try:
+            response = client.get(url)
+            whole = _content(response)
+        finally:
+            views.CHUNK_SIZE = old_chunk_size
+        size = len(whole)
+        self.assertTrue(size > 100)
+        self.assertEqual(response['Content-Length'], str(size))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(whole.startswith(b'\x89PNG'))
+
+        response = client.get(url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(_content(response), whole[:10])
+        self.assertEqual(response['Content-Range'], 'bytes 0-9/%d' % size)
+        response = client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(_content(response), whole[-5:])
+        response = client.get(url, HTTP_RANGE='bytes=100-')
+        self.assertEqual(_content(response), whole[100:])
+        # a stale If-Range gets the whole plot
+        response = client.get(url, HTTP_RANGE='bytes=0-9',
+                              HTTP_IF_RANGE='"%s"' % ('0' * 40))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(_content(response), whole)
+        response = client.get(url, HTTP_RANGE='bytes=%d-' % size)
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */%d' % size)
+        # several ranges at once aren't supported, so get everything
+        response = client.get(url, HTTP_RANGE='bytes=0-1,4-5')
+        self.assertEqual(response.status_code, 200)
+        # a last byte before the first makes the header invalid, not
+        # unsatisfiable
+        response = client.get(url, HTTP_RANGE='bytes=500-100')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(_content(response), whole)
+
+    def test_plot_evicted(self):
+        """
+            Plots evicted from the store are rendered again when asked for
+        """
+        user = _create_test_user()
+        license = _create_license()
+        exp = _create_test_experiment(user, license)
+        sch, param = _create_hrmc_schema(self.HRMCSCHEMA)
+        ds = Dataset(description='happy snaps of plumage')
+        ds.save()
+        ds = _create_test_dataset(ds, exp.id, {
+            "grexp.dat": '1 2\n2 3\n3 8\n',
+            "grfinal21.dat": '1 2\n 2 4\n4 8\n'})
+        DatasetParameterSet(schema=sch, dataset=ds).save()
+        ds.experiments.add(exp)
+        client = Client()
+        client.get('/dataset/%s' % ds.id)
+        key = DatasetParameter.objects.get(
+            parameterset__dataset=ds, name=param).string_value
+        # showing the plot marks it used, even if its images are cached
+        path = get_store().path(key)
+        os.utime(path, (time.time() - 3600, os.path.getmtime(path)))
+        self.assertEqual(client.get('/dataset/%s' % ds.id).status_code, 200)
+        self.assertTrue(time.time() - os.stat(path).st_atime < 60)
+        get_store().delete(key)
+        self.assertFalse(get_store().exists(key))
+
+        response = client.get(reverse(
+            'tardis.apps.hrmc_views.views.view_plot',
+            kwargs={'dataset_id': ds.id, 'key': key, 'size': 'thumb',
+                    'format': 'png'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(_content(response).startswith(b'\x89PNG'))
+        self.assertTrue(get_store().exists(key, 'thumb'))
+        # a key that is not the dataset's plot is not rendered
+        response = client.get(reverse(
+            'tardis.apps.hrmc_views.views.view_plot',
+            kwargs={'dataset_id': ds.id, 'key': '0' * 40}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_view_query_budget(self):
+        """
+            Viewing a rendered dataset stays within a fixed query budget
+            however many files it holds
+        """
+        user = _create_test_user()
+        license = _create_license()
+        exp = _create_test_experiment(user, license)
+        sch, param = _create_hrmc_schema(self.HRMCSCHEMA)
+        client = Client()
+        counts = []
+        for extra in (0, 200):
+            ds = Dataset(description='happy snaps of plumage')
+            ds.save()
+            files = {"grexp.dat": '1 2\n2 3\n3 7\n',
+                     "grfinal21.dat": '1 2\n 2 4\n4 9\n'}
+            for i in range(extra):
+                files["output%s.dat" % i] = 'test data %s\n' % i
+            ds = _create_test_dataset(ds, exp.id, files)
+            DatasetParameterSet(schema=sch, dataset=ds).save()
+            ds.experiments.add(exp)
+            ds.save()
+
+            # first view renders the plot
+            client.get('/dataset/%s' % ds.id)
+            self.assertNumQueries(1, get_image_to_show, ds, render=False)
+            counts.append(_count_queries(client.get, '/dataset/%s' % ds.id))
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertTrue(counts[0] <= self.MAX_VIEW_QUERIES,
+                        "%s queries per view" % counts[0])
+
+    def test_experiment_summary(self):
+        """
+            The summary lists every dataset with plot files, best fit first,
+            and its plot is drawn once until a member's files change
+        """
+        user = _create_test_user()
+        license = _create_license()
+        exp = _create_test_experiment(user, license)
+        sch, param = _create_hrmc_schema(self.HRMCSCHEMA)
+        datasets = []
+        for i in range(3):
+            ds = Dataset(description='run %d' % i)
+            ds.save()
+            files = {"grexp.dat": '1 2\n2 3\n3 7\n'}
+            if i != 2:
+                files["grfinal21.dat"] = '1 2\n2 %d\n3 7\n' % (5 - 2 * i)
+            ds = _create_test_dataset(ds, exp.id, files)
+            DatasetParameterSet(schema=sch, dataset=ds).save()
+            ds.experiments.add(exp)
+            ds.save()
+            datasets.append(ds)
+
+        client = Client()
+        for ds in datasets:
+            client.get('/dataset/%s' % ds.id)
+        response = client.get(reverse(
+            'tardis.apps.hrmc_views.views.view_experiment_summary',
+            kwargs={'experiment_id': exp.id}))
+        self.assertEqual(response.status_code, 200)
+        rows = response.context['rows']
+        # dataset 1 fits exactly, dataset 2 has no calculation
+        self.assertEqual([row[0].id for row in rows],
+                         [datasets[1].id, datasets[0].id])
+        self.assertAlmostEqual(rows[0][1], 0)
+        key = response.context['key']
+
+        url = reverse('tardis.apps.hrmc_views.views.view_summary_plot',
+                      kwargs={'experiment_id': exp.id, 'key': key})
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['ETag'], '"%s"' % key)
+
+        def render_summary(*args):
+            raise AssertionError("unchanged summary drawn again")
+        saved = views.render_summary
+        views.render_summary = render_summary
+        try:
+            self.assertEqual(client.get(url).status_code, 200)
+            # a miss while another request draws it waits for that one
+            drawn = []
+            views.render_summary = lambda *args: drawn.append(args)
+            get_store().delete(key)
+            queue = get_queue()
+            self.assertTrue(queue._claim(-exp.id))
+            waiter = threading.Thread(target=views._render_summary,
+                                      args=(exp.id, [], key))
+            waiter.start()
+            get_store().put(key, b'png')
+            queue._release(-exp.id)
+            waiter.join()
+        finally:
+            views.render_summary = saved
+        self.assertEqual(drawn, [])
+        get_store().delete(key)
+
+        # a new calculation changes the summary
+        _create_test_dataset(datasets[0], exp.id,
+                             {"grfinal22.dat": '1 2\n2 3\n3 7\n'})
+        response = client.get(reverse(
+            'tardis.apps.hrmc_views.views.view_experiment_summary',
+            kwargs={'experiment_id': exp.id}))
+        self.assertNotEqual(response.context['key'], key)
+        self.assertEqual(client.get(url).status_code, 404)
+        key = response.context['key']
+
+        # a member whose file isn't verified or written yet is listed but
+        # left out of the summary until it is
+        Dataset_File(dataset=datasets[1], filename='grfinal22.dat',
+                     url='path/grfinal22.dat').save()
+        response = client.get(reverse(
+            'tardis.apps.hrmc_views.views.view_experiment_summary',
+            kwargs={'experiment_id': exp.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['rows']), 2)
+        self.assertNotEqual(response.context['key'], key)
+        url = reverse('tardis.apps.hrmc_views.views.view_summary_plot',
+                      kwargs={'experiment_id': exp.id,
+                              'key': response.context['key']})
+        self.assertEqual(client.get(url).status_code, 200)
+
+    def test_instrumentation(self):
+        """
+            The filter, the dataset view and rendering record their stages
+        """
+        from tardis.apps.hrmc_views import instrument
+        user = _create_test_user()
+        license = _create_license()
+        exp = _create_test_experiment(user, license)
+        _create_hrmc_schema(self.HRMCSCHEMA)
+        ds = Dataset(description='happy snaps of plumage')
+        ds.save()
+        ds.experiments.add(exp)
+        with override_settings(HRMC_INSTRUMENT_SINK="memory"):
+            h = hrmc.HRMCOutput('HRMC', self.HRMCSCHEMA, quiet_period=0)
+            ds = _create_test_dataset(ds, exp.id, {
+                "output.dat": 'hello', "grexp.dat": '1 5\n2 3\n3 8\n',
+                "grfinal21.dat": '1 4\n 2 4\n4 6\n'})
+            for df in Dataset_File.objects.filter(dataset=ds):
+                h(sender=Dataset_File, instance=df)
+            Client().get('/dataset/%s' % ds.id)
+            stats = instrument.snapshot()
+        self.assertEquals(stats["counters"]["filter.ignored"], 1)
+        self.assertEquals(stats["counters"]["filter.submitted"], 1)
+        self.assertEquals(stats["counters"]["image.hit"], 1)
+        histograms = stats["histograms"]
+        self.assertEquals(histograms["filter.call"]["count"], 3)
+        for name in ("render.load", "render.draw", "render.encode",
+                     "render.store", "render.save", "render.bytes",
+                     "view.dataset", "view.dataset.plot",
+                     "view.dataset.template", "image.lookup"):
+            self.assertEquals(histograms[name]["count"], 1, name)
+
+    def test_series(self):
+        """
+            Series are served packed, optionally downsampled and gzipped
+        """
+        import gzip
+        from StringIO import StringIO
+        user = _create_test_user()
+        license = _create_license()
+        exp = _create_test_experiment(user, license)
+        ds = Dataset(description='happy snaps of plumage')
+        ds.save()
+        ds = _create_test_dataset(ds, exp.id, {
+            "grexp.dat": '1 2\n2 3\n3 7\n4 1\n5 2\n',
+            "grfinal21.dat": '1 2\n 2 4\n4 9\n'})
+        ds.experiments.add(exp)
+        ds.save()
+        url = reverse('tardis.apps.hrmc_views.views.view_series',
+                      kwargs={'dataset_id': ds.id})
+        client = Client()
+
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        header, series = unpack_series(response.content)
+        self.assertEquals([(name, label) for name, label, r, g in series],
+                          [('grfinal21.dat', 'Calculation 21'),
+                           ('grexp.dat', 'Experiment')])
+        self.assertEquals(list(series[0][3]), [2.0, 4.0, 9.0])
+        self.assertEquals(len(series[1][2]), 5)
+
+        response = client.get(url, {'points': 3},
+                              HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = gzip.GzipFile(fileobj=StringIO(response.content)).read()
+        header, series = unpack_series(data)
+        self.assertEquals(list(series[1][2]), [1.0, 3.0, 5.0])
+
+        etag = response['ETag']
+        response = client.get(url, {'points': 3},
+                              HTTP_ACCEPT_ENCODING='gzip',
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # the plain body is a different entity
+        response = client.get(url, {'points': 3}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(client.get(url, {'points': 'x'}).status_code, 400)
+        self.assertEqual(client.get(url, {'method': 'x'}).status_code, 400)
+
+    def test_zoom(self):
+        """
+            Zooms serve the range asked for, at most two points a pixel
+        """
+        user = _create_test_user()
+        license = _create_license()
+        exp = _create_test_experiment(user, license)
+        ds = Dataset(description='happy snaps of plumage')
+        ds.save()
+        ds = _create_test_dataset(ds, exp.id, {
+            "grexp.dat": "".join("%d %d\n" % (x, x % 7) for x in range(1000)),
+            "grfinal21.dat": '1 2\n 2 4\n4 9\n'})
+        ds.experiments.add(exp)
+        ds.save()
+        url = reverse('tardis.apps.hrmc_views.views.view_zoom',
+                      kwargs={'dataset_id': ds.id})
+        client = Client()
+
+        response = client.get(url, {'r0': 100, 'r1': 200, 'width': 10})
+        self.assertEqual(response.status_code, 200)
+        header, series = unpack_series(response.content)
+        self.assertEquals([name for name, label, r, g in series],
+                          ['grfinal21.dat', 'grexp.dat'])
+        # only the calculation's last point, which the range runs on from
+        self.assertEquals(list(series[0][2]), [4.0])
+        r, g = series[1][2], series[1][3]
+        self.assertEquals(len(r), 20)
+        self.assertEquals(list(r[:2]), [105.0, 105.0])
+        self.assertEquals(list(g[:2]), [0.0, 6.0])
+
+        response = client.get(url, {'r0': 10, 'r1': 13, 'width': 10})
+        header, series = unpack_series(response.content)
+        self.assertEquals(list(series[1][2]), [9.0, 10.0, 11.0, 12.0, 13.0,
+                                               14.0])
+
+        self.assertEqual(client.get(url, {'r0': 1}).status_code, 400)
+        self.assertEqual(client.get(
+            url, {'r0': 2, 'r1': 1, 'width': 10}).status_code, 400)
+        self.assertEqual(client.get(
+            url, {'r0': 1, 'r1': 1, 'width': 10}).status_code, 400)
+        self.assertEqual(client.get(
+            url, {'r0': 'x', 'r1': 2, 'width': 10}).status_code, 400)
+        self.assertEqual(client.get(
+            url, {'r0': 1, 'r1': 2, 'width': 0}).status_code, 400)
+        self.assertEqual(client.get(
+            url, {'r0': 1, 'r1': 2, 'width': 10 ** 6}).status_code, 400)
+
+        # files not verified yet are served without hashing them each time
+        Dataset_File.objects.filter(dataset=ds).update(sha512sum='')
+        response = client.get(url, {'r0': 100, 'r1': 200, 'width': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+        header, series = unpack_series(response.content)
+        self.assertEquals(len(series[1][2]), 20)
@@ -1,4 +1,14 @@
 from django.conf.urls.defaults import patterns
 
 
-urlpatterns = patterns('')
\ No newline at end of file
+urlpatterns = patterns('tardis.apps.hrmc_views.views',
+    (r'^plot/(?P<dataset_id>\d+)/(?P<key>[0-9a-f]{40})\.png$', 'view_plot'),
+    (r'^plot/(?P<dataset_id>\d+)/(?P<key>[0-9a-f]{40})'
+     r'\.(?P<size>thumb|medium|full)\.(?P<format>png|webp)$', 'view_plot'),
+    (r'^series/(?P<dataset_id>\d+)\.bin$', 'view_series'),
+    (r'^series/(?P<dataset_id>\d+)/zoom\.bin$', 'view_zoom'),
+    (r'^experiment/(?P<experiment_id>\d+)/summary/$',
+     'view_experiment_summary'),
+    (r'^experiment/(?P<experiment_id>\d+)/summary/(?P<key>[0-9a-f]{40})'
+     r'\.png$', 'view_summary_plot'),
+)
@@ -19,42 +19,45 @@
 # IN THE SOFTWARE.
 
 
+import datetime
 import logging
-import base64
+import math
 import os
 import re
 
-from django.core.paginator import Paginator, InvalidPage, EmptyPage
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest, Http404
+try:
+    from django.http import StreamingHttpResponse
+except ImportError:
+    # before Django 1.5 an HttpResponse streams an iterator it is given
+    StreamingHttpResponse = HttpResponse
 from django.template import Context
-from django.conf import settings
-from django.core.exceptions import MultipleObjectsReturned
+from django.utils.text import compress_string
+from django.views.decorators.http import condition
 
 from tardis.tardis_portal.auth import decorators as authz
-from tardis.tardis_portal.models import Dataset
+from tardis.tardis_portal.models import Dataset, DatasetParameter
+from tardis.tardis_portal.models import Experiment
 from tardis.tardis_portal.shortcuts import get_experiment_referer
 from tardis.tardis_portal.shortcuts import render_response_index
-from tardis.tardis_portal.models import Schema, DatasetParameterSet
-from tardis.tardis_portal.models import ParameterName, DatasetParameter
-from tardis.tardis_portal.models import Dataset_File
 
-# import and configure matplotlib library
-try:
-    os.environ['HOME'] = settings.MATPLOTLIB_HOME
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as pyplot
-    from matplotlib.pyplot import legend
-    is_matplotlib_imported = True
-except ImportError:
-    is_matplotlib_imported = False
+from tardis.apps.hrmc_views.instrument import incr, timed, timer
+from tardis.apps.hrmc_views.plots import HRMC_DATASET_SCHEMA
+from tardis.apps.hrmc_views.plots import find_plot_parameter
+from tardis.apps.hrmc_views.plots import find_plot_files
+from tardis.apps.hrmc_views.plotstore import get_store, plot_key
+from tardis.apps.hrmc_views.render import is_matplotlib_available
+from tardis.apps.hrmc_views.renderqueue import get_queue, make_job
+from tardis.apps.hrmc_views.renderqueue import render_job
+from tardis.apps.hrmc_views.summary import drawn_members
+from tardis.apps.hrmc_views.summary import experiment_members
+from tardis.apps.hrmc_views.summary import member_metrics
+from tardis.apps.hrmc_views.summary import render_summary, summary_key
 
 logger = logging.getLogger(__name__)
 
-# TODO: contextual view should pass info about DATASET view to its view
-HRMC_DATASET_SCHEMA = "http://rmit.edu.au/schemas/hrmcdataset"
-
 @authz.dataset_access_required
+@timed("view.dataset")
 def view_full_dataset(request, dataset_id):
     """Displays a HRMC Dataset as a single scatter plot of x,y values
     from grfinalXX.dat and gerr.dat files
@@ -70,36 +73,35 @@ def view_full_dataset(request, dataset_id):
     logger.debug("got to hrmc views")
     dataset = Dataset.objects.get(id=dataset_id)
 
-    # FIXME: as single image, can remove this
-    def get_datafiles_page():
-        # pagination was removed by someone in the interface but not here.
-        # need to fix.
-        pgresults = 100
-
-        paginator = Paginator(dataset.dataset_file_set.all(), pgresults)
-
-        try:
-            page = int(request.GET.get('page', '1'))
-        except ValueError:
-            page = 1
-
-        # If page request (9999) is out of range, deliver last page of results.
-
-        try:
-            return paginator.page(page)
-        except (EmptyPage, InvalidPage):
-            return paginator.page(paginator.num_pages)
-
+    # Plots are rendered by the render queue; until the job is done the
+    # page shows a placeholder rather than holding up the request.
     display_images = []
-    image_to_show = get_image_to_show(dataset)
-    if image_to_show:
-        display_images.append(image_to_show)
+    with timer("view.dataset.plot"):
+        image_to_show = get_image_to_show(dataset, render=False)
+        rendering = False
+        if not image_to_show:
+            queue = get_queue()
+            submitted = queue.submit(dataset.id)
+            rendering = queue.is_pending(dataset.id)
+            if submitted and not rendering:
+                # the queue rendered inline
+                image_to_show = get_image_to_show(dataset, render=False)
+        webp = False
+        if image_to_show:
+            display_images.append(image_to_show)
+            store = get_store()
+            # the images themselves are often served from browser caches
+            # without reaching open(), so showing the plot marks it used
+            store.touch(image_to_show.string_value)
+            webp = store.exists(image_to_show.string_value, "thumb", "webp")
+    if rendering:
+        incr("view.dataset.rendering")
 
     c = Context({
         'dataset': dataset,
-        'datafiles': get_datafiles_page(),
         'parametersets': dataset.getParameterSets()
-                                .exclude(schema__hidden=True),
+                                .exclude(schema__hidden=True)
+                                .select_related('schema'),
         'has_download_permissions':
             authz.has_dataset_download_access(request, dataset_id),
         'has_write_permissions':
@@ -109,136 +111,383 @@ def view_full_dataset(request, dataset_id):
         'other_experiments': \
             authz.get_accessible_experiments_for_dataset(request, dataset_id),
         'display_images': display_images,
+        'rendering': rendering,
+        'webp': webp,
+    })
+    # the parameter sets and permissions are looked up as it renders
+    with timer("view.dataset.template"):
+        content = render_response_index(
+            request, 'hrmc_views/view_full_dataset.html', c)
+    return HttpResponse(content)
+
+
+CONTENT_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+# bytes read from a stored image at a time
+CHUNK_SIZE = 64 * 1024
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _byte_range(header, size):
+    """Returns the inclusive (start, end) asked for by a Range header for
+    a file of size bytes, or None to send the whole file when there is no
+    header or it isn't a single valid byte range.  Raises ValueError if the
+    range can't be satisfied, starting past the end of the file.
+    """
+    mat = _RANGE.match((header or "").strip())
+    if not mat or mat.groups() == ("", ""):
+        return None
+    first, last = mat.groups()
+    if not first:
+        # the last bytes of the file
+        if not int(last) or not size:
+            raise ValueError("empty range")
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        # invalid rather than unsatisfiable, so ignored (RFC 7233 3.1)
+        return None
+    if start >= size:
+        raise ValueError("range outside %s bytes" % size)
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+def _read_chunks(f, start, length):
+    try:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+def _file_response(request, f, content_type, etag=None,
+                   cache_control=None):
+    """Returns a response streaming the open file f in chunks, or just the
+    byte range the request's Range header asks for, so the file is never
+    held in memory whole.  A Range is ignored if an If-Range header doesn't
+    match etag.  The response closes f.
+    """
+    size = os.fstat(f.fileno()).st_size
+    if_range = request.META.get('HTTP_IF_RANGE')
+    try:
+        if if_range and if_range.strip('"') != etag:
+            byte_range = None
+        else:
+            byte_range = _byte_range(request.META.get('HTTP_RANGE'), size)
+    except ValueError:
+        f.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = "bytes */%d" % size
+        return response
+    if byte_range is None:
+        start, length, status = 0, size, 200
+    else:
+        start, length, status = (byte_range[0],
+                                 byte_range[1] - byte_range[0] + 1, 206)
+    response = StreamingHttpResponse(_read_chunks(f, start, length),
+                                     content_type=content_type,
+                                     status=status)
+    if byte_range is not None:
+        response['Content-Range'] = "bytes %d-%d/%d" % (byte_range + (size,))
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = "bytes"
+    if cache_control:
+        response['Cache-Control'] = cache_control
+    return response
+
+
+def _plot_etag(request, dataset_id, key, size="full", format="png"):
+    # the key is a hash of the plot's inputs, so is a strong etag
+    return key
+
+
+def _plot_last_modified(request, dataset_id, key, size="full",
+                        format="png"):
+    path = get_store().find(key, size, format)
+    try:
+        mtime = os.path.getmtime(path)
+    except (OSError, TypeError):
+        return None
+    return datetime.datetime.utcfromtimestamp(mtime)
+
+
+def _render_again(dataset_id, key):
+    """Renders the plot of dataset_id back into the store after it was
+    evicted, if its data still gives key, once however many requests ask
+    for it at the same time
+    """
+    def render():
+        if get_store().exists(key):
+            # rendered by whoever held the claim before
+            return
+        grexp_file, grfinal_files = find_plot_files(dataset_id)
+        if not (grexp_file and grfinal_files):
+            return
+        job = make_job(dataset_id, grexp_file, grfinal_files)
+        if job is None or job[1] != key:
+            logger.debug("data of %s changed since plot %s" % (dataset_id,
+                                                                key))
+            return
+        logger.debug("rendering evicted plot %s" % key)
+        error = render_job(job)[2]
+        if error:
+            logger.error("render of %s failed\n%s" % (dataset_id, error))
+    get_queue().once(int(dataset_id), render)
+
+
+@authz.dataset_access_required
+@condition(etag_func=_plot_etag, last_modified_func=_plot_last_modified)
+def view_plot(request, dataset_id, key, size="full", format="png"):
+    """Serves one size of the stored plot of a HRMC dataset, streamed and
+    with support for Range requests.  A plot evicted from the store is
+    rendered again.
+    """
+    if not DatasetParameter.objects.filter(
+            parameterset__dataset__id=dataset_id,
+            parameterset__schema__namespace=HRMC_DATASET_SCHEMA,
+            name__name="plot", string_value=key).exists():
+        raise Http404
+    store = get_store()
+    try:
+        f = store.open(key, size, format)
+    except IOError:
+        _render_again(dataset_id, key)
+        try:
+            f = store.open(key, size, format)
+        except IOError:
+            raise Http404
+    # plots are never changed in place, a new plot gets a new key
+    return _file_response(request, f, CONTENT_TYPES[format], etag=key,
+                          cache_control='private, max-age=31536000')
+
+
+@authz.experiment_access_required
+def view_experiment_summary(request, experiment_id):
+    """Displays every HRMC dataset of an experiment in one summary plot,
+    with the datasets listed best fit first
+    """
+    experiment = Experiment.objects.get(id=experiment_id)
+    members = experiment_members(experiment_id)
+    metrics = member_metrics(members)
+    rows = [(ds, metrics[ds.id]) for ds, grexp, grfinals in members]
+    rows.sort(key=lambda row: (row[1].get('rfactor') is None,
+                               row[1].get('rfactor'), row[0].id))
+    drawn = drawn_members(members)
+    key = None
+    if drawn and is_matplotlib_available:
+        key = summary_key(drawn)
+    c = Context({
+        'experiment': experiment,
+        'rows': [(ds, m.get('rfactor'), m.get('chisquared'), m.get('rms'))
+                 for ds, m in rows],
+        'key': key,
     })
     return HttpResponse(render_response_index(
-        request, 'hrmc_views/view_full_dataset.html', c))
+        request, 'hrmc_views/experiment_summary.html', c))
+
 
+def _summary_etag(request, experiment_id, key):
+    return key
 
-def get_image_to_show(dataset):
 
+def _render_summary(experiment_id, members, key):
+    """Draws the summary plot of members into the store under key, once
+    however many requests ask for it at the same time
+    """
+    def render():
+        if get_store().exists(key):
+            return
+        try:
+            png = render_summary(members, member_metrics(members))
+        except (IOError, OSError, ValueError):
+            logger.exception("drawing summary of %s failed" % experiment_id)
+            return
+        get_store().put(key, png)
+    # claims are by dataset id, which are all positive
+    get_queue().once(-int(experiment_id), render)
+
+
+@authz.experiment_access_required
+@condition(etag_func=_summary_etag)
+def view_summary_plot(request, experiment_id, key):
+    """Serves the summary plot of an experiment, drawing it first if its
+    members' data has changed since it was last drawn
+    """
+    members = drawn_members(experiment_members(experiment_id))
+    if not members or summary_key(members) != key:
+        raise Http404
+    store = get_store()
     try:
-        sch = Schema.objects.get(namespace__exact=HRMC_DATASET_SCHEMA)
-    except Schema.DoesNotExist:
-        logger.debug("no hrmc schema")
+        f = store.open(key)
+    except IOError:
+        _render_summary(experiment_id, members, key)
+        try:
+            f = store.open(key)
+        except IOError:
+            raise Http404
+    return _file_response(request, f, "image/png", etag=key,
+                          cache_control='private, max-age=31536000')
+
+
+def _series_options(request):
+    """Returns the (points, method) asked for, raising ValueError if bad"""
+    points = request.GET.get('points')
+    if points is not None:
+        points = int(points)
+        if points < 3:
+            raise ValueError("points must be at least 3")
+    method = request.GET.get('method', 'lttb')
+    if method not in ('lttb', 'minmax'):
+        raise ValueError("unknown method %s" % method)
+    return points, method
+
+
+def _data_etag(datafiles):
+    """Returns the plot key of datafiles from their stored sha512sums, or
+    None if any hasn't been verified yet rather than hash it per request
+    """
+    checksums = [df.sha512sum for df in datafiles]
+    if not all(checksums):
         return None
-    except MultipleObjectsReturned:
-        logger.error("multiple hrmc schemas returned")
+    return plot_key(datafiles, checksums)
+
+
+def _accepts_gzip(request):
+    return 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+
+def _dataset_etag(dataset_id, suffix):
+    """Returns the ETag of a response made from the data files of
+    dataset_id, their plot key followed by suffix, or None if they aren't
+    all there and verified
+    """
+    grexp_file, grfinal_files = find_plot_files(dataset_id)
+    if not (grexp_file and grfinal_files):
+        return None
+    key = _data_etag([grexp_file] + grfinal_files)
+    if key is None:
+        return None
+    return "%s-%s" % (key, suffix)
+
+
+def _packed_response(request, data):
+    """Returns packed series data as a response, gzipped if the client
+    accepts it
+    """
+    response = HttpResponse(content_type="application/octet-stream")
+    if _accepts_gzip(request):
+        data = compress_string(data)
+        response['Content-Encoding'] = 'gzip'
+    response.content = data
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+def _series_etag(request, dataset_id):
+    try:
+        points, method = _series_options(request)
+    except ValueError:
         return None
-    #FIXME: possible that more than once dataset can appear, so pick only one.
+    # the gzipped body is a different entity from the plain one
+    return _dataset_etag(dataset_id, "%s-%s%s" % (
+        points, method, _accepts_gzip(request) and "-gz" or ""))
+
+
+@authz.dataset_access_required
+@condition(etag_func=_series_etag)
+def view_series(request, dataset_id):
+    """Serves the g(r) series of a HRMC dataset in the packed form of
+    :mod:`series`, for plotting in the browser.
+
+    ``points`` downsamples each series to about that many values with
+    ``method``, "lttb" (default) or "minmax".  The response is gzipped if
+    the client accepts it.
+    """
+    # imported here so numpy is only loaded by processes serving series
+    from tardis.apps.hrmc_views.series import dataset_series, pack_series
     try:
-        ps = DatasetParameterSet.objects.get(schema=sch, dataset=dataset)
-    except DatasetParameterSet.DoesNotExist:
-        logger.debug("datset parameterset not found")
+        points, method = _series_options(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    grexp_file, grfinal_files = find_plot_files(dataset_id)
+    if not (grexp_file and grfinal_files):
+        raise Http404
+    data = pack_series(dataset_series(grexp_file, grfinal_files),
+                       points, method)
+    return _packed_response(request, data)
+
+
+# widest zoom served, bounding the cost of a request
+MAX_ZOOM_WIDTH = 4096
+
+
+def _zoom_options(request):
+    """Returns the (r0, r1, width) asked for, raising ValueError if bad"""
+    r0 = float(request.GET['r0'])
+    r1 = float(request.GET['r1'])
+    width = int(request.GET.get('width', 1000))
+    if math.isinf(r0) or math.isinf(r1):
+        raise ValueError("r0 and r1 must be finite")
+    if not r1 > r0:
+        raise ValueError("r1 must be greater than r0")
+    if not 1 <= width <= MAX_ZOOM_WIDTH:
+        raise ValueError("width must be 1 to %s" % MAX_ZOOM_WIDTH)
+    return r0, r1, width
+
+
+def _zoom_etag(request, dataset_id):
+    try:
+        r0, r1, width = _zoom_options(request)
+    except (KeyError, ValueError):
         return None
-    except MultipleObjectsReturned:
-        logger.error("multiple dataset paramter sets returned")
-        # NB: If admin tool added additional param set,
-        # we know that all data will be the same for this schema
-        # so can safely delete any extras we find.
-        pslist = [x.id for x in DatasetParameterSet.objects.filter(schema=sch,
-            dataset=dataset)]
-        logger.debug("pslist=%s" % pslist)
-        DatasetParameterSet.objects.filter(id__in=pslist[1:]).delete()
-        ps = DatasetParameterSet.objects.get(id=pslist[0])
-
-
-    logger.debug("found ps=%s" % ps)
-    for param in DatasetParameter.objects.filter(parameterset=ps):
-        logger.debug("param=%s" % param)
-        logger.debug("param.name=%s" % param.name)
-
-        if "plot" in param.name.name:
-            logger.debug("found existing image")
-            return param
+    return _dataset_etag(dataset_id, "%r-%r-%s%s" % (
+        r0, r1, width, _accepts_gzip(request) and "-gz" or ""))
+
 
+@authz.dataset_access_required
+@condition(etag_func=_zoom_etag)
+def view_zoom(request, dataset_id):
+    """Serves the g(r) series of a HRMC dataset between ``r0`` and ``r1``
+    reduced for drawing ``width`` pixels wide, in the packed form of
+    :mod:`series`.  Read from the :mod:`envelope` pyramids of the series,
+    so costs the same however long they are.
+    """
+    from tardis.apps.hrmc_views.series import zoom_series, pack_series
+    try:
+        r0, r1, width = _zoom_options(request)
+    except KeyError as e:
+        return HttpResponseBadRequest("missing %s" % e)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    grexp_file, grfinal_files = find_plot_files(dataset_id)
+    if not (grexp_file and grfinal_files):
+        raise Http404
+    data = pack_series(zoom_series(grexp_file, grfinal_files, r0, r1, width))
+    return _packed_response(request, data)
+
+
+def get_image_to_show(dataset, render=True):
+    """Returns the plot parameter of dataset, rendering it in this thread
+    if it doesn't exist yet and render is True.  If another worker is
+    already rendering it, waits for that render instead of starting
+    another.
+    """
+    with timer("image.lookup"):
+        display_image = find_plot_parameter(dataset)
+    incr(display_image and "image.hit" or "image.miss")
+    if display_image or not render:
+        return display_image
     logger.debug("building plots")
-    display_image = None
-    grfinal_file = None
-    grexp_file = None
-    for df in Dataset_File.objects.filter(dataset=dataset):
-        logger.debug("testing %s" % df.filename)
-        if "grexp.dat" in df.filename:
-            grexp_file = df
-        if df.filename.startswith("grfinal"):
-            grfinal_file = df
-    if grexp_file and grfinal_file and is_matplotlib_imported:
-        logger.debug("found both")
-        fp = grexp_file.get_absolute_filepath()
-        grexp_buff = []
-        with open(fp) as f:
-            for d in f.read():
-                grexp_buff.append(d)
-
-        fp = grfinal_file.get_absolute_filepath()
-        grfinal_buff = []
-        with open(fp) as f:
-            for d in f.read():
-                grfinal_buff.append(d)
-
-        mat = re.compile("grfinal(\d+)\.dat").match(grfinal_file.filename)
-        if mat:
-            grlabel = "Calculation %s" % mat.group(1)
-        else:
-            grlabel = grfinal_file.filename
-
-        xs = []
-        ys = []
-        for l in ''.join(grfinal_buff).split("\n"):
-            #logger.debug("l=%s" % l)
-            if l:
-                x, y = l.split()
-                xs.append(float(x))
-                ys.append(float(y))
-        matplotlib.pyplot.plot(xs, ys, color="blue", markeredgecolor = 'blue', marker="D", label=str(grlabel))
-
-        xs = []
-        ys = []
-        for l in ''.join(grexp_buff).split("\n"):
-            #logger.debug("l=%s" % l)
-            if l:
-                x, y = l.split()
-                xs.append(float(x))
-                ys.append(float(y))
-        matplotlib.pyplot.plot(xs, ys, color="red", markeredgecolor = 'red', marker="o", label="Experiment")
-
-        import tempfile
-        pfile = tempfile.mktemp()
-        logger.debug("pfile=%s" % pfile)
-
-        pyplot.xlabel("r (Angstroms)")
-        pyplot.ylabel("g(r)")
-        pyplot.grid(True)
-        #legend(bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0.)
-        legend()
-        pyplot.xlim(xmin=0)
-
-        fig = matplotlib.pyplot.gcf()
-        fig.set_size_inches(15.5, 13.5)
-        matplotlib.pyplot.savefig("%s.png" % pfile, dpi=100)
-
-        with open("%s.png" % pfile) as pf:
-            read = pf.read()
-            encoded = base64.b64encode(read)
-            matplotlib.pyplot.close()
-        try:
-            pn = ParameterName.objects.get(schema=sch, name="plot")
-        except DatasetParameterSet.DoesNotExist:
-            logger.error("schema is missing plot parameter")
-            return None
-        except MultipleObjectsReturned:
-            logger.error("schema is multiple plot parameters")
-            return None
-
-        logger.debug("ready to save")
-
-        dfp = DatasetParameter(parameterset=ps,
-                                        name=pn)
-        dfp.string_value = encoded
-        dfp.save()
-        display_image = dfp
-    else:
-        logger.debug("one or more files unavailable")
-        return None
+    with timer("image.render"):
+        get_queue().render_now(dataset.id)
+    display_image = find_plot_parameter(dataset)
     logger.debug("made display_image  %s" % display_image)
     return display_image
-